@@ -1,3 +1,9 @@
 from django.contrib import admin
+from .models import Blob
 
-# Register your models here.
+@admin.register(Blob)
+class BlobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'size', 'ref_count', 'created_at', 'updated_at')
+    list_filter = ('ref_count',)
+    search_fields = ('name', 'sha256')
+    readonly_fields = ('name', 'sha256', 'size', 'created_at', 'updated_at')
@@ -0,0 +1,194 @@
+"""
+Query-count and timing benchmarks for API endpoints.
+
+Apps register benchmarks in a ``benchmarks`` module with ``@benchmark``. A
+benchmark takes a row count, creates that many rows and returns the
+operation to measure. ``manage.py benchmark`` runs each one inside a
+transaction that is rolled back afterwards, so it leaves no data behind.
+
+Serialization benchmarks render rows that were loaded during setup, so they
+measure CPU time only. ``@serialization_benchmark`` registers each one twice,
+rendering with the compiled serializers (see ``core.serialization``) and, as
+``<name>.drf``, with DRF's own ``to_representation``. Rendering benchmarks
+likewise turn serialized data into JSON bytes with ``ORJSONRenderer`` and,
+as ``<name>.stdlib``, with DRF's ``JSONRenderer``.
+"""
+import datetime
+import time
+import tracemalloc
+import uuid
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory
+
+from .renderers import ORJSONRenderer
+from .serialization import uncompiled
+
+# {name: setup(rows) -> operation} for every registered benchmark
+BENCHMARKS = {}
+
+
+def benchmark(name, max_queries=None, throughput=False):
+    """
+    Register ``setup(rows)`` as the benchmark ``name``.
+
+    ``max_queries`` is the query budget of the operation at any row count;
+    ``manage.py benchmark`` flags runs that exceed it. ``throughput``
+    benchmarks handle all of their rows in the operation, and are reported
+    in rows per second as well.
+    """
+    def register(setup):
+        setup.max_queries = max_queries
+        setup.throughput = throughput
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def serialization_benchmark(name):
+    """
+    Register ``setup(rows)``, which returns an operation rendering ``rows``
+    rows, as the benchmarks ``name`` and ``<name>.drf``.
+    """
+    def register(setup):
+        def drf_setup(rows):
+            operation = setup(rows)
+
+            def drf_operation():
+                with uncompiled():
+                    return operation()
+
+            return drf_operation
+
+        benchmark(f'{name}.drf', max_queries=0, throughput=True)(drf_setup)
+        return benchmark(name, max_queries=0, throughput=True)(setup)
+    return register
+
+
+def measure(setup, rows, repeat=3):
+    """Return ``(queries, seconds)`` for the fastest of ``repeat`` runs."""
+    with transaction.atomic():
+        operation = setup(rows)
+        queries, best = 0, None
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                operation()
+                elapsed = time.perf_counter() - start
+            queries = len(captured)
+            best = elapsed if best is None else min(best, elapsed)
+        transaction.set_rollback(True)
+    return queries, best
+
+
+def measure_allocations(setup, rows):
+    """Return the peak bytes allocated while running the operation once."""
+    with transaction.atomic():
+        operation = setup(rows)
+        # Warm up lazily built state, e.g. compiled serializers
+        operation()
+        tracemalloc.start()
+        try:
+            operation()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        transaction.set_rollback(True)
+    return peak
+
+
+def create_clinic_user():
+    """A throwaway clinic and clinician for benchmark data."""
+    from users.models import Clinic, User
+
+    clinic = Clinic.objects.create(
+        name='Benchmark clinic', address='Benchmark', phone='0', email='benchmark@example.com'
+    )
+    user = User.objects.create_user(
+        email=f'benchmark-{uuid.uuid4().hex}@example.com', password=None,
+        first_name='Benchmark', last_name='Clinician', clinic=clinic
+    )
+    return clinic, user
+
+
+def create_patient():
+    """A throwaway clinic, clinician and patient; return the patient and clinician."""
+    from patients.models import Patient
+
+    clinic, user = create_clinic_user()
+    patient = Patient.objects.create(
+        first_name='Benchmark', last_name='Patient',
+        date_of_birth=datetime.date(1980, 1, 1), clinic=clinic
+    )
+    return patient, user
+
+
+def create_scan_metadata(scan, foot, **overrides):
+    """Metadata of an empty binary STL for ``scan``'s ``foot``; ``overrides`` set any other field."""
+    from prescriptions.models import ScanMetadata
+
+    fields = dict(
+        file_format='stl_binary', file_size=84, sha256='0' * 64, triangle_count=0, vertex_count=0,
+        bbox_min_x=0, bbox_min_y=0, bbox_min_z=0, bbox_max_x=0, bbox_max_y=0, bbox_max_z=0,
+        surface_area=0, foot_length=0, foot_width=0,
+    )
+    fields.update(overrides)
+    return ScanMetadata.objects.create(scan=scan, foot=foot, **fields)
+
+
+def rendering_benchmark(name):
+    """
+    Register ``setup(rows)``, which returns serialized data of ``rows``
+    rows, as the benchmarks ``name`` and ``<name>.stdlib``.
+    """
+    def register(setup):
+        def operation_setup(renderer_class):
+            def rendering_setup(rows):
+                data, renderer = setup(rows), renderer_class()
+                return lambda: renderer.render(data, 'application/json')
+            return rendering_setup
+
+        benchmark(f'{name}.stdlib', max_queries=0, throughput=True)(operation_setup(JSONRenderer))
+        benchmark(name, max_queries=0, throughput=True)(operation_setup(ORJSONRenderer))
+        return setup
+    return register
+
+
+def serialize(serializer_class, data, many=False):
+    """An operation that renders ``data`` with ``serializer_class`` in the context of a request."""
+    request = APIRequestFactory().get('/')
+
+    def operation():
+        return serializer_class(data, many=many, context={'request': request}).data
+
+    return operation
+
+
+def api_get(user, url):
+    """An operation that GETs ``url`` as ``user`` and checks it succeeded."""
+    client = APIClient()
+    client.force_authenticate(user)
+
+    def operation():
+        response = client.get(url)
+        if response.status_code != 200:
+            raise AssertionError(f"GET {url} returned {response.status_code}")
+        return response
+
+    return operation
+
+
+def api_post(user, url, data=None, status_code=201):
+    """An operation that POSTs ``data`` as JSON to ``url`` as ``user`` and checks the status."""
+    client = APIClient()
+    client.force_authenticate(user)
+
+    def operation():
+        response = client.post(url, data or {}, format='json')
+        if response.status_code != status_code:
+            raise AssertionError(f"POST {url} returned {response.status_code}")
+        return response
+
+    return operation
@@ -0,0 +1,149 @@
+"""
+Reference counting for files in ``core.storage.BlobStorage``.
+
+Models register the file fields that point at blobs with
+``track_blob_references``. Saving a row that points a field at a new blob
+takes a reference; changing the field or deleting the row releases the old
+one. Queryset and cascade deletes send ``post_delete`` for every row, so
+they are covered too. Rows loaded with deferred file fields look up the
+saved names of those fields when they are saved or deleted.
+``QuerySet.update()`` bypasses signals and must not be used on tracked
+fields. ``bulk_create()`` bypasses them as well; pass the file names of the
+new rows to ``acquire_all``.
+"""
+from collections import Counter
+
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete, pre_save
+
+from .storage import BLOB_ROOT, blob_storage, is_blob_name
+
+# {model: (field_name, ...)} for every model passed to track_blob_references
+TRACKED_FIELDS = {}
+
+
+def acquire(name):
+    """Take a reference on the blob stored under ``name``."""
+    from .models import Blob
+
+    if not is_blob_name(name):
+        return
+    updated = Blob.objects.filter(name=name).update(ref_count=F('ref_count') + 1)
+    if not updated:
+        sha256 = name.rsplit('/', 1)[-1].split('.', 1)[0]
+        blob, created = Blob.objects.get_or_create(
+            name=name,
+            defaults={'sha256': sha256, 'size': blob_storage.size(name), 'ref_count': 1}
+        )
+        if not created:
+            Blob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+
+
+def acquire_all(names):
+    """Take a reference per occurrence in ``names``, in one query for blobs that have a row."""
+    from .models import Blob
+
+    counts = Counter(name for name in names if is_blob_name(name))
+    if not counts:
+        return
+    increments = Case(
+        *[When(name=name, then=Value(count)) for name, count in counts.items()],
+        output_field=IntegerField()
+    )
+    updated = Blob.objects.filter(name__in=counts).update(ref_count=F('ref_count') + increments)
+    if updated < len(counts):
+        known = set(Blob.objects.filter(name__in=counts).values_list('name', flat=True))
+        for name, count in counts.items():
+            if name not in known:
+                for _ in range(count):
+                    acquire(name)
+
+
+def release(name):
+    """Drop a reference on the blob stored under ``name``."""
+    from .models import Blob
+
+    if not is_blob_name(name):
+        return
+    Blob.objects.filter(name=name, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+
+
+def _loaded_names(instance, fields):
+    """The file names of those ``fields`` that are loaded on ``instance``."""
+    # Read from __dict__, as getattr() would fetch deferred fields one query
+    # at a time, and building the deferred instance would recurse back here
+    names = {}
+    for field in fields:
+        if field in instance.__dict__:
+            value = instance.__dict__[field]
+            names[field] = getattr(value, 'name', value) or ''
+    return names
+
+
+def _remember_stored_names(instance, fields):
+    """Fetch the saved names of ``fields`` that were deferred when ``instance`` was loaded."""
+    remembered = getattr(instance, '_blob_names', {})
+    missing = [field for field in fields if field not in remembered]
+    if not missing or instance._state.adding:
+        return
+    row = type(instance)._base_manager.filter(pk=instance.pk).values(*missing).first() or {}
+    instance._blob_names = {**remembered, **{field: row.get(field) or '' for field in missing}}
+
+
+def stored_names(instance):
+    """
+    The file names of the tracked fields of ``instance`` as last loaded or
+    saved, by field; deferred fields are missing until the row is saved.
+    """
+    return getattr(instance, '_blob_names', {})
+
+
+def track_blob_references(model, *fields):
+    """Keep ``Blob.ref_count`` in sync with the given file fields of ``model``."""
+    TRACKED_FIELDS[model] = fields
+
+    def remember(sender, instance, **kwargs):
+        instance._blob_names = _loaded_names(instance, fields)
+
+    def saving(sender, instance, raw=False, **kwargs):
+        if not raw:
+            _remember_stored_names(instance, list(_loaded_names(instance, fields)))
+
+    def saved(sender, instance, created=False, raw=False, **kwargs):
+        if raw:
+            return
+        previous = stored_names(instance)
+        # Fields that are still deferred were not saved
+        current = _loaded_names(instance, fields)
+        for field, name in current.items():
+            if field not in previous and not created:
+                # Loaded from the database by the save itself, so unchanged
+                continue
+            if name != previous.get(field, ''):
+                acquire(name)
+                release(previous.get(field, ''))
+        instance._blob_names = {**previous, **current}
+
+    def deleting(sender, instance, **kwargs):
+        _remember_stored_names(instance, fields)
+
+    def deleted(sender, instance, **kwargs):
+        for name in stored_names(instance).values():
+            release(name)
+
+    dispatch_uid = f'blob-references-{model._meta.label_lower}'
+    post_init.connect(remember, sender=model, weak=False, dispatch_uid=dispatch_uid)
+    pre_save.connect(saving, sender=model, weak=False, dispatch_uid=dispatch_uid)
+    post_save.connect(saved, sender=model, weak=False, dispatch_uid=dispatch_uid)
+    pre_delete.connect(deleting, sender=model, weak=False, dispatch_uid=dispatch_uid)
+    post_delete.connect(deleted, sender=model, weak=False, dispatch_uid=dispatch_uid)
+
+
+def count_references():
+    """Count the references to each blob by scanning every tracked field."""
+    counts = Counter()
+    for model, fields in TRACKED_FIELDS.items():
+        for field in fields:
+            names = model._default_manager.filter(**{f'{field}__startswith': f'{BLOB_ROOT}/'})
+            counts.update(names.values_list(field, flat=True))
+    return counts
@@ -0,0 +1,175 @@
+"""
+Per-clinic caching of API list responses.
+
+List endpoints over a clinic's data mix in ``ClinicCachedListMixin``. Their
+responses are cached under keys namespaced by the clinic and by the
+clinic's generation, a counter in the cache that is bumped whenever the
+clinic's data changes. A bump orphans all of the clinic's cached responses
+at once; the orphans expire after ``CLINIC_CACHE_TIMEOUT`` seconds.
+
+Models register with ``track_clinic_changes``, which bumps the clinic of
+every row that is saved or deleted (and the clinic a row was loaded with,
+when it moves). ``QuerySet.update()`` and ``bulk_create()`` bypass signals;
+call ``invalidate_clinic_cache`` after using them. Data shown to every
+clinic, such as the lookup tables, calls ``invalidate_all_clinic_caches``.
+
+Responses for staff, who see every clinic, are not cached.
+"""
+import hashlib
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_GENERATION_KEY = 'clinic-cache:generation'
+
+
+def _generation_key(clinic_id):
+    return f'clinic-cache:{clinic_id}:generation'
+
+
+def _new_generation():
+    # A lost counter restarts above every value it could have had, so
+    # responses cached under the old counter are never served again
+    return time.time_ns()
+
+
+def _bump(key):
+    try:
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Not set yet, or evicted
+            cache.add(key, _new_generation(), None)
+    except Exception as e:
+        logger.error(f"Error bumping cache generation {key}: {str(e)}")
+
+
+def _bump_now_and_on_commit(key):
+    # The second bump drops responses other requests cached from the
+    # committed data while this transaction was still open
+    _bump(key)
+    transaction.on_commit(lambda: _bump(key))
+
+
+def invalidate_clinic_cache(clinic_id):
+    """Drop every cached response of the clinic ``clinic_id``."""
+    if clinic_id is not None:
+        _bump_now_and_on_commit(_generation_key(clinic_id))
+
+
+def invalidate_all_clinic_caches():
+    """Drop every clinic's cached responses, e.g. after shared data changed."""
+    _bump_now_and_on_commit(GLOBAL_GENERATION_KEY)
+
+
+def clinic_generations(clinic_id):
+    """The global and the clinic's generation, in one cache round trip."""
+    keys = [GLOBAL_GENERATION_KEY, _generation_key(clinic_id)]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            cache.add(key, _new_generation(), None)
+            generations[key] = cache.get(key)
+    return generations[keys[0]], generations[keys[1]]
+
+
+def clinic_cache_key(request, namespace):
+    """The cache key of ``request``'s response, or ``None`` if it must not be cached."""
+    clinic = request.tenant
+    if request.user.is_staff or not clinic:
+        return None
+    global_generation, generation = clinic_generations(clinic.pk)
+    # Paginated responses hold absolute links, so the host is part of the key
+    path = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    return f'clinic-cache:{clinic.pk}:{global_generation}:{generation}:{namespace}:{path}'
+
+
+class ClinicCachedListMixin:
+    """
+    Serve ``list`` responses from the clinic's response cache.
+
+    The cache key covers the full path, so every page, search and ordering
+    is cached separately; ``cache_namespace`` defaults to the router basename.
+    """
+    cache_namespace = None
+
+    def list(self, request, *args, **kwargs):
+        try:
+            key = clinic_cache_key(request, self.cache_namespace or self.basename)
+            data = cache.get(key) if key else None
+        except Exception as e:
+            logger.error(f"Error reading the response cache: {str(e)}")
+            key = data = None
+        if data is not None:
+            return Response(data)
+
+        response = super().list(request, *args, **kwargs)
+        if key and response.status_code == 200:
+            try:
+                cache.set(key, response.data, settings.CLINIC_CACHE_TIMEOUT)
+            except Exception as e:
+                logger.error(f"Error writing the response cache: {str(e)}")
+        return response
+
+
+def _clinic_lookup(model):
+    return getattr(model._default_manager.get_queryset(), 'clinic_lookup', 'clinic')
+
+
+def clinic_id_of(instance, clinic_lookup):
+    """The id of the clinic ``instance`` belongs to through ``clinic_lookup``."""
+    if '__' not in clinic_lookup:
+        return getattr(instance, f'{clinic_lookup}_id')
+    # e.g. 'patient__clinic': ask the patient row
+    field_name, rest = clinic_lookup.split('__', 1)
+    related_model = instance._meta.get_field(field_name).related_model
+    return (
+        related_model._default_manager
+        .filter(pk=getattr(instance, f'{field_name}_id'))
+        .values_list(f'{rest}_id', flat=True)
+        .first()
+    )
+
+
+def track_clinic_changes(model, clinic_lookup=None):
+    """
+    Invalidate the clinic's cached responses when a row of ``model`` changes.
+
+    ``clinic_lookup`` leads from the model to its clinic and defaults to the
+    one of the model's ``ClinicScopedQuerySet``.
+    """
+    clinic_lookup = clinic_lookup or _clinic_lookup(model)
+    direct = '__' not in clinic_lookup
+
+    def remember(sender, instance, **kwargs):
+        # Read from __dict__ so a deferred clinic field is not loaded for this
+        instance._cached_clinic_id = instance.__dict__.get(f'{clinic_lookup}_id')
+
+    def changed(sender, instance, raw=False, **kwargs):
+        if raw:
+            return
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and set(update_fields) <= {'last_login'}:
+            # Logins do not change anything a list shows
+            return
+        clinic_id = clinic_id_of(instance, clinic_lookup)
+        invalidate_clinic_cache(clinic_id)
+        previous = getattr(instance, '_cached_clinic_id', None)
+        if previous != clinic_id:
+            invalidate_clinic_cache(previous)
+        if direct:
+            instance._cached_clinic_id = clinic_id
+
+    dispatch_uid = f'clinic-cache-{model._meta.label_lower}'
+    if direct:
+        # Free for a direct foreign key; other lookups would cost a query per row loaded
+        post_init.connect(remember, sender=model, weak=False, dispatch_uid=dispatch_uid)
+    post_save.connect(changed, sender=model, weak=False, dispatch_uid=dispatch_uid)
+    post_delete.connect(changed, sender=model, weak=False, dispatch_uid=dispatch_uid)
@@ -0,0 +1,102 @@
+"""
+Conditional requests on API views, with ETags derived from row versions.
+
+The version of a row is its primary key and ``updated_at``; a group of rows,
+such as a prescription's scans with their metadata, has the combined version
+of its rows, so adding or deleting one changes it as well. The tags are
+weak: they identify the data, not the bytes of one rendering of it, and they
+are compared weakly for ``If-Match`` too.
+
+Reads send the tag back and answer a matching ``If-None-Match`` with
+``304 Not Modified``; writes check ``If-Match`` against the current rows
+before doing any work. The check and the write run in one transaction,
+with the rows locked by ``lock_rows`` before they are read, so no other
+write can land between them::
+
+    with transaction.atomic():
+        lock_rows(Prescription.objects.filter(pk=prescription.pk))
+        etag = rows_etag(*prescription.attachments.all())
+        if precondition_failed(request, etag):
+            return precondition_failed_response(etag)
+        ...  # the write
+
+``atomic_if_match`` runs a whole view method in a transaction for requests
+carrying ``If-Match``, for views whose writes are spread over the method.
+"""
+import functools
+import hashlib
+
+from django.db import transaction
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def rows_etag(*rows):
+    """The weak ``ETag`` of ``rows``; ``None`` entries stand for missing rows."""
+    digest = hashlib.md5()
+    for row in rows:
+        if row is None:
+            digest.update(b'-;')
+            continue
+        updated_at = getattr(row, 'updated_at', None)
+        version = updated_at.isoformat() if updated_at else ''
+        digest.update(f'{row._meta.label_lower}:{row.pk}:{version};'.encode())
+    return 'W/' + quote_etag(digest.hexdigest())
+
+
+def _opaque_tag(etag):
+    return etag[2:] if etag.startswith('W/') else etag
+
+
+def etag_matches(etag, header):
+    """Whether ``etag`` is listed in the ``If-Match``/``If-None-Match`` value ``header``."""
+    tags = [_opaque_tag(tag) for tag in parse_etags(header)]
+    return '*' in tags or _opaque_tag(etag) in tags
+
+
+def not_modified(request, etag):
+    """Whether the client already has the representation tagged ``etag``."""
+    header = request.headers.get('If-None-Match')
+    return bool(header) and request.method in ('GET', 'HEAD') and etag_matches(etag, header)
+
+
+def precondition_failed(request, etag):
+    """Whether the client wrote against another version than the one tagged ``etag``."""
+    header = request.headers.get('If-Match')
+    return bool(header) and not etag_matches(etag, header)
+
+
+def lock_rows(queryset):
+    """Lock the rows of ``queryset`` until the current transaction ends."""
+    list(queryset.select_for_update().values_list('pk', flat=True))
+
+
+def atomic_if_match(view):
+    """Run the view method in one transaction for writes that carry ``If-Match``."""
+    @functools.wraps(view)
+    def wrapper(self, request, *args, **kwargs):
+        if 'If-Match' not in request.headers or request.method in ('GET', 'HEAD'):
+            return view(self, request, *args, **kwargs)
+        with transaction.atomic():
+            return view(self, request, *args, **kwargs)
+    return wrapper
+
+
+def with_etag(response, etag):
+    """Tag ``response`` and make clients revalidate it before reuse."""
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def not_modified_response(etag):
+    return with_etag(Response(status=status.HTTP_304_NOT_MODIFIED), etag)
+
+
+def precondition_failed_response(etag):
+    return with_etag(Response(
+        {"error": "The resource has been changed since it was fetched. Reload it and try again."},
+        status=status.HTTP_412_PRECONDITION_FAILED
+    ), etag)
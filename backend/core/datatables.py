@@ -0,0 +1,121 @@
+"""
+Server-side processing for DataTables (https://datatables.net/manual/server-side).
+
+A DataTables table with ``serverSide: true`` sends ``draw``, ``start``,
+``length``, ``order[i][column]``/``order[i][dir]``, ``columns[i][data]`` and
+``search[value]`` with every request. Views opt in with the filter backends
+and pagination class below (or ``core.pagination.ListPagination``), so each
+request turns into one filtered ``COUNT``, an ``ORDER BY`` and a
+``LIMIT``/``OFFSET`` page::
+
+    filter_backends = [DataTablesSearchFilter, DataTablesOrderingFilter]
+    pagination_class = DataTablesPagination
+    search_fields = ['status', 'notes']
+    datatables_columns = {'id': 'id', 'created_at': 'created_at'}
+
+``datatables_columns`` maps the ``data`` name of each sortable column to the
+field or annotation to order by; other columns are not sortable.
+"""
+from collections import OrderedDict
+
+from rest_framework.filters import BaseFilterBackend, SearchFilter
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+
+
+def is_datatables_request(request):
+    return 'draw' in request.query_params
+
+
+def _int_param(request, name, default):
+    try:
+        return int(request.query_params[name])
+    except (KeyError, ValueError):
+        return default
+
+
+class DataTablesSearchFilter(SearchFilter):
+    """Filter by the table's search box against the view's ``search_fields``."""
+    search_param = 'search[value]'
+
+    def filter_queryset(self, request, queryset, view):
+        if not is_datatables_request(request):
+            return queryset
+        return super().filter_queryset(request, queryset, view)
+
+
+class DataTablesOrderingFilter(BaseFilterBackend):
+    """Order by the table's sorted columns, with the primary key as a tie-breaker."""
+
+    def get_ordering(self, request, view):
+        columns = getattr(view, 'datatables_columns', {})
+        ordering = []
+        index = 0
+        while f'order[{index}][column]' in request.query_params:
+            column = _int_param(request, f'order[{index}][column]', -1)
+            direction = request.query_params.get(f'order[{index}][dir]', 'asc')
+            index += 1
+
+            name = request.query_params.get(f'columns[{column}][data]')
+            if request.query_params.get(f'columns[{column}][orderable]') == 'false':
+                continue
+            field = columns.get(name)
+            if field is None:
+                continue
+            ordering.append(f'-{field}' if direction == 'desc' else field)
+        return ordering
+
+    def filter_queryset(self, request, queryset, view):
+        if not is_datatables_request(request):
+            return queryset
+        ordering = self.get_ordering(request, view)
+        if not ordering:
+            return queryset
+        # Rows with equal sort keys must keep their order between pages
+        return queryset.order_by(*ordering, '-pk')
+
+
+class DataTablesPagination(BasePagination):
+    """
+    Return one ``start``/``length`` window in the DataTables response format.
+
+    ``recordsTotal`` counts the rows before searching and ``recordsFiltered``
+    after; the second count is skipped when there is no search.
+    """
+    default_length = 10
+    max_length = 1000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.draw = _int_param(request, 'draw', 1)
+        start = max(_int_param(request, 'start', 0), 0)
+        length = _int_param(request, 'length', self.default_length)
+        if length < 0 or length > self.max_length:
+            # "All" rows is capped like any other oversized page
+            length = self.max_length
+
+        self.records_filtered = queryset.count()
+        if view is not None and request.query_params.get(DataTablesSearchFilter.search_param, '').strip():
+            self.records_total = view.get_queryset().count()
+        else:
+            self.records_total = self.records_filtered
+        return list(queryset[start:start + length])
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('draw', self.draw),
+            ('recordsTotal', self.records_total),
+            ('recordsFiltered', self.records_filtered),
+            ('data', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'draw': {'type': 'integer'},
+                'recordsTotal': {'type': 'integer'},
+                'recordsFiltered': {'type': 'integer'},
+                'data': schema,
+            },
+        }
+
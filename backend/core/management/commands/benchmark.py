@@ -0,0 +1,65 @@
+"""
+Measure query counts and response times of API endpoints at several data sizes.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import autodiscover_modules
+
+from core.benchmarks import BENCHMARKS, measure, measure_allocations
+
+
+class Command(BaseCommand):
+    help = "Run the registered endpoint benchmarks (see core.benchmarks)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'names', nargs='*',
+            help="Benchmarks to run (default: all)"
+        )
+        parser.add_argument(
+            '--rows', type=int, nargs='+', default=[10, 100, 10000],
+            help="Row counts to run each benchmark with (default: 10 100 10000)"
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=3,
+            help="Runs per measurement; the fastest is reported (default: 3)"
+        )
+        parser.add_argument(
+            '--allocations', action='store_true',
+            help="Also report the peak memory each operation allocates (runs it once more, under tracemalloc)"
+        )
+        parser.add_argument(
+            '--strict', action='store_true',
+            help="Exit with an error if a benchmark exceeds its query budget"
+        )
+
+    def handle(self, *args, **options):
+        autodiscover_modules('benchmarks')
+        names = options['names'] or sorted(BENCHMARKS)
+        unknown = [name for name in names if name not in BENCHMARKS]
+        if unknown:
+            raise CommandError(f"Unknown benchmarks: {', '.join(unknown)}. Available: {', '.join(sorted(BENCHMARKS))}")
+
+        header = f"{'benchmark':<36} {'rows':>8} {'queries':>8} {'ms':>10} {'rows/s':>12}"
+        self.stdout.write(header + (f" {'peak KiB':>10}" if options['allocations'] else ''))
+        over_budget = []
+        for name in names:
+            setup = BENCHMARKS[name]
+            counts = set()
+            for rows in options['rows']:
+                queries, seconds = measure(setup, rows, options['repeat'])
+                counts.add(queries)
+                throughput = f"{rows / seconds:>12.0f}" if setup.throughput and seconds else f"{'':>12}"
+                line = f"{name:<36} {rows:>8} {queries:>8} {seconds * 1000:>10.1f} {throughput}"
+                if options['allocations']:
+                    line += f" {measure_allocations(setup, rows) / 1024:>10.1f}"
+                self.stdout.write(line)
+            if len(counts) > 1:
+                self.stdout.write(self.style.WARNING(f"{name}: query count depends on the number of rows"))
+            if setup.max_queries is not None and max(counts) > setup.max_queries:
+                over_budget.append(name)
+                self.stdout.write(self.style.ERROR(
+                    f"{name}: {max(counts)} queries exceed the budget of {setup.max_queries}"
+                ))
+
+        if over_budget and options['strict']:
+            raise CommandError(f"Over query budget: {', '.join(over_budget)}")
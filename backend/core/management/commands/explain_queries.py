@@ -0,0 +1,97 @@
+"""
+EXPLAIN the portal's canonical queries and report the ones that are not index-backed.
+"""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from core.query_catalogue import CATALOGUE, Sample
+
+
+def postgresql_plan_problems(plan):
+    """Sequential scans and sorts in a PostgreSQL JSON plan."""
+    scans, sorts = [], []
+    nodes = [plan[0]['Plan']]
+    while nodes:
+        node = nodes.pop()
+        if node['Node Type'] == 'Seq Scan':
+            scans.append(node['Relation Name'])
+        elif node['Node Type'] in ('Sort', 'Incremental Sort'):
+            sorts.append(', '.join(node.get('Sort Key', [])))
+        nodes.extend(node.get('Plans', []))
+    return scans, sorts
+
+
+def sqlite_plan_problems(plan):
+    """Full table scans and temporary sorts in SQLite's EXPLAIN QUERY PLAN output."""
+    scans, sorts = [], []
+    for line in plan.splitlines():
+        # Rows are "<id> <parent> <unused> <detail>"
+        detail = line.split(' ', 3)[-1]
+        if detail.startswith('SCAN ') and ' USING ' not in detail:
+            scans.append(detail[len('SCAN '):].split(' ')[0])
+        elif detail.startswith('USE TEMP B-TREE'):
+            sorts.append(detail[len('USE TEMP B-TREE FOR '):])
+    return scans, sorts
+
+
+class Command(BaseCommand):
+    help = "EXPLAIN the canonical list queries (core.query_catalogue) and report sequential scans"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'names', nargs='*',
+            help="Queries to explain (default: all)"
+        )
+        parser.add_argument(
+            '--allow-seqscan', action='store_true',
+            help="Report the planner's choice for the current data instead of whether an "
+                 "index can serve each query (PostgreSQL only)"
+        )
+        parser.add_argument(
+            '--strict', action='store_true',
+            help="Exit with an error if any query needs a sequential scan"
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('postgresql', 'sqlite'):
+            raise CommandError(f"EXPLAIN output from {connection.vendor} is not supported")
+        names = options['names'] or list(CATALOGUE)
+        unknown = [name for name in names if name not in CATALOGUE]
+        if unknown:
+            raise CommandError(f"Unknown queries: {', '.join(unknown)}. Available: {', '.join(CATALOGUE)}")
+
+        sample = Sample()
+        failing = []
+        for name in names:
+            plan = self.explain(CATALOGUE[name](sample), options['allow_seqscan'])
+            if connection.vendor == 'postgresql':
+                scans, sorts = postgresql_plan_problems(json.loads(plan))
+            else:
+                scans, sorts = sqlite_plan_problems(plan)
+
+            if scans:
+                failing.append(name)
+                self.stdout.write(self.style.ERROR(f"{name:<32} SEQ SCAN on {', '.join(scans)}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"{name:<32} index"))
+            if sorts:
+                self.stdout.write(self.style.WARNING(f"{'':<32} sorts on {'; '.join(sorts)}"))
+            if options['verbosity'] > 1:
+                self.stdout.write(plan)
+
+        if failing and options['strict']:
+            raise CommandError(f"{len(failing)} queries are not index-backed: {', '.join(failing)}")
+        self.stdout.write(f"{len(names) - len(failing)} of {len(names)} queries are index-backed")
+
+    def explain(self, queryset, allow_seqscan):
+        if connection.vendor == 'sqlite':
+            return queryset.explain()
+        with transaction.atomic():
+            if not allow_seqscan:
+                # Small tables are cheaper to scan; make the planner show
+                # whether an index could serve the query at production size
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+            return queryset.explain(format='json')
@@ -0,0 +1,104 @@
+"""
+Remove content-addressed blobs that are no longer referenced.
+"""
+import os
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.blobs import count_references
+from core.models import Blob
+from core.storage import BLOB_ROOT, blob_storage
+
+
+class Command(BaseCommand):
+    help = "Delete unreferenced blobs from the content-addressed file store"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-hours', type=float, default=24,
+            help="Only delete blobs unreferenced and untouched for this long (default: 24)"
+        )
+        parser.add_argument(
+            '--recount', action='store_true',
+            help="Recompute reference counts from the database before collecting"
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Report what would be deleted without deleting anything"
+        )
+
+    def handle(self, *args, **options):
+        grace = timedelta(hours=options['grace_hours'])
+        dry_run = options['dry_run']
+
+        if options['recount']:
+            self.recount(dry_run)
+
+        cutoff = timezone.now() - grace
+        deleted = freed = 0
+        for blob in Blob.objects.filter(ref_count=0, updated_at__lt=cutoff).iterator():
+            if self.recently_touched(blob.name, cutoff):
+                continue
+            if not dry_run:
+                # Only remove the file if no upload took a reference or
+                # stored the same content meanwhile
+                removed, _ = Blob.objects.filter(pk=blob.pk, ref_count=0, updated_at__lt=cutoff).delete()
+                if not removed or not blob_storage.purge(blob.name):
+                    continue
+            deleted += 1
+            freed += blob.size
+            self.stdout.write(f"Deleted {blob.name}", self.style.NOTICE)
+
+        deleted += self.collect_untracked_files(cutoff, dry_run)
+        verb = "Would delete" if dry_run else "Deleted"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {deleted} blobs, {freed / (1024 * 1024):.1f}MB"))
+
+    def recently_touched(self, name, cutoff):
+        """Files written since the cutoff may belong to an upload still in progress."""
+        try:
+            modified = os.path.getmtime(blob_storage.path(name))
+        except FileNotFoundError:
+            return False
+        return modified >= cutoff.timestamp()
+
+    def recount(self, dry_run):
+        """Repair counts that drifted, e.g. after rows were changed with ``update()``."""
+        counts = count_references()
+        fixed = 0
+        for blob in Blob.objects.iterator():
+            actual = counts.pop(blob.name, 0)
+            if blob.ref_count != actual:
+                fixed += 1
+                if not dry_run:
+                    Blob.objects.filter(pk=blob.pk).update(ref_count=actual)
+        # Referenced blobs that never got a row
+        for name, actual in counts.items():
+            if blob_storage.exists(name):
+                fixed += 1
+                if not dry_run:
+                    Blob.objects.create(
+                        name=name,
+                        sha256=name.rsplit('/', 1)[-1].split('.', 1)[0],
+                        size=blob_storage.size(name),
+                        ref_count=actual,
+                    )
+        self.stdout.write(f"Corrected {fixed} reference counts")
+
+    def collect_untracked_files(self, cutoff, dry_run):
+        """Delete stale files under the blob root that have no ``Blob`` row."""
+        root = blob_storage.path(BLOB_ROOT)
+        known = set(Blob.objects.values_list('name', flat=True)) | set(count_references())
+        deleted = 0
+        for directory, _, files in os.walk(root):
+            for filename in files:
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, blob_storage.location).replace(os.sep, '/')
+                if name in known or os.path.getmtime(path) >= cutoff.timestamp():
+                    continue
+                if not dry_run and not blob_storage.purge(name):
+                    continue
+                deleted += 1
+                self.stdout.write(f"Deleted untracked {name}", self.style.NOTICE)
+        return deleted
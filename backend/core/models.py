@@ -1,3 +1,24 @@
 from django.db import models
 
-# Create your models here.
+
+class Blob(models.Model):
+    """
+    A content-addressed file in ``core.storage.BlobStorage``.
+    
+    ``ref_count`` is the number of file fields currently pointing at the
+    blob. Blobs that drop to zero are removed by ``gc_blobs``.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    sha256 = models.CharField(max_length=64, db_index=True)
+    size = models.BigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['ref_count', 'updated_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} references)"
@@ -0,0 +1,210 @@
+"""
+Pagination for clinic-scoped list endpoints.
+
+``ListPagination`` picks a paginator per request:
+
+* ``?draw=...`` (a DataTables table): ``core.datatables.DataTablesPagination``
+* ``?cursor=...``: ``KeysetPagination``, newest first on ``(created_at, id)``;
+  pass an empty ``cursor`` for the first page
+* anything else: the view's usual paginator
+
+Keyset pages filter on the last row seen instead of using ``OFFSET``, so a
+deep page costs the same as the first one. They skip ``COUNT(*)`` unless
+``?count=exact`` or ``?count=approximate`` is passed.
+"""
+import base64
+import json
+from collections import OrderedDict
+
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from .datatables import DataTablesPagination, is_datatables_request
+
+# Below this many estimated rows an exact count is cheap enough to run instead
+APPROXIMATE_COUNT_THRESHOLD = 1000
+
+
+def approximate_count(queryset):
+    """
+    Estimate the rows in ``queryset`` from the query planner.
+
+    Only PostgreSQL exposes a planner estimate; elsewhere, and for small
+    results where the estimate is least reliable, the rows are counted.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    estimate = int(plan[0]['Plan']['Plan Rows'])
+    if estimate < APPROXIMATE_COUNT_THRESHOLD:
+        return queryset.count()
+    return estimate
+
+
+def is_keyset_request(request):
+    return KeysetPagination.cursor_query_param in request.query_params
+
+
+def _value(row, name):
+    # values() querysets yield dicts
+    return row[name] if isinstance(row, dict) else getattr(row, name)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on ``(created_at, id)``, newest first.
+
+    Cursors hold the sort key of the row at the page boundary, so pages stay
+    stable while rows are added. Pages are read from the model's
+    ``(clinic, created_at, id)`` index, or ``(created_at, id)`` without a
+    clinic, starting at the cursor.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    count_query_param = 'count'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return api_settings.PAGE_SIZE or 10
+        return min(max(size, 1), self.max_page_size)
+
+    def encode_cursor(self, row, reverse):
+        position = {'c': _value(row, 'created_at').isoformat(), 'i': str(_value(row, 'id'))}
+        if reverse:
+            position['r'] = 1
+        encoded = base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param, '')
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            created_at = parse_datetime(position['c'])
+            if created_at is None:
+                raise ValueError(position['c'])
+            return created_at, position['i'], bool(position.get('r'))
+        except (TypeError, ValueError, KeyError):
+            raise NotFound("Invalid cursor")
+
+    def page_queryset(self, queryset, position):
+        """
+        Order ``queryset`` in page order, starting after ``position``.
+
+        ``position`` is a decoded cursor, ``(created_at, id, reverse)``, or
+        ``None`` for the first page.
+        """
+        reverse = bool(position and position[2])
+        if position is not None:
+            created_at, pk = position[:2]
+            # The OR alone cannot bound an index scan; the first condition
+            # starts the scan of the (created_at, id) index at the cursor
+            if reverse:
+                after = Q(created_at__gte=created_at) & (Q(created_at__gt=created_at) | Q(id__gt=pk))
+            else:
+                after = Q(created_at__lte=created_at) & (Q(created_at__lt=created_at) | Q(id__lt=pk))
+            queryset = queryset.filter(after)
+        ordering = ('created_at', 'id') if reverse else ('-created_at', '-id')
+        return queryset.order_by(*ordering)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.count_mode = request.query_params.get(self.count_query_param)
+        position = self.decode_cursor(request)
+        reverse = bool(position and position[2])
+
+        self.count = None
+        if self.count_mode == 'exact':
+            self.count = queryset.count()
+        elif self.count_mode == 'approximate':
+            self.count = approximate_count(queryset)
+
+        rows = list(self.page_queryset(queryset, position)[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.page = rows
+        return rows
+
+    def get_next_link(self):
+        if not (self.has_next and self.page):
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not (self.has_previous and self.page):
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        response = OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+        ])
+        if self.count is not None:
+            response['count'] = self.count
+            response['count_is_approximate'] = self.count_mode == 'approximate'
+        response['results'] = data
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'count': {'type': 'integer'},
+                'count_is_approximate': {'type': 'boolean'},
+                'results': schema,
+            },
+        }
+
+
+class ListPagination(BasePagination):
+    """Delegate to DataTables, keyset or ``default_class`` pagination per request."""
+    default_class = PageNumberPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if is_datatables_request(request):
+            self.paginator = DataTablesPagination()
+        elif is_keyset_request(request):
+            self.paginator = KeysetPagination()
+        else:
+            self.paginator = self.default_class()
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return self.default_class().get_paginated_response_schema(schema)
+
+    def get_schema_operation_parameters(self, view):
+        return self.default_class().get_schema_operation_parameters(view)
+
+
+class DataTablesListPagination(ListPagination):
+    """``ListPagination`` for endpoints that answer in the DataTables format by default."""
+    default_class = DataTablesPagination
@@ -0,0 +1,198 @@
+"""
+The portal's canonical list queries, as built by its views.
+
+``manage.py explain_queries`` runs ``EXPLAIN`` over each of them to check
+they are served by an index. Entries take a ``Sample`` of existing ids so
+the planner sees realistic parameters; on an empty database the ids are
+placeholders, which is enough to show which indexes a plan can use.
+
+The ``*.keyset`` and ``*.datatables`` entries are built by the paginator and
+filter backend the list endpoints use, so they follow any change to them.
+DataTables sorts on annotated columns (a prescription's patient name, an
+order's prescription count) are not in the catalogue: no index can serve
+them, and they sort one clinic's rows, not the whole table.
+"""
+import uuid
+from datetime import timedelta
+
+from django.http import HttpRequest, QueryDict
+from django.utils import timezone
+from django.utils.http import urlencode
+from rest_framework.request import Request
+
+from core.datatables import DataTablesOrderingFilter
+from core.models import Blob
+from core.pagination import KeysetPagination
+from invoices.models import Invoice, InvoiceItem
+from invoices.views import InvoiceViewSet
+from orders.models import Order
+from orders.views import OrderViewSet
+from patients.models import Patient
+from patients.views import PatientViewSet
+from prescriptions.models import Attachment, Prescription, Scan, UploadSession
+from prescriptions.views import PrescriptionViewSet
+from users.models import Clinic, User
+
+PAGE = 10
+
+# {name: query(sample) -> QuerySet}
+CATALOGUE = {}
+
+
+def canonical_query(name):
+    def register(query):
+        CATALOGUE[name] = query
+        return query
+    return register
+
+
+class Sample:
+    """Ids of existing rows to plug into the catalogue's filters."""
+
+    def __init__(self):
+        self.clinic_id = self.first_pk(Clinic)
+        self.user_id = self.first_pk(User)
+        self.patient_id = self.first_pk(Patient)
+        self.prescription_id = self.first_pk(Prescription)
+        self.invoice_id = self.first_pk(Invoice)
+        # A keyset cursor: the sort key of the last row on the previous page
+        self.cursor = (timezone.now(), uuid.uuid4(), False)
+
+    @staticmethod
+    def first_pk(model):
+        pk = model._default_manager.order_by().values_list('pk', flat=True).first()
+        if pk is not None:
+            return pk
+        return uuid.uuid4() if model._meta.pk.get_internal_type() == 'UUIDField' else 0
+
+
+@canonical_query('patients.list')
+def patients_list(sample):
+    return Patient.objects.filter(clinic_id=sample.clinic_id)[:PAGE]
+
+
+def keyset_page(queryset, cursor):
+    """The page of ``queryset`` after ``cursor``, as ``KeysetPagination`` reads it."""
+    return KeysetPagination().page_queryset(queryset, cursor)[:PAGE + 1]
+
+
+def datatables_page(queryset, view, column, direction):
+    """The first page of ``queryset`` sorted by one of ``view``'s DataTables columns."""
+    request = HttpRequest()
+    request.GET = QueryDict(urlencode({
+        'draw': 1, 'order[0][column]': 0, 'order[0][dir]': direction, 'columns[0][data]': column,
+    }))
+    return DataTablesOrderingFilter().filter_queryset(Request(request), queryset, view)[:PAGE]
+
+
+@canonical_query('patients.keyset')
+def patients_keyset(sample):
+    return keyset_page(Patient.objects.filter(clinic_id=sample.clinic_id), sample.cursor)
+
+
+@canonical_query('patients.datatables')
+def patients_datatables(sample):
+    # The index serves the name order; only patients sharing a name are
+    # sorted again on the primary key tie-breaker
+    return datatables_page(Patient.objects.filter(clinic_id=sample.clinic_id), PatientViewSet, 'last_name', 'asc')
+
+
+@canonical_query('prescriptions.list')
+def prescriptions_list(sample):
+    # Prescription.clinic mirrors the patient's clinic for this index
+    return Prescription.objects.filter(clinic_id=sample.clinic_id).list_rows().order_by('-created_at', '-id')[:PAGE]
+
+
+@canonical_query('prescriptions.keyset')
+def prescriptions_keyset(sample):
+    return keyset_page(Prescription.objects.filter(clinic_id=sample.clinic_id).list_rows(), sample.cursor)
+
+
+@canonical_query('prescriptions.keyset_previous')
+def prescriptions_keyset_previous(sample):
+    created_at, pk, _ = sample.cursor
+    return keyset_page(Prescription.objects.filter(clinic_id=sample.clinic_id).list_rows(), (created_at, pk, True))
+
+
+@canonical_query('prescriptions.datatables')
+def prescriptions_datatables(sample):
+    return datatables_page(
+        Prescription.objects.filter(clinic_id=sample.clinic_id).list_rows(), PrescriptionViewSet, 'created_at', 'desc'
+    )
+
+
+@canonical_query('prescriptions.for_patient')
+def prescriptions_for_patient(sample):
+    return Prescription.objects.filter(patient_id=sample.patient_id).list_rows().order_by('-created_at')
+
+
+@canonical_query('prescriptions.scans')
+def prescription_scans(sample):
+    return Scan.objects.filter(prescription_id=sample.prescription_id)
+
+
+@canonical_query('prescriptions.attachments')
+def prescription_attachments(sample):
+    return Attachment.objects.filter(prescription_id=sample.prescription_id)
+
+
+@canonical_query('prescriptions.uploads')
+def prescription_uploads(sample):
+    return UploadSession.objects.filter(
+        prescription_id=sample.prescription_id, created_by_id=sample.user_id
+    ).order_by('created_at')
+
+
+@canonical_query('orders.list')
+def orders_list(sample):
+    return Order.objects.filter(clinic_id=sample.clinic_id).order_by('-created_at')[:PAGE]
+
+
+@canonical_query('orders.keyset')
+def orders_keyset(sample):
+    return keyset_page(Order.objects.filter(clinic_id=sample.clinic_id), sample.cursor)
+
+
+@canonical_query('orders.datatables')
+def orders_datatables(sample):
+    return datatables_page(Order.objects.filter(clinic_id=sample.clinic_id), OrderViewSet, 'created_at', 'desc')
+
+
+@canonical_query('orders.for_user')
+def orders_for_user(sample):
+    return Order.objects.filter(user_id=sample.user_id).order_by('-created_at')[:PAGE]
+
+
+@canonical_query('invoices.list')
+def invoices_list(sample):
+    return Invoice.objects.filter(clinic_id=sample.clinic_id).order_by('-created_at')[:PAGE]
+
+
+@canonical_query('invoices.keyset')
+def invoices_keyset(sample):
+    return keyset_page(Invoice.objects.filter(clinic_id=sample.clinic_id), sample.cursor)
+
+
+@canonical_query('invoices.datatables')
+def invoices_datatables(sample):
+    return datatables_page(Invoice.objects.filter(clinic_id=sample.clinic_id), InvoiceViewSet, 'created_at', 'desc')
+
+
+@canonical_query('invoices.overdue')
+def invoices_overdue(sample):
+    return Invoice.objects.filter(status='pending', due_date__lt=timezone.now().date()).order_by('due_date')
+
+
+@canonical_query('invoices.items')
+def invoice_items(sample):
+    return InvoiceItem.objects.filter(invoice_id=sample.invoice_id)
+
+
+@canonical_query('uploads.stale')
+def stale_uploads(sample):
+    return UploadSession.objects.filter(updated_at__lt=timezone.now() - timedelta(hours=24))
+
+
+@canonical_query('blobs.garbage')
+def garbage_blobs(sample):
+    return Blob.objects.filter(ref_count=0, updated_at__lt=timezone.now() - timedelta(hours=24))
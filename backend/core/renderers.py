@@ -0,0 +1,100 @@
+"""
+JSON rendering and parsing for the API with orjson.
+
+``ORJSONRenderer`` and ``ORJSONParser`` are drop-in replacements for DRF's
+``JSONRenderer`` and ``JSONParser``, registered in ``REST_FRAMEWORK``. orjson
+writes UUIDs, dates and datetimes itself, straight into the response bytes,
+instead of building an intermediate ``str`` through ``JSONEncoder.default``;
+anything else it does not know, such as ``Decimal`` or lazy translations,
+goes through DRF's ``JSONEncoder`` as before.
+
+orjson writes some floats differently: NaN and infinities as ``null``,
+where ``JSONRenderer`` refuses them, and floats the standard library puts
+an exponent on in their own way (``1e-7`` for ``1e-07``, ``1e16`` for
+``1e+16``). Data holding such floats is rendered by ``JSONRenderer``, so
+the output is the same as its own. So is the output without orjson
+installed, or when it needs options orjson does not have (indenting, as
+the browsable API asks for, non-compact separators or ASCII-only output);
+the parser likewise falls back to DRF's.
+"""
+import datetime
+import logging
+import uuid
+from decimal import Decimal
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    logging.warning("orjson not installed. The API will render JSON with the standard library.")
+
+# Rendered as JSON escapes, like JSONRenderer does, so the output stays valid JavaScript
+LINE_SEPARATOR = ('\u2028'.encode(), b'\\u2028')
+PARAGRAPH_SEPARATOR = ('\u2029'.encode(), b'\\u2029')
+
+# Types that are written without a float, skipped quickly while looking for one
+SCALARS = frozenset({str, int, bool, type(None), uuid.UUID, datetime.datetime, datetime.date})
+
+# Types orjson does not write itself, e.g. Decimal, as JSONRenderer writes them
+encode_default = JSONEncoder().default
+
+
+def _has_odd_floats(data):
+    """Whether ``data`` holds a float orjson would not write as ``JSONRenderer`` does."""
+    stack = [data]
+    while stack:
+        values = stack.pop()
+        for value in values.values() if isinstance(values, dict) else values:
+            if type(value) in SCALARS:
+                continue
+            if isinstance(value, (float, Decimal)):
+                # Decimals are written as floats too. The standard library
+                # writes exponents outside this range; NaN fails both tests
+                value = float(value)
+                if value and not 1e-4 <= abs(value) < 1e16:
+                    return True
+            elif isinstance(value, (dict, list, tuple)):
+                stack.append(value)
+    return False
+
+
+class ORJSONRenderer(JSONRenderer):
+    """``JSONRenderer`` with orjson for compact output."""
+    options = (orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if orjson is None or indent is not None or not self.compact or self.ensure_ascii or _has_odd_floats([data]):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=encode_default, option=self.options)
+        except orjson.JSONEncodeError:
+            # e.g. integers beyond 64 bits, which the standard library handles
+            return super().render(data, accepted_media_type, renderer_context)
+        if b'\xe2\x80' in ret:
+            ret = ret.replace(*LINE_SEPARATOR).replace(*PARAGRAPH_SEPARATOR)
+        return ret
+
+
+class ORJSONParser(JSONParser):
+    """``JSONParser`` with orjson for UTF-8 bodies."""
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        # orjson only reads UTF-8 and always rejects NaN and infinities
+        if orjson is None or encoding.lower().replace('_', '-') not in ('utf-8', 'utf8') or not self.strict:
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
@@ -0,0 +1,252 @@
+"""
+Compiled read paths for DRF serializers.
+
+``Serializer.to_representation`` rediscovers the same things for every row
+it renders: which fields are readable, where each one reads its value from,
+and what kind of field it is. For a page of orders with their prescriptions,
+or a prescription with hundreds of scans, that bookkeeping costs more than
+the data itself.
+
+``compile_serializer`` walks a serializer's field graph once per class and
+turns it into a list of steps: a getter for the field's source, and either a
+plain conversion (``str`` for a ``CharField``, the key itself for a
+``PrimaryKeyRelatedField``, ...), the compiled steps of a nested serializer,
+or, for anything it does not know, the field's own ``get_attribute`` and
+``to_representation``. Serializers opt in with ``CompiledReadMixin``::
+
+    class OrderSerializer(CompiledReadMixin, serializers.ModelSerializer):
+        ...
+
+The output is the same as DRF's, as plain dicts rather than ``OrderedDict``.
+Fields that depend on the serializer's context, such as method fields and
+file URLs, are still rendered by the serializer instance being used, so the
+compiled steps themselves hold no request state. Writes are unaffected.
+"""
+import datetime
+import functools
+from collections.abc import Mapping
+from contextlib import contextmanager
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Manager
+from django.utils import timezone
+from rest_framework import ISO_8601, fields, relations, serializers
+from rest_framework.fields import SkipField, get_attribute, is_simple_callable
+from rest_framework.relations import PKOnlyObject
+from rest_framework.settings import api_settings
+
+# Conversions that can skip the field, keyed by the field's to_representation
+PLAIN_CONVERSIONS = {
+    fields.CharField.to_representation: str,
+    fields.IntegerField.to_representation: int,
+    fields.FloatField.to_representation: float,
+}
+
+# Fields whose representation only depends on their own arguments, so the
+# fields of the serializer compiled at start-up can render any row
+CONTEXT_FREE_FIELDS = (
+    fields.BooleanField, fields.ChoiceField, fields.DateField, fields.DateTimeField,
+    fields.DecimalField, fields.DurationField, fields.JSONField, fields.TimeField,
+    fields.UUIDField,
+)
+
+# Kinds of steps
+VALUE, DATETIME, PRIMARY_KEY, NESTED, MANY, FIELD = range(6)
+
+UNKNOWN = object()
+
+
+def _attribute_getter(source_attrs):
+    """Read ``source_attrs`` from a model instance the way ``fields.get_attribute`` does."""
+    if not source_attrs:
+        return lambda instance: instance
+    if len(source_attrs) > 1:
+        return functools.partial(get_attribute, attrs=source_attrs)
+    name = source_attrs[0]
+
+    def get(instance):
+        try:
+            value = getattr(instance, name)
+        except ObjectDoesNotExist:
+            return None
+        if callable(value) and is_simple_callable(value):
+            value = value()
+        return value
+    return get
+
+
+def _item_getter(source_attrs):
+    """Read ``source_attrs`` from a ``values()`` row."""
+    if len(source_attrs) == 1:
+        return itemgetter(source_attrs[0])
+    return functools.partial(get_attribute, attrs=source_attrs)
+
+
+def _compiles(serializer):
+    return type(serializer).to_representation in (
+        serializers.Serializer.to_representation, CompiledReadMixin.to_representation
+    )
+
+
+def _model_attname(serializer, field):
+    """The column a ``PrimaryKeyRelatedField`` reads, or ``None`` to leave it to the field."""
+    model = getattr(getattr(serializer, 'Meta', None), 'model', None)
+    if (
+        model is None or len(field.source_attrs) != 1 or field.pk_field is not None
+        or type(field).get_attribute is not relations.RelatedField.get_attribute
+        or type(field).to_representation is not relations.PrimaryKeyRelatedField.to_representation
+    ):
+        return None
+    try:
+        return model._meta.get_field(field.source_attrs[0]).attname
+    except Exception:
+        return None
+
+
+def _is_iso_datetime(field):
+    """Whether ``field`` renders aware datetimes in the current time zone as ISO 8601."""
+    return (
+        type(field).to_representation is fields.DateTimeField.to_representation
+        and type(field).enforce_timezone is fields.DateTimeField.enforce_timezone
+        and not hasattr(field, 'timezone')
+        and str(getattr(field, 'format', api_settings.DATETIME_FORMAT)).lower() == ISO_8601
+    )
+
+
+def _current_timezone():
+    return timezone.get_current_timezone() if settings.USE_TZ else None
+
+
+def _render_datetime(field, value, tz):
+    # DateTimeField.to_representation, with the current time zone looked up once per row
+    if tz is not None and isinstance(value, datetime.datetime) and timezone.is_aware(value):
+        try:
+            value = value.astimezone(tz).isoformat()
+        except OverflowError:
+            return field.to_representation(value)
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    return field.to_representation(value)
+
+
+def _conversion(field):
+    """A function rendering the values of ``field``, or ``None`` to leave it to the field."""
+    to_representation = type(field).to_representation
+    if to_representation is fields.UUIDField.to_representation and field.uuid_format == 'hex_verbose':
+        return str
+    if to_representation in PLAIN_CONVERSIONS:
+        return PLAIN_CONVERSIONS[to_representation]
+    if any(to_representation is cls.to_representation for cls in CONTEXT_FREE_FIELDS):
+        return field.to_representation
+    return None
+
+
+class CompiledSerializer:
+    """The field graph of a serializer, compiled into steps for ``render``."""
+
+    def __init__(self, serializer):
+        self.steps = [
+            self._compile_field(serializer, field)
+            for field in serializer.fields.values() if not field.write_only
+        ]
+
+    def _compile_field(self, serializer, field):
+        name = field.field_name
+        getters = (_attribute_getter(field.source_attrs), _item_getter(field.source_attrs))
+        if isinstance(field, relations.PrimaryKeyRelatedField):
+            attname = _model_attname(serializer, field)
+            if attname:
+                return PRIMARY_KEY, name, _attribute_getter([attname]), None, None
+        elif type(field).get_attribute is fields.Field.get_attribute:
+            if isinstance(field, serializers.ListSerializer):
+                if type(field).to_representation is serializers.ListSerializer.to_representation and _compiles(field.child):
+                    return (MANY, name, *getters, CompiledSerializer(field.child))
+            elif isinstance(field, serializers.BaseSerializer):
+                if _compiles(field):
+                    return (NESTED, name, *getters, CompiledSerializer(field))
+            elif _is_iso_datetime(field):
+                return (DATETIME, name, *getters, field)
+            else:
+                convert = _conversion(field)
+                if convert is not None:
+                    return (VALUE, name, *getters, convert)
+        return FIELD, name, None, None, None
+
+    def render(self, serializer, instance, tz=UNKNOWN):
+        """
+        ``serializer.to_representation(instance)``, with ``serializer`` of the
+        compiled class; ``tz`` is the current time zone, once looked up.
+        """
+        is_row = isinstance(instance, Mapping)
+        ret = {}
+        for kind, name, get, get_item, convert in self.steps:
+            if kind == FIELD or (is_row and get_item is None):
+                field = serializer.fields[name]
+                try:
+                    attribute = field.get_attribute(instance)
+                except SkipField:
+                    continue
+                check_for_none = attribute.pk if isinstance(attribute, PKOnlyObject) else attribute
+                ret[name] = None if check_for_none is None else field.to_representation(attribute)
+                continue
+
+            try:
+                attribute = get_item(instance) if is_row else get(instance)
+            except (KeyError, AttributeError):
+                # Defaults, optional fields and error messages as the field has them
+                try:
+                    attribute = serializer.fields[name].get_attribute(instance)
+                except SkipField:
+                    continue
+                if isinstance(attribute, PKOnlyObject):
+                    attribute = attribute.pk
+
+            if attribute is None:
+                ret[name] = None
+            elif kind == VALUE:
+                ret[name] = convert(attribute)
+            elif kind == DATETIME:
+                if tz is UNKNOWN:
+                    tz = _current_timezone()
+                ret[name] = _render_datetime(convert, attribute, tz)
+            elif kind == PRIMARY_KEY:
+                ret[name] = attribute
+            elif kind == NESTED:
+                ret[name] = convert.render(serializer.fields[name], attribute, tz)
+            else:
+                child = serializer.fields[name].child
+                items = attribute.all() if isinstance(attribute, Manager) else attribute
+                if tz is UNKNOWN:
+                    tz = _current_timezone()
+                ret[name] = [convert.render(child, item, tz) for item in items]
+        return ret
+
+
+@functools.lru_cache(maxsize=None)
+def compile_serializer(serializer_class):
+    """The ``CompiledSerializer`` of ``serializer_class``, built on first use."""
+    return CompiledSerializer(serializer_class())
+
+
+class CompiledReadMixin:
+    """
+    Render a serializer, and the serializers nested in it, through
+    ``compile_serializer``.
+    """
+    compile_reads = True
+
+    def to_representation(self, instance):
+        if not self.compile_reads:
+            return super().to_representation(instance)
+        return compile_serializer(type(self)).render(self, instance)
+
+
+@contextmanager
+def uncompiled():
+    """Render with DRF's own ``to_representation``, e.g. to compare against it."""
+    CompiledReadMixin.compile_reads = False
+    try:
+        yield
+    finally:
+        CompiledReadMixin.compile_reads = True
@@ -0,0 +1,125 @@
+"""
+Content-addressed file storage.
+
+Files are stored under their SHA-256 in a sharded tree below MEDIA_ROOT:
+
+    blobs/ab/cd/abcd1234...<ext>
+
+Saving bytes that are already stored writes nothing and returns the
+existing name, so duplicate uploads share one file on disk. Blobs are
+shared between rows, so ``delete()`` never removes them; references are
+counted by ``core.blobs`` and unreferenced blobs are removed by the
+``gc_blobs`` management command.
+
+Saving and ``gc_blobs`` can meet on the same blob. A save first touches
+the blob's ``Blob`` row; ``gc_blobs`` only deletes rows untouched since its
+cutoff, so a touched row and its file are kept. When the row is already
+gone, the save creates it again and rewrites the file, and ``purge``
+moves the file aside before it checks for the row, putting the file back
+if the row has reappeared.
+"""
+import hashlib
+import os
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+from django.utils import timezone
+
+BLOB_ROOT = 'blobs'
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+def content_sha256(content):
+    """
+    Return the SHA-256 of an uploaded file.
+
+    Scans that went through ``ScanUploadHandler`` were hashed while they
+    streamed in, so the digest is reused instead of reading the file again.
+    """
+    scan_info = getattr(content, 'scan_info', None)
+    if scan_info is not None:
+        return scan_info.sha256
+
+    digest = hashlib.sha256()
+    for chunk in content.chunks(HASH_CHUNK_SIZE):
+        digest.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return digest.hexdigest()
+
+
+def blob_name(sha256, ext=''):
+    """Return the storage name for a blob."""
+    return f'{BLOB_ROOT}/{sha256[:2]}/{sha256[2:4]}/{sha256}{ext.lower()}'
+
+
+def is_blob_name(name):
+    return bool(name) and name.startswith(f'{BLOB_ROOT}/')
+
+
+class BlobStorage(FileSystemStorage):
+    """
+    A ``FileSystemStorage`` that names files by their content.
+
+    The name produced by a field's ``upload_to`` only contributes its
+    extension, which is kept so file formats can still be told from names.
+    """
+
+    def _save(self, name, content):
+        from .models import Blob
+
+        _, ext = os.path.splitext(name)
+        sha256 = content_sha256(content)
+        name = blob_name(sha256, ext)
+        full_path = self.path(name)
+        touched = Blob.objects.filter(name=name).update(updated_at=timezone.now())
+        if touched and os.path.exists(full_path):
+            return name
+        if not touched:
+            # The reference is taken when the row pointing at the blob is saved
+            Blob.objects.get_or_create(name=name, defaults={'sha256': sha256, 'size': content.size})
+
+        # Write under a private name, then move into place atomically so a
+        # concurrent upload never sees a partial blob. Two writers racing on
+        # the same content replace the file with identical bytes.
+        partial = super()._save(f'{name}.{uuid.uuid4().hex}.partial', content)
+        os.replace(self.path(partial), full_path)
+        return name
+
+    def get_available_name(self, name, max_length=None):
+        # The final name is chosen by content in _save
+        return name
+
+    def delete(self, name):
+        # Blobs may be shared; gc_blobs removes them once unreferenced
+        pass
+
+    def purge(self, name):
+        """
+        Remove a blob from disk once its ``Blob`` row is deleted; returns
+        whether it was removed, which it is not if a save stored the same
+        content again meanwhile.
+        """
+        from .models import Blob
+
+        path = self.path(name)
+        moved = f'{path}.{uuid.uuid4().hex}.deleted'
+        try:
+            os.rename(path, moved)
+        except FileNotFoundError:
+            return False
+        # A save recreates the row before writing the file, so either the
+        # row is seen here or the file is written again after the rename
+        if Blob.objects.filter(name=name).exists():
+            os.replace(moved, path)
+            return False
+        os.remove(moved)
+        return True
+
+
+blob_storage = BlobStorage()
+
+
+def get_blob_storage():
+    """Storage callable for ``FileField(storage=...)``."""
+    return blob_storage
@@ -0,0 +1,50 @@
+"""
+Per-request clinic (tenant) resolution and clinic-scoped querysets.
+
+``TenantMiddleware`` gives every request a lazy ``request.tenant``: the
+authenticated user's ``Clinic``, or a falsy value for users without one.
+It is resolved on first use, after DRF has authenticated the request, and
+costs no query because both authentication paths load the user together
+with its clinic (``users.backends`` and ``users.authentication``).
+
+Querysets of clinic-owned models take it directly::
+
+    Prescription.objects.for_clinic(request.tenant)
+"""
+from django.db import models
+from django.utils.functional import SimpleLazyObject
+
+
+def get_request_clinic(request):
+    """The clinic of the user authenticated on ``request``, or ``None``."""
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated or not getattr(user, 'clinic_id', None):
+        return None
+    return user.clinic
+
+
+def belongs_to_clinic(clinic_id, clinic):
+    """Whether a row owned by ``clinic_id`` belongs to ``clinic``; never without one, as in ``for_clinic``."""
+    return bool(clinic) and clinic_id == clinic.pk
+
+
+class TenantMiddleware:
+    """Attach the lazily resolved clinic of the current user as ``request.tenant``."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.tenant = SimpleLazyObject(lambda: get_request_clinic(request))
+        return self.get_response(request)
+
+
+class ClinicScopedQuerySet(models.QuerySet):
+    # Lookup from the model to its owning clinic
+    clinic_lookup = 'clinic'
+
+    def for_clinic(self, clinic):
+        """Rows owned by ``clinic`` (a ``Clinic`` or ``request.tenant``); none without one."""
+        if not clinic:
+            return self.none()
+        return self.filter(**{f'{self.clinic_lookup}_id': clinic.pk})
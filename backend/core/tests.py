@@ -1,3 +1,524 @@
-from django.test import TestCase
+import datetime
+import io
+import os
+import tempfile
+import uuid
+from collections import OrderedDict
+from unittest import mock
+from decimal import Decimal
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from invoices.models import Invoice, InvoiceItem
+from orders.models import Order
+from patients.models import Patient
+from prescriptions.benchmarks import create_prescriptions
+from prescriptions.cloning import SECTION_RELATIONS
+from prescriptions.models import Attachment, Prescription, PrescriptionStatus, Scan, Template
+from users.models import User
+from .benchmarks import create_clinic_user, create_patient, create_scan_metadata
+from .caching import invalidate_clinic_cache
+from .datatables import DataTablesOrderingFilter, DataTablesPagination
+from .models import Blob
+from .renderers import ORJSONParser, ORJSONRenderer
+from .serialization import uncompiled
+from .storage import blob_storage
+
+
+class ClinicResponseCacheTests(TestCase):
+    """
+    List responses come from the cache until the clinic's data changes.
+
+    Runs against whatever ``CACHES`` configures: locmem by default for the
+    SQLite setup, or a local Redis with ``CACHE_URL=redis://localhost:6379/15``.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient, cls.user = create_patient()
+        cls.clinic = cls.patient.clinic
+        cls.other_clinic, cls.other_user = create_clinic_user()
+        cls.template = Template.objects.create(name='Standard')
+
+    def add_patient(self, last_name):
+        return Patient.objects.create(
+            first_name='John', last_name=last_name,
+            date_of_birth=datetime.date(1980, 1, 1), clinic=self.clinic
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = self.client_for(self.user)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def get(self, url, client=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = (client or self.client).get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response, len(queries)
+
+    def assertCached(self, url, client=None):
+        response, queries = self.get(url, client)
+        self.assertEqual(queries, 0, f"GET {url} was not served from the cache")
+        return response
+
+    def assertNotCached(self, url, client=None):
+        response, queries = self.get(url, client)
+        self.assertGreater(queries, 0, f"GET {url} was served from the cache")
+        return response
+
+    def test_repeat_loads_are_cached(self):
+        for url in ('/api/patients/', '/api/prescriptions/', '/api/orders/?draw=1', '/api/invoices/?draw=1'):
+            first = self.assertNotCached(url)
+            self.assertEqual(self.assertCached(url).data, first.data)
+
+    def test_query_string_is_part_of_the_key(self):
+        self.assertNotCached('/api/patients/')
+        self.assertNotCached('/api/patients/?cursor=')
+        self.assertCached('/api/patients/?cursor=')
+
+    def test_clinic_change_invalidates(self):
+        self.assertNotCached('/api/patients/')
+        self.add_patient('Jones')
+        response = self.assertNotCached('/api/patients/')
+        self.assertEqual(response.data['count'], 2)
+
+        self.patient.last_name = 'Brown'
+        self.patient.save()
+        response = self.assertNotCached('/api/patients/')
+        self.assertIn('Brown', [row['last_name'] for row in response.data['results']])
+
+    def test_other_clinics_stay_cached(self):
+        other_client = self.client_for(self.other_user)
+        self.assertNotCached('/api/patients/', other_client)
+        self.add_patient('Jones')
+        self.assertCached('/api/patients/', other_client)
+
+    def test_clinics_do_not_share_entries(self):
+        self.assertNotCached('/api/patients/')
+        response = self.assertNotCached('/api/patients/', self.client_for(self.other_user))
+        self.assertEqual(response.data['count'], 0)
+
+    def test_related_changes_invalidate(self):
+        self.assertNotCached('/api/prescriptions/')
+        Prescription.objects.create(patient=self.patient, clinician=self.user, template=self.template)
+        self.assertNotCached('/api/prescriptions/')
+
+        # Lookup names are shown in every clinic's lists
+        self.assertCached('/api/prescriptions/')
+        PrescriptionStatus.objects.create(name='Draft')
+        self.assertNotCached('/api/prescriptions/')
+
+        self.assertNotCached('/api/orders/?draw=1')
+        order = Order.objects.create(user=self.user)
+        self.assertNotCached('/api/orders/?draw=1')
+        order.prescriptions.add(Prescription.objects.first())
+        self.assertNotCached('/api/orders/?draw=1')
+
+    def test_moving_a_row_invalidates_both_clinics(self):
+        other_client = self.client_for(self.other_user)
+        self.assertNotCached('/api/patients/')
+        self.assertNotCached('/api/patients/', other_client)
+        patient = Patient.objects.get(pk=self.patient.pk)
+        patient.clinic = self.other_clinic
+        patient.save()
+        self.assertEqual(self.assertNotCached('/api/patients/').data['count'], 0)
+        self.assertEqual(self.assertNotCached('/api/patients/', other_client).data['count'], 1)
+
+    def test_prescriptions_follow_their_patient(self):
+        prescription = Prescription.objects.create(patient=self.patient, clinician=self.user, template=self.template)
+        self.assertEqual(prescription.clinic_id, self.clinic.pk)
+        self.patient.clinic = self.other_clinic
+        self.patient.save()
+        self.assertEqual(Prescription.objects.get(pk=prescription.pk).clinic_id, self.other_clinic.pk)
+        response = self.client_for(self.other_user).get('/api/prescriptions/')
+        self.assertEqual([row['id'] for row in response.data['results']], [str(prescription.pk)])
+
+    def test_lost_generation_does_not_serve_stale_entries(self):
+        self.assertNotCached('/api/patients/')
+        cache.delete(f'clinic-cache:{self.clinic.pk}:generation')
+        self.assertNotCached('/api/patients/')
+        invalidate_clinic_cache(self.clinic.pk)
+        self.assertNotCached('/api/patients/')
+
+    def test_staff_responses_are_not_cached(self):
+        staff = User.objects.create_user(
+            email='staff@example.com', password='password',
+            first_name='Ada', last_name='Admin', is_staff=True
+        )
+        client = self.client_for(staff)
+        self.assertNotCached('/api/patients/', client)
+        self.assertNotCached('/api/patients/', client)
+
+
+class ClinicAccessTests(TestCase):
+    """
+    The portal's detail pages show a clinic's rows to its own members only.
+    Users without a clinic see nothing, as with ``for_clinic``, even rows
+    that have no clinic either.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.clinic, cls.user = create_clinic_user()
+        cls.invoice = cls.create_invoice(cls.user, 'INV-1')
+        cls.orphan = User.objects.create_user(
+            email='orphan@example.com', password=None, first_name='No', last_name='Clinic'
+        )
+        cls.orphan_invoice = cls.create_invoice(
+            User.objects.create_user(email='other@example.com', password=None, first_name='No', last_name='Clinic'),
+            'INV-2'
+        )
+
+    @staticmethod
+    def create_invoice(user, number):
+        return Invoice.objects.create(
+            user=user, order=Order.objects.create(user=user), invoice_number=number,
+            amount=Decimal('0.00'), due_date=datetime.date(2030, 1, 1)
+        )
+
+    def get_invoice(self, user, invoice):
+        self.client.force_login(user)
+        return self.client.get('/api/invoice/detail/', {'id': invoice.pk}).json()
+
+    def test_clinic_members(self):
+        self.assertTrue(self.get_invoice(self.user, self.invoice)['success'])
+        self.assertEqual(self.get_invoice(self.user, self.orphan_invoice)['error'], 'Not authorized')
+
+    def test_users_without_a_clinic(self):
+        self.assertIsNone(self.orphan_invoice.clinic_id)
+        self.assertEqual(self.get_invoice(self.orphan, self.orphan_invoice)['error'], 'Not authorized')
+        self.assertEqual(self.get_invoice(self.orphan, self.invoice)['error'], 'Not authorized')
+
+        for url, redirect_to in (
+            (f'/orders/{self.orphan_invoice.order_id}/', '/orders/'),
+            (f'/invoices/{self.orphan_invoice.pk}/', '/invoices/'),
+        ):
+            with self.subTest(url=url):
+                self.assertRedirects(self.client.get(url), redirect_to, fetch_redirect_response=False)
+        response = self.client.get(f'/invoice/{self.orphan_invoice.pk}/print/')
+        self.assertEqual(response.json()['error'], 'Not authorized')
+
+
+class DataTablesOrderingFilterTests(SimpleTestCase):
+    """DataTables column sorts map onto the view's ``datatables_columns``."""
+
+    class View:
+        datatables_columns = {'id': 'id', 'total_amount': 'total', 'created_at': 'created_at'}
+
+    def get_ordering(self, params):
+        request = Request(APIRequestFactory().get('/', {'draw': 1, **params}))
+        return DataTablesOrderingFilter().get_ordering(request, self.View)
+
+    def test_column_mapping(self):
+        self.assertEqual(self.get_ordering({
+            'columns[0][data]': 'total_amount', 'columns[1][data]': 'created_at',
+            'order[0][column]': 0, 'order[0][dir]': 'desc',
+            'order[1][column]': 1, 'order[1][dir]': 'asc',
+        }), ['-total', 'created_at'])
+
+    def test_unsortable_columns_are_skipped(self):
+        self.assertEqual(self.get_ordering({
+            'columns[0][data]': 'id', 'columns[0][orderable]': 'false',
+            'columns[1][data]': 'notes', 'columns[2][data]': 'created_at',
+            'order[0][column]': 0, 'order[1][column]': 1, 'order[2][column]': 2, 'order[3][column]': 'x',
+            'order[2][dir]': 'desc',
+        }), ['-created_at'])
+
+
+class DataTablesTests(TestCase):
+    """
+    Each table endpoint sorts, searches and pages in the DataTables format,
+    within the user's clinic.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.clinic, cls.user = create_clinic_user()
+        template = Template.objects.create(name='Standard')
+        for last_name, order_status, invoice_status in (
+            ('Baker', 'shipped', 'pending'), ('Adams', 'pending', 'paid'), ('Clark', 'pending', 'cancelled'),
+        ):
+            patient = Patient.objects.create(
+                first_name='Pat', last_name=last_name, external_id=f'EXT-{last_name}',
+                date_of_birth=datetime.date(1980, 1, 1), clinic=cls.clinic
+            )
+            prescription = Prescription.objects.create(patient=patient, clinician=cls.user, template=template)
+            order = Order.objects.create(user=cls.user, status=order_status, notes=f'{last_name} order')
+            order.prescriptions.add(prescription)
+            Invoice.objects.create(
+                user=cls.user, order=order, invoice_number=f'INV-{last_name}', status=invoice_status,
+                amount=Decimal('0.00'), due_date=datetime.date(2030, 1, 1)
+            )
+        # Another clinic's rows are never counted
+        create_patient()
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def table(self, url, column, direction='asc', search='', **params):
+        response = self.client.get(url, {
+            'draw': 7, 'start': 0, 'length': 10,
+            'columns[0][data]': column, 'order[0][column]': 0, 'order[0][dir]': direction,
+            'search[value]': search, **params,
+        })
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(list(response.data), ['draw', 'recordsTotal', 'recordsFiltered', 'data'])
+        self.assertEqual(response.data['draw'], 7)
+        return response.data
+
+    def assertTable(self, url, column, key, expected):
+        data = self.table(url, column)
+        self.assertEqual((data['recordsTotal'], data['recordsFiltered']), (3, 3))
+        self.assertEqual([key(row) for row in data['data']], expected)
+        data = self.table(url, column, 'desc')
+        self.assertEqual([key(row) for row in data['data']], expected[::-1])
+
+        data = self.table(url, column, search='baker')
+        self.assertEqual((data['recordsTotal'], data['recordsFiltered']), (3, 1))
+        self.assertEqual(len(data['data']), 1)
+
+    def test_orders(self):
+        self.assertTable('/api/orders/', 'patient_name', lambda row: row['patient_name'],
+                         ['Pat Adams', 'Pat Baker', 'Pat Clark'])
+
+    def test_invoices(self):
+        self.assertTable('/api/invoices/', 'status', lambda row: row['status'], ['cancelled', 'paid', 'pending'])
+
+    def test_patients(self):
+        self.assertTable('/api/patients/', 'last_name', lambda row: row['last_name'], ['Adams', 'Baker', 'Clark'])
+
+    def test_prescriptions(self):
+        self.assertTable('/api/prescriptions/', 'patient_name', lambda row: row['patient_name'],
+                         ['Pat Adams', 'Pat Baker', 'Pat Clark'])
+
+    def test_ties_keep_their_order_between_pages(self):
+        # Two orders share the status; the primary key decides between them
+        rows = [
+            self.table('/api/orders/', 'status', start=start, length=1)['data'][0]['id']
+            for start in range(3)
+        ]
+        self.assertEqual(len(set(rows)), 3)
+        pending = sorted(str(pk) for pk in Order.objects.filter(status='pending').values_list('pk', flat=True))
+        self.assertEqual(rows[:2], pending[::-1])
+
+    def test_length_cap(self):
+        with mock.patch.object(DataTablesPagination, 'max_length', 2):
+            for length in (-1, 50):
+                with self.subTest(length=length):
+                    data = self.table('/api/patients/', 'last_name', length=length, start=1)
+                    self.assertEqual(data['recordsFiltered'], 3)
+                    self.assertEqual([row['last_name'] for row in data['data']], ['Baker', 'Clark'])
+
+
+class KeysetPaginationTests(TestCase):
+    """Cursor pages walk a clinic's rows newest first, without skipping or repeating any."""
+
+    @classmethod
+    def setUpTestData(cls):
+        patient, cls.user = create_prescriptions(7)
+        cls.prescriptions = Prescription.objects.filter(patient=patient)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def expected_ids(self):
+        return [str(pk) for pk in self.prescriptions.order_by('-created_at', '-id').values_list('id', flat=True)]
+
+    def walk(self, url):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            pages.append(response.data)
+            url = response.data['next']
+        return pages
+
+    def page_ids(self, page):
+        return [str(row['id']) for row in page['results']]
+
+    def test_next_and_previous_links(self):
+        pages = self.walk('/api/prescriptions/?cursor=&page_size=3')
+        self.assertEqual([self.page_ids(page) for page in pages], [
+            self.expected_ids()[:3], self.expected_ids()[3:6], self.expected_ids()[6:]
+        ])
+        self.assertIsNone(pages[0]['previous'])
+        self.assertNotIn('count', pages[0])
+
+        # Back from the last page to the first
+        second = self.client.get(pages[2]['previous']).data
+        self.assertEqual(self.page_ids(second), self.page_ids(pages[1]))
+        self.assertEqual(self.page_ids(self.client.get(second['next']).data), self.page_ids(pages[2]))
+        first = self.client.get(second['previous']).data
+        self.assertEqual(self.page_ids(first), self.page_ids(pages[0]))
+        self.assertIsNone(first['previous'])
+
+    def test_ties_on_created_at(self):
+        self.prescriptions.update(created_at=timezone.now())
+        pages = self.walk('/api/prescriptions/?cursor=&page_size=2')
+        self.assertEqual([pk for page in pages for pk in self.page_ids(page)], self.expected_ids())
+
+    def test_invalid_cursor(self):
+        for cursor in ('garbage', 'eyJjIjogIm5vdCBhIGRhdGUiLCAiaSI6ICIxIn0='):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.client.get(f'/api/prescriptions/?cursor={cursor}').status_code, 404)
+
+    def test_count(self):
+        for mode, approximate in (('exact', False), ('approximate', True)):
+            with self.subTest(mode=mode):
+                response = self.client.get(f'/api/prescriptions/?cursor=&page_size=3&count={mode}')
+                self.assertEqual((response.data['count'], response.data['count_is_approximate']), (7, approximate))
+
+
+class CompiledSerializerTests(TestCase):
+    """Compiled read serializers render exactly what DRF's own would."""
+
+    @classmethod
+    def setUpTestData(cls):
+        patient, cls.user = create_patient()
+        cls.prescription = Prescription.objects.create(
+            patient=patient, clinician=cls.user, template=Template.objects.create(name='Standard'),
+            status=PrescriptionStatus.objects.create(name='Draft'), general_notes='Cast on 12/3'
+        )
+        for relation in SECTION_RELATIONS:
+            Prescription._meta.get_field(relation).related_model.objects.create(prescription=cls.prescription)
+        scan = Scan.objects.create(prescription=cls.prescription, left_foot='blobs/00/00/left.stl')
+        create_scan_metadata(scan, 'left', bbox_max_x=1, bbox_max_y=2, bbox_max_z=3)
+        Attachment.objects.create(prescription=cls.prescription, file='blobs/00/00/notes.pdf', filename='notes.pdf')
+
+        cls.order = Order.objects.create(user=cls.user, notes='Rush')
+        cls.order.prescriptions.add(cls.prescription)
+        cls.invoice = Invoice.objects.create(
+            user=cls.user, order=cls.order, invoice_number='INV-1', amount=Decimal('120.00'),
+            due_date=datetime.date(2030, 1, 1)
+        )
+        InvoiceItem.objects.create(invoice=cls.invoice, description='Orthotics', price=Decimal('60.00'), quantity=2)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_same_output_as_drf(self):
+        for url in (
+            '/api/prescriptions/',
+            f'/api/prescriptions/{self.prescription.id}/',
+            '/api/orders/?draw=1',
+            f'/api/orders/{self.order.id}/',
+            f'/api/invoices/{self.invoice.id}/',
+        ):
+            with self.subTest(url=url):
+                cache.clear()
+                compiled = self.client.get(url)
+                self.assertEqual(compiled.status_code, 200, compiled.content)
+                cache.clear()
+                with uncompiled():
+                    expected = self.client.get(url)
+                self.assertEqual(compiled.content, expected.content)
+
+
+class ORJSONRendererTests(SimpleTestCase):
+    """orjson renders and parses the API's JSON as DRF's classes do."""
+
+    data = OrderedDict([
+        ('id', uuid.UUID('12345678-1234-5678-1234-567812345678')),
+        ('price', Decimal('60.50')),
+        ('created_at', datetime.datetime(2026, 1, 2, 3, 4, 5, 678901, tzinfo=datetime.timezone.utc)),
+        ('local', datetime.datetime(2026, 1, 2, 3, 4, 5, tzinfo=datetime.timezone(datetime.timedelta(hours=10)))),
+        ('naive', datetime.datetime(2026, 1, 2, 3, 4, 5)),
+        ('due', datetime.date(2026, 2, 1)),
+        ('label', gettext_lazy('Pending')),
+        ('notes', 'Über \u2028 line \u2029 para \u2014 dash'),
+        ('items', [{'quantity': 2, 'ratio': 0.5, 'paid': False, 'refund': None}]),
+    ])
+
+    def test_same_output_as_json_renderer(self):
+        self.assertEqual(ORJSONRenderer().render(self.data), JSONRenderer().render(self.data))
+        self.assertEqual(ORJSONRenderer().render(None), b'')
+        self.assertEqual(ORJSONRenderer().render({'big': 2 ** 70}), JSONRenderer().render({'big': 2 ** 70}))
+
+    def test_floats(self):
+        for angles in ([0.0, -0.0, 1e-4, 0.1, 123456789.125], [1e-5, 1e-7, -2.5e-9, 1e16, 1.5e300], [Decimal('1e-5')]):
+            with self.subTest(angles=angles):
+                data = {'angles': angles}
+                self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+        for value in (float('nan'), float('inf'), -float('inf')):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                ORJSONRenderer().render({'items': [{'angle': value}]})
+
+    def test_indented_output(self):
+        for args in (('application/json; indent=2',), (None, {'indent': 4})):
+            with self.subTest(args=args):
+                self.assertEqual(ORJSONRenderer().render(self.data, *args), JSONRenderer().render(self.data, *args))
+
+    def test_parse(self):
+        body = '{"notes": "Über", "angle": 4.5, "ids": [1, 2]}'.encode()
+        self.assertEqual(ORJSONParser().parse(io.BytesIO(body)), {'notes': 'Über', 'angle': 4.5, 'ids': [1, 2]})
+        for body in (b'{"angle": ', b'{"angle": NaN}'):
+            with self.subTest(body=body), self.assertRaises(ParseError):
+                ORJSONParser().parse(io.BytesIO(body))
+
+
+class BlobCollectionTests(TestCase):
+    """
+    ``gc_blobs`` removes unreferenced blobs, but never one that an upload
+    stored again after the collection started.
+    """
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings = override_settings(MEDIA_ROOT=media_root.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def save(self):
+        return blob_storage.save('scan.stl', ContentFile(b'solid scan'))
+
+    def age(self, name):
+        Blob.objects.filter(name=name).update(updated_at=timezone.now() - datetime.timedelta(days=2))
+        os.utime(blob_storage.path(name), (0, 0))
+
+    def collect(self):
+        call_command('gc_blobs', stdout=io.StringIO())
+
+    def test_collects_unreferenced_blobs(self):
+        name = self.save()
+        self.assertEqual(Blob.objects.get(name=name).ref_count, 0)
+        self.age(name)
+        self.collect()
+        self.assertFalse(Blob.objects.filter(name=name).exists())
+        self.assertFalse(blob_storage.exists(name))
+
+    def test_saving_again_keeps_the_blob(self):
+        name = self.save()
+        self.age(name)
+        self.assertEqual(self.save(), name)
+        self.collect()
+        self.assertTrue(Blob.objects.filter(name=name).exists())
+        self.assertTrue(blob_storage.exists(name))
+
+    def test_purge_keeps_blobs_stored_again(self):
+        # The upload recreated the row after the collection deleted it
+        name = self.save()
+        self.assertFalse(blob_storage.purge(name))
+        self.assertTrue(blob_storage.exists(name))
+        self.assertEqual(os.listdir(os.path.dirname(blob_storage.path(name))), [os.path.basename(name)])
@@ -10,7 +10,9 @@ from orders.models import Order
 from invoices.models import Invoice
 from prescriptions.models import Prescription, Template
 from prescriptions.views import create_prescription_view
+from prescriptions.lookups import lookup_table
 from users.models import Clinic
+from core.tenancy import belongs_to_clinic
 from django.contrib.auth import get_user_model
 import logging
 
@@ -88,11 +90,14 @@ def register_view(request):
 def prescriptions_view(request):
     """Prescriptions page view."""
     prescriptions = None
-    templates = Template.objects.filter(is_active=True).order_by('name')
+    templates = sorted(
+        (template for template in lookup_table(Template)[1] if template.is_active),
+        key=lambda template: template.name
+    )
     
     # If the user is associated with a clinic, get all prescriptions from that clinic
-    if hasattr(request.user, 'clinic') and request.user.clinic:
-        prescriptions = Prescription.objects.filter(patient__clinic=request.user.clinic).order_by('-created_at')
+    if request.tenant:
+        prescriptions = Prescription.objects.for_clinic(request.tenant).order_by('-created_at')
     
     context = {
         'prescriptions': prescriptions,
@@ -108,8 +113,8 @@ def orders_view(request):
     orders = None
     
     # If the user is associated with a clinic, get all orders from that clinic
-    if hasattr(request.user, 'clinic') and request.user.clinic:
-        orders = Order.objects.filter(prescriptions__patient__clinic=request.user.clinic).distinct()
+    if request.tenant:
+        orders = Order.objects.for_clinic(request.tenant)
     
     context = {
         'orders': orders,
@@ -124,8 +129,8 @@ def invoices_view(request):
     invoices = None
     
     # If the user is associated with a clinic, get all invoices from that clinic
-    if hasattr(request.user, 'clinic') and request.user.clinic:
-        invoices = Invoice.objects.filter(order__prescriptions__patient__clinic=request.user.clinic).distinct()
+    if request.tenant:
+        invoices = Invoice.objects.for_clinic(request.tenant)
     
     context = {
         'invoices': invoices,
@@ -145,8 +150,8 @@ def profile_view(request):
     """User profile view."""
     logger.info(f"Profile view accessed by user: {request.user} (authenticated: {request.user.is_authenticated})")
     
-    if hasattr(request.user, 'clinic') and request.user.clinic:
-        logger.info(f"User has clinic: {request.user.clinic.name}")
+    if request.tenant:
+        logger.info(f"User has clinic: {request.tenant.name}")
     else:
         logger.warning(f"User {request.user.email} does not have an associated clinic")
         
@@ -176,11 +181,11 @@ def update_profile(request):
 def update_clinic(request):
     """Update clinic information."""
     try:
-        if not hasattr(request.user, 'clinic') or not request.user.clinic:
+        if not request.tenant:
             return JsonResponse({'success': False, 'message': 'No clinic associated with this user'})
         
         # Update clinic information
-        clinic = request.user.clinic
+        clinic = request.tenant
         clinic.name = request.POST.get('clinic_name', clinic.name)
         clinic.phone = request.POST.get('clinic_phone', clinic.phone)
         clinic.email = request.POST.get('clinic_email', clinic.email)
@@ -226,7 +231,7 @@ def api_invoice_detail(request):
     try:
         invoice = Invoice.objects.get(id=invoice_id)
         # Check if the invoice belongs to the user's clinic
-        if not request.user.is_staff and not invoice.order.prescriptions.filter(patient__clinic=request.user.clinic).exists():
+        if not request.user.is_staff and not belongs_to_clinic(invoice.clinic_id, request.tenant):
             return JsonResponse({'success': False, 'error': 'Not authorized'})
         
         # Convert the invoice to a JSON-serializable format
@@ -271,7 +276,7 @@ def invoice_pdf(request, invoice_id):
     try:
         invoice = Invoice.objects.get(id=invoice_id)
         # Check if the invoice belongs to the user's clinic
-        if not request.user.is_staff and not invoice.order.prescriptions.filter(patient__clinic=request.user.clinic).exists():
+        if not request.user.is_staff and not belongs_to_clinic(invoice.clinic_id, request.tenant):
             return JsonResponse({'success': False, 'error': 'Not authorized'})
         
         # Check if WeasyPrint is available
@@ -329,7 +334,7 @@ def invoice_print(request, invoice_id):
     try:
         invoice = Invoice.objects.get(id=invoice_id)
         # Check if the invoice belongs to the user's clinic
-        if not request.user.is_staff and not invoice.order.prescriptions.filter(patient__clinic=request.user.clinic).exists():
+        if not request.user.is_staff and not belongs_to_clinic(invoice.clinic_id, request.tenant):
             return JsonResponse({'success': False, 'error': 'Not authorized'})
         
         context = {
@@ -369,8 +374,8 @@ def order_detail_view(request, order_id):
     """Order detail page view."""
     try:
         # Get the order and check if it belongs to the user's clinic
-        order = Order.objects.get(id=order_id)
-        if not request.user.is_staff and order.prescriptions.first().patient.clinic != request.user.clinic:
+        order = Order.objects.with_summary().with_prescriptions().get(id=order_id)
+        if not request.user.is_staff and not belongs_to_clinic(order.clinic_id, request.tenant):
             messages.error(request, 'You do not have permission to view this order.')
             return redirect('orders')
         
@@ -394,7 +399,7 @@ def invoice_detail_view(request, invoice_id):
     try:
         # Get the invoice and check if it belongs to the user's clinic
         invoice = Invoice.objects.get(id=invoice_id)
-        if not request.user.is_staff and invoice.order.prescriptions.first().patient.clinic != request.user.clinic:
+        if not request.user.is_staff and not belongs_to_clinic(invoice.clinic_id, request.tenant):
             messages.error(request, 'You do not have permission to view this invoice.')
             return redirect('invoices')
         
@@ -418,7 +423,7 @@ def prescription_detail_view(request, prescription_id):
     try:
         # Get the prescription and check if it belongs to the user's clinic
         prescription = Prescription.objects.get(id=prescription_id)
-        if not request.user.is_staff and prescription.patient.clinic != request.user.clinic:
+        if not request.user.is_staff and not belongs_to_clinic(prescription.clinic_id, request.tenant):
             messages.error(request, 'You do not have permission to view this prescription.')
             return redirect('prescriptions')
         
@@ -7,8 +7,8 @@ class InvoiceItemInline(admin.TabularInline):
 
 class InvoiceAdmin(admin.ModelAdmin):
     inlines = [InvoiceItemInline]
-    list_display = ('invoice_number', 'order', 'amount', 'status', 'due_date', 'created_at')
-    list_filter = ('status', 'due_date')
+    list_display = ('invoice_number', 'order', 'amount', 'total', 'status', 'due_date', 'created_at')
+    list_filter = ('status', 'due_date', 'clinic')
     search_fields = ('invoice_number', 'order__id', 'notes')
 
 admin.site.register(Invoice, InvoiceAdmin)
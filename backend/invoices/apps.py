@@ -5,3 +5,6 @@ class InvoicesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'invoices'
     verbose_name = 'Invoices'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,49 @@
+"""
+Find invoices whose stored totals no longer match their items.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import DecimalField, F, Sum
+
+from invoices.models import Invoice, invoice_totals
+
+
+class Command(BaseCommand):
+    help = "Compare stored invoice subtotal/tax/total with the invoice items and report drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix', action='store_true',
+            help="Recalculate the totals of drifted invoices"
+        )
+        parser.add_argument(
+            '--strict', action='store_true',
+            help="Exit with an error if any invoice has drifted (ignored with --fix)"
+        )
+
+    def handle(self, *args, **options):
+        invoices = Invoice.objects.order_by().annotate(
+            items_subtotal=Sum(F('items__price') * F('items__quantity'),
+                               output_field=DecimalField(max_digits=12, decimal_places=2))
+        ).only('invoice_number', 'subtotal', 'tax', 'total')
+
+        drifted = []
+        checked = 0
+        for invoice in invoices.iterator():
+            checked += 1
+            expected = invoice_totals(invoice.items_subtotal)
+            if (invoice.subtotal, invoice.tax, invoice.total) == expected:
+                continue
+            drifted.append(invoice)
+            self.stdout.write(self.style.WARNING(
+                f"{invoice.invoice_number}: stored {invoice.subtotal}/{invoice.tax}/{invoice.total}, "
+                f"items give {expected[0]}/{expected[1]}/{expected[2]}"
+            ))
+
+        if options['fix']:
+            for invoice in drifted:
+                invoice.recalculate_totals()
+            self.stdout.write(self.style.SUCCESS(f"Recalculated {len(drifted)} of {checked} invoices"))
+            return
+        if drifted and options['strict']:
+            raise CommandError(f"{len(drifted)} of {checked} invoices have drifted totals")
+        self.stdout.write(f"{len(drifted)} of {checked} invoices have drifted totals")
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:24
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+def backfill_invoice_clinic(apps, schema_editor):
+    Invoice = apps.get_model('invoices', 'Invoice')
+    Order = apps.get_model('orders', 'Order')
+    Invoice.objects.update(clinic_id=Subquery(
+        Order.objects.filter(pk=OuterRef('order_id')).values('clinic_id')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+        ('invoices', '0004_created_at_index'),
+        ('orders', '0005_clinic'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='clinic',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='invoices', to='users.clinic'),
+        ),
+        migrations.RunPython(backfill_invoice_clinic, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:30
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import F, Sum
+
+
+def backfill_invoice_totals(apps, schema_editor):
+    # Same arithmetic as invoices.models.invoice_totals at the time of writing
+    Invoice = apps.get_model('invoices', 'Invoice')
+    cent = Decimal('0.01')
+    invoices = Invoice.objects.annotate(
+        items_subtotal=Sum(F('items__price') * F('items__quantity'),
+                           output_field=models.DecimalField(max_digits=12, decimal_places=2))
+    )
+    for invoice in invoices.iterator():
+        subtotal = (invoice.items_subtotal or Decimal('0.00')).quantize(cent)
+        tax = (subtotal * Decimal('0.09')).quantize(cent)
+        Invoice.objects.filter(pk=invoice.pk).update(
+            subtotal=subtotal, tax=tax, total=(subtotal + Decimal('10.00') + tax).quantize(cent)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0006_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='tax',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=10),
+        ),
+        migrations.RunPython(backfill_invoice_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0007_invoice_totals'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='invoice',
+            name='invoice_clinic_created_idx',
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['clinic', 'created_at', 'id'], name='invoice_clinic_created_idx'),
+        ),
+    ]
@@ -2,11 +2,26 @@
 Models for the invoices app.
 """
 import uuid
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Sum
 from django.conf import settings
+from django.utils import timezone
+from core.caching import invalidate_clinic_cache
+from core.tenancy import ClinicScopedQuerySet
 from orders.models import Order
 from decimal import Decimal
 
+SHIPPING = Decimal('10.00')
+TAX_RATE = Decimal('0.09')
+
+
+def invoice_totals(subtotal):
+    """``(subtotal, tax, total)`` for an items subtotal: 9% tax plus flat shipping."""
+    subtotal = (subtotal or Decimal('0.00')).quantize(Decimal('0.01'))
+    tax = (subtotal * TAX_RATE).quantize(Decimal('0.01'))
+    return subtotal, tax, (subtotal + SHIPPING + tax).quantize(Decimal('0.01'))
+
+
 class Invoice(models.Model):
     """
     Model for invoice information.
@@ -20,40 +35,65 @@ class Invoice(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='invoices')
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='invoices')
+    # Copied from the order by invoices.signals
+    clinic = models.ForeignKey('users.Clinic', on_delete=models.SET_NULL, null=True, blank=True, related_name='invoices')
     invoice_number = models.CharField(max_length=50, unique=True)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     due_date = models.DateField()
     notes = models.TextField(blank=True)
+    # Kept in step with the items by invoices.signals; see recalculate_totals()
+    subtotal = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'), editable=False)
+    tax = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'), editable=False)
+    total = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'), editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = ClinicScopedQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination, see core.pagination.KeysetPagination
+            models.Index(fields=['created_at', 'id'], name='invoice_created_idx'),
+            # A clinic's invoices, newest first
+            models.Index(fields=['clinic', 'created_at', 'id'], name='invoice_clinic_created_idx'),
+            # Outstanding invoices by due date
+            models.Index(fields=['status', 'due_date'], name='invoice_status_due_idx'),
+        ]
     
     def __str__(self):
         return f"Invoice {self.invoice_number} - {self.status}"
     
-    @property
-    def subtotal(self):
-        """Calculate the subtotal of all invoice items."""
-        return sum((item.price * item.quantity) for item in self.items.all()) or Decimal('0.00')
-    
     @property
     def shipping(self):
         """Get shipping cost for the invoice."""
         # Default shipping cost if none is explicitly set
-        return Decimal('10.00')
+        return SHIPPING
     
-    @property
-    def tax(self):
-        """Calculate tax (9% of the subtotal)."""
-        return (self.subtotal * Decimal('0.09')).quantize(Decimal('0.01'))
+    def calculate_totals(self):
+        """Compute subtotal, tax and total from the invoice's items in the database."""
+        subtotal = self.items.aggregate(
+            subtotal=Sum(F('price') * F('quantity'), output_field=models.DecimalField(max_digits=12, decimal_places=2))
+        )['subtotal']
+        return invoice_totals(subtotal)
     
-    @property
-    def total(self):
-        """Calculate the total invoice amount (subtotal + shipping + tax)."""
-        return (self.subtotal + self.shipping + self.tax).quantize(Decimal('0.01'))
+    def recalculate_totals(self):
+        """
+        Store freshly computed totals. Runs under a row lock so concurrent
+        item changes on the same invoice are applied one after the other.
+        """
+        with transaction.atomic():
+            Invoice.objects.select_for_update().filter(pk=self.pk).values_list('pk').first()
+            self.subtotal, self.tax, self.total = self.calculate_totals()
+            Invoice.objects.filter(pk=self.pk).update(
+                subtotal=self.subtotal, tax=self.tax, total=self.total, updated_at=timezone.now()
+            )
+            invalidate_clinic_cache(self.clinic_id)
+
+
+class InvoiceItemQuerySet(ClinicScopedQuerySet):
+    clinic_lookup = 'invoice__clinic'
 
 
 class InvoiceItem(models.Model):
@@ -68,8 +108,13 @@ class InvoiceItem(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = InvoiceItemQuerySet.as_manager()
+    
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['invoice', 'created_at'], name='invoiceitem_invoice_idx'),
+        ]
     
     def __str__(self):
         return f"{self.description} (${self.price})"
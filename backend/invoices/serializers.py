@@ -2,6 +2,7 @@
 Serializers for the invoices app.
 """
 from rest_framework import serializers
+from core.serialization import CompiledReadMixin
 from .models import Invoice, InvoiceItem
 from orders.serializers import OrderSerializer
 
@@ -18,7 +19,7 @@ class InvoiceSerializer(serializers.ModelSerializer):
     """
     Serializer for the Invoice model.
     """
-    total_amount = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    total_amount = serializers.DecimalField(source='total', max_digits=10, decimal_places=2, read_only=True)
     items_count = serializers.IntegerField(read_only=True)
 
     class Meta:
@@ -26,12 +27,10 @@ class InvoiceSerializer(serializers.ModelSerializer):
         fields = ['id', 'order', 'status', 'total_amount', 'items_count', 'created_at']
         read_only_fields = ['id', 'created_at']
 
-class InvoiceDetailSerializer(serializers.ModelSerializer):
+class InvoiceDetailSerializer(CompiledReadMixin, serializers.ModelSerializer):
     items = InvoiceItemSerializer(many=True, read_only=True)
     order = OrderSerializer(read_only=True)
-    total_amount = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
-    subtotal = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
-    tax = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    total_amount = serializers.DecimalField(source='total', max_digits=10, decimal_places=2, read_only=True)
     shipping = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
 
     class Meta:
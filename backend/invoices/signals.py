@@ -0,0 +1,64 @@
+"""
+Signal handlers for the invoices app.
+"""
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core.caching import track_clinic_changes
+from orders.models import Order
+from .models import Invoice, InvoiceItem, invoice_totals
+
+# Item changes reach the lists through Invoice.recalculate_totals()
+track_clinic_changes(Invoice)
+
+
+@receiver(pre_save, sender=Invoice)
+def set_invoice_clinic(sender, instance, raw=False, **kwargs):
+    if raw or not instance.order_id:
+        return
+    instance.clinic_id = Order.objects.filter(pk=instance.order_id).values_list('clinic_id', flat=True).first()
+
+
+@receiver(pre_save, sender=Invoice)
+def set_new_invoice_totals(sender, instance, raw=False, **kwargs):
+    """A new invoice has no items yet, so it starts at the shipping cost."""
+    if raw or not instance._state.adding:
+        return
+    instance.subtotal, instance.tax, instance.total = invoice_totals(None)
+
+
+@receiver(post_save, sender=Order)
+def sync_invoice_clinic(sender, instance, raw=False, **kwargs):
+    """Move an order's invoices along when the order changes clinic."""
+    update_fields = kwargs.get('update_fields')
+    if raw or kwargs.get('created') or (update_fields and 'clinic' not in update_fields):
+        return
+    Invoice.objects.filter(order=instance).exclude(clinic_id=instance.clinic_id).update(clinic_id=instance.clinic_id)
+
+
+@receiver(pre_save, sender=InvoiceItem)
+def remember_item_invoice(sender, instance, raw=False, **kwargs):
+    """Note the invoice an existing item is moved away from, so both get new totals."""
+    instance._previous_invoice_id = None
+    if raw or instance._state.adding:
+        return
+    instance._previous_invoice_id = (
+        InvoiceItem.objects.filter(pk=instance.pk).values_list('invoice_id', flat=True).first()
+    )
+
+
+@receiver(post_save, sender=InvoiceItem)
+@receiver(post_delete, sender=InvoiceItem)
+def update_invoice_totals(sender, instance, raw=False, **kwargs):
+    """
+    Recalculate the stored totals of the item's invoice.
+
+    ``QuerySet.update()`` and ``bulk_create()`` bypass this; call
+    ``Invoice.recalculate_totals()`` afterwards, or repair with
+    ``manage.py verify_invoice_totals --fix``.
+    """
+    if raw:
+        return
+    invoice_ids = {instance.invoice_id, getattr(instance, '_previous_invoice_id', None)}
+    for invoice in Invoice.objects.filter(pk__in=invoice_ids - {None}):
+        invoice.recalculate_totals()
@@ -1,3 +1,161 @@
+import datetime
+from decimal import Decimal
+from importlib import import_module
+from io import StringIO
+
+from django.apps import apps
+from django.core.management import CommandError, call_command
 from django.test import TestCase
 
-# Create your tests here.
+from core.benchmarks import create_clinic_user
+from orders.models import Order
+from prescriptions.benchmarks import create_prescriptions
+from prescriptions.models import Prescription
+from .models import Invoice, InvoiceItem
+
+
+def create_invoice(order, number):
+    return Invoice.objects.create(
+        user=order.user, order=order, invoice_number=number, amount=Decimal('0.00'),
+        due_date=datetime.date(2030, 1, 1)
+    )
+
+
+class InvoiceTotalsTests(TestCase):
+    """
+    An invoice's stored subtotal, tax and total follow its items: 9% tax
+    on the items plus flat shipping of 10.00.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        _, user = create_clinic_user()
+        order = Order.objects.create(user=user)
+        cls.invoice = create_invoice(order, 'INV-1')
+        cls.other = create_invoice(order, 'INV-2')
+
+    def assertTotals(self, invoice, subtotal, tax, total):
+        invoice.refresh_from_db()
+        self.assertEqual(
+            (invoice.subtotal, invoice.tax, invoice.total),
+            (Decimal(subtotal), Decimal(tax), Decimal(total))
+        )
+
+    def drift(self, invoice):
+        # QuerySet.update() bypasses the signals
+        Invoice.objects.filter(pk=invoice.pk).update(subtotal=0, tax=0, total=0)
+
+    def test_item_create_update_delete(self):
+        self.assertTotals(self.invoice, '0.00', '0.00', '10.00')
+
+        item = InvoiceItem.objects.create(invoice=self.invoice, description='Orthotic', price='45.50', quantity=2)
+        self.assertTotals(self.invoice, '91.00', '8.19', '109.19')
+
+        item.quantity = 3
+        item.save()
+        # Tax is rounded half to even
+        self.assertTotals(self.invoice, '136.50', '12.28', '158.78')
+
+        InvoiceItem.objects.create(invoice=self.invoice, description='Cover', price='0.10')
+        self.assertTotals(self.invoice, '136.60', '12.29', '158.89')
+
+        item.delete()
+        self.assertTotals(self.invoice, '0.10', '0.01', '10.11')
+        self.assertTotals(self.other, '0.00', '0.00', '10.00')
+
+    def test_item_moved_between_invoices(self):
+        InvoiceItem.objects.create(invoice=self.invoice, description='Cover', price='5.00')
+        item = InvoiceItem.objects.create(invoice=self.invoice, description='Orthotic', price='100.00')
+        self.assertTotals(self.invoice, '105.00', '9.45', '124.45')
+
+        item.invoice = self.other
+        item.save()
+        self.assertTotals(self.invoice, '5.00', '0.45', '15.45')
+        self.assertTotals(self.other, '100.00', '9.00', '119.00')
+
+        # A fresh instance, as a form or serializer would load it
+        item = InvoiceItem.objects.get(pk=item.pk)
+        item.invoice = self.invoice
+        item.save()
+        self.assertTotals(self.invoice, '105.00', '9.45', '124.45')
+        self.assertTotals(self.other, '0.00', '0.00', '10.00')
+
+    def test_recalculate_totals(self):
+        InvoiceItem.objects.create(invoice=self.invoice, description='Orthotic', price='20.00', quantity=2)
+        self.drift(self.invoice)
+        self.assertTotals(self.invoice, '0.00', '0.00', '0.00')
+
+        self.invoice.recalculate_totals()
+        self.assertEqual(self.invoice.total, Decimal('53.60'))
+        self.assertTotals(self.invoice, '40.00', '3.60', '53.60')
+
+    def test_migration_backfill(self):
+        InvoiceItem.objects.create(invoice=self.invoice, description='Orthotic', price='33.33', quantity=3)
+        self.drift(self.invoice)
+        self.drift(self.other)
+
+        migration = import_module('invoices.migrations.0007_invoice_totals')
+        migration.backfill_invoice_totals(apps, None)
+        self.assertTotals(self.invoice, '99.99', '9.00', '118.99')
+        # Invoices without items still pay for shipping
+        self.assertTotals(self.other, '0.00', '0.00', '10.00')
+
+    def test_verify_invoice_totals(self):
+        InvoiceItem.objects.create(invoice=self.invoice, description='Orthotic', price='10.00')
+        self.drift(self.invoice)
+
+        out = StringIO()
+        call_command('verify_invoice_totals', stdout=out)
+        self.assertIn('INV-1: stored 0.00/0.00/0.00, items give 10.00/0.90/20.90', out.getvalue())
+        self.assertNotIn('INV-2', out.getvalue())
+        self.assertIn('1 of 2 invoices have drifted totals', out.getvalue())
+        with self.assertRaisesMessage(CommandError, '1 of 2 invoices have drifted totals'):
+            call_command('verify_invoice_totals', '--strict', stdout=StringIO())
+        self.assertTotals(self.invoice, '0.00', '0.00', '0.00')
+
+        out = StringIO()
+        call_command('verify_invoice_totals', '--fix', stdout=out)
+        self.assertIn('Recalculated 1 of 2 invoices', out.getvalue())
+        self.assertTotals(self.invoice, '10.00', '0.90', '20.90')
+
+        out = StringIO()
+        call_command('verify_invoice_totals', '--strict', stdout=out)
+        self.assertIn('0 of 2 invoices have drifted totals', out.getvalue())
+
+
+class InvoiceClinicTests(TestCase):
+    """An invoice belongs to its order's clinic and moves with it."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.clinic, cls.user = create_clinic_user()
+        other_patient, _ = create_prescriptions(1)
+        cls.other_prescription = Prescription.objects.get(patient=other_patient)
+        cls.other_clinic_id = other_patient.clinic_id
+
+    def clinic_of(self, invoice):
+        return Invoice.objects.values_list('clinic_id', flat=True).get(pk=invoice.pk)
+
+    def test_follows_its_order(self):
+        order = Order.objects.create(user=self.user)
+        invoice = create_invoice(order, 'INV-1')
+        self.assertEqual(self.clinic_of(invoice), self.clinic.pk)
+
+        order.prescriptions.add(self.other_prescription)
+        self.assertEqual(self.clinic_of(invoice), self.other_clinic_id)
+
+        order.clinic = self.clinic
+        order.save()
+        self.assertEqual(self.clinic_of(invoice), self.clinic.pk)
+        # Saves that leave the clinic alone do not touch the invoices
+        Invoice.objects.filter(pk=invoice.pk).update(clinic=None)
+        order.save(update_fields=['notes'])
+        self.assertIsNone(self.clinic_of(invoice))
+
+    def test_migration_backfill(self):
+        invoice = create_invoice(Order.objects.create(user=self.user), 'INV-1')
+        Invoice.objects.update(clinic=None)
+
+        migration = import_module('invoices.migrations.0005_clinic')
+        migration.backfill_invoice_clinic(apps, None)
+        self.assertEqual(self.clinic_of(invoice), self.clinic.pk)
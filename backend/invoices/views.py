@@ -1,6 +1,7 @@
 """
 Views for the invoices app.
 """
+from django.db.models import Prefetch
 from django.shortcuts import render, get_object_or_404
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
@@ -8,13 +9,16 @@ from rest_framework.response import Response
 from django.http import HttpResponse, FileResponse
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
+from core.caching import ClinicCachedListMixin
+from core.datatables import DataTablesOrderingFilter, DataTablesSearchFilter
+from core.pagination import DataTablesListPagination
+from orders.models import Order
 from .models import Invoice, InvoiceItem
 from .serializers import InvoiceSerializer, InvoiceItemSerializer, InvoiceDetailSerializer
 import logging
 from datetime import datetime
 import os
 import sys
-from users.models import Clinic
 try:
     import weasyprint
     HTML_TO_PDF_AVAILABLE = True
@@ -26,12 +30,17 @@ logger = logging.getLogger(__name__)
 
 # Create your views here.
 
-class InvoiceViewSet(viewsets.ModelViewSet):
+class InvoiceViewSet(ClinicCachedListMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing invoices.
     """
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = InvoiceSerializer
+    filter_backends = [DataTablesSearchFilter, DataTablesOrderingFilter]
+    pagination_class = DataTablesListPagination
+    search_fields = ['invoice_number', 'status', 'notes']
+    datatables_columns = {'id': 'id', 'order.id': 'order_id', 'status': 'status',
+                          'total_amount': 'total', 'created_at': 'created_at'}
     
     def get_queryset(self):
         """
@@ -39,12 +48,16 @@ class InvoiceViewSet(viewsets.ModelViewSet):
         """
         user = self.request.user
         if user.is_staff:
-            return Invoice.objects.all().order_by('-created_at')
-        elif hasattr(user, 'clinic') and user.clinic:
-            return Invoice.objects.filter(
-                order__prescriptions__patient__clinic=user.clinic
-            ).distinct().order_by('-created_at')
-        return Invoice.objects.none()
+            queryset = Invoice.objects.all()
+        else:
+            queryset = Invoice.objects.for_clinic(self.request.tenant)
+        if self.action == 'retrieve':
+            # InvoiceDetailSerializer nests the items and the full order
+            queryset = queryset.prefetch_related(
+                'items',
+                Prefetch('order', queryset=Order.objects.with_summary().with_prescriptions()),
+            )
+        return queryset.order_by('-created_at')
     
     def get_serializer_class(self):
         """
@@ -56,18 +69,10 @@ class InvoiceViewSet(viewsets.ModelViewSet):
     
     def list(self, request, *args, **kwargs):
         """
-        Override list method to handle DataTables request and return data in the expected format.
+        List invoices in the DataTables server-side format, one page at a time.
         """
         try:
-            queryset = self.get_queryset()
-            serializer = self.get_serializer(queryset, many=True)
-            data = {
-                'data': serializer.data,  # DataTables expects data in a 'data' key
-                'recordsTotal': queryset.count(),
-                'recordsFiltered': queryset.count(),
-                'draw': request.GET.get('draw', 1)
-            }
-            return Response(data)
+            return super().list(request, *args, **kwargs)
         except Exception as e:
             logger.error(f"Error in invoice list view: {str(e)}")
             return Response(
@@ -130,10 +135,4 @@ class InvoiceItemViewSet(viewsets.ModelViewSet):
         if user.is_staff:
             return InvoiceItem.objects.all()
         
-        # Get the user's clinic
-        clinic = Clinic.objects.filter(users=user).first()
-        if clinic:
-            return InvoiceItem.objects.filter(
-                invoice__order__prescription__patient__clinic=clinic
-            )
-        return InvoiceItem.objects.none()
+        return InvoiceItem.objects.for_clinic(self.request.tenant)
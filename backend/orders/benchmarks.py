@@ -0,0 +1,43 @@
+"""
+Benchmarks for the order list endpoint, see ``manage.py benchmark``.
+"""
+from core.benchmarks import api_get, benchmark, rendering_benchmark, serialization_benchmark, serialize
+from orders.models import Order
+from orders.serializers import OrderSerializer
+from prescriptions.benchmarks import create_prescriptions
+from prescriptions.models import Prescription
+
+
+def create_orders(rows, prescriptions_per_order=2):
+    """Create ``rows`` orders, each for its own prescriptions, and return their user."""
+    patient, user = create_prescriptions(rows * prescriptions_per_order)
+    prescriptions = list(Prescription.objects.filter(patient=patient).values_list('pk', flat=True))
+    orders = Order.objects.bulk_create(
+        [Order(user=user, clinic=patient.clinic) for _ in range(rows)], batch_size=1000
+    )
+    Order.prescriptions.through.objects.bulk_create([
+        Order.prescriptions.through(order_id=order.pk, prescription_id=prescription_id)
+        for index, order in enumerate(orders)
+        for prescription_id in prescriptions[index * prescriptions_per_order:(index + 1) * prescriptions_per_order]
+    ], batch_size=1000)
+    return user
+
+
+@benchmark('orders.list', max_queries=3)
+def order_list(rows):
+    user = create_orders(rows)
+    # One DataTables page with every order, capped at 500
+    return api_get(user, f'/api/orders/?draw=1&start=0&length={min(rows, 500)}')
+
+
+
+@serialization_benchmark('serialize.orders.list')
+def serialize_order_list(rows):
+    user = create_orders(rows)
+    orders = list(Order.objects.filter(user=user).with_summary().with_prescriptions())
+    return serialize(OrderSerializer, orders, many=True)
+
+
+@rendering_benchmark('render.orders.list')
+def render_order_list(rows):
+    return serialize_order_list(rows)()
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:24
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+def backfill_order_clinic(apps, schema_editor):
+    Order = apps.get_model('orders', 'Order')
+    User = apps.get_model('users', 'User')
+    OrderPrescription = Order.prescriptions.through
+
+    # The clinic of the first prescription's patient, as orders.signals does
+    Order.objects.update(clinic_id=Subquery(
+        OrderPrescription.objects.filter(order_id=OuterRef('pk'))
+        .order_by('id')
+        .values('prescription__patient__clinic_id')[:1]
+    ))
+    # Orders without prescriptions belong to the ordering user's clinic
+    Order.objects.filter(clinic__isnull=True).update(clinic_id=Subquery(
+        User.objects.filter(pk=OuterRef('user_id')).values('clinic_id')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+        ('orders', '0004_created_at_index'),
+        ('prescriptions', '0008_created_at_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='clinic',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='orders', to='users.clinic'),
+        ),
+        migrations.RunPython(backfill_order_clinic, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0006_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_clinic_created_idx',
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['clinic', 'created_at', 'id'], name='order_clinic_created_idx'),
+        ),
+    ]
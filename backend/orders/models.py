@@ -2,12 +2,47 @@
 Models for the orders app.
 """
 import uuid
+from decimal import Decimal
 from django.db import models
+from django.db.models import Count, F, OuterRef, Prefetch, Subquery, Value
+from django.db.models.functions import Concat
 from django.contrib.auth import get_user_model
+from core.tenancy import ClinicScopedQuerySet
 from prescriptions.models import Prescription
 
 User = get_user_model()
 
+# Base price of $100 per prescription
+PRESCRIPTION_PRICE = Decimal('100.00')
+
+
+class OrderQuerySet(ClinicScopedQuerySet):
+
+    def with_summary(self):
+        """
+        Annotate ``prescriptions_count``, ``order_total`` and
+        ``first_patient_name`` so serializing an order needs no extra queries.
+        """
+        first_prescription = Prescription.objects.filter(orders=OuterRef('pk')).order_by('pk')
+        return self.annotate(
+            prescriptions_count=Count('prescriptions', distinct=True),
+            first_patient_name=Subquery(
+                first_prescription.annotate(
+                    name=Concat('patient__first_name', Value(' '), 'patient__last_name')
+                ).values('name')[:1]
+            ),
+        ).annotate(
+            order_total=F('prescriptions_count') * Value(PRESCRIPTION_PRICE, output_field=models.DecimalField()),
+        )
+
+    def with_prescriptions(self):
+        """Prefetch the prescriptions shown by ``PrescriptionListSerializer``."""
+        return self.prefetch_related(Prefetch(
+            'prescriptions',
+            queryset=Prescription.objects.select_related('patient', 'clinician', 'template', 'status'),
+        ))
+
+
 class Order(models.Model):
     """
     Model representing an order for one or more prescriptions.
@@ -23,17 +58,28 @@ class Order(models.Model):
     
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders')
+    # Clinic of the ordered prescriptions' patients, kept in sync by orders.signals
+    clinic = models.ForeignKey('users.Clinic', on_delete=models.SET_NULL, null=True, blank=True, related_name='orders')
     prescriptions = models.ManyToManyField(Prescription, related_name='orders')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     notes = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = OrderQuerySet.as_manager()
+    
     def __str__(self):
         return f"Order {self.id} ({self.status})"
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination, see core.pagination.KeysetPagination
+            models.Index(fields=['created_at', 'id'], name='order_created_idx'),
+            # A clinic's or a user's orders, newest first
+            models.Index(fields=['clinic', 'created_at', 'id'], name='order_clinic_created_idx'),
+            models.Index(fields=['user', 'created_at'], name='order_user_created_idx'),
+        ]
         
     @property
     def total_amount(self):
@@ -41,4 +87,15 @@ class Order(models.Model):
         Calculate the total amount for this order.
         In a real implementation, this would include individual prescription prices.
         """
-        return self.prescriptions.count() * 100.00  # Base price of $100 per prescription
+        total = getattr(self, 'order_total', None)
+        if total is None:
+            total = self.prescriptions.count() * PRESCRIPTION_PRICE
+        return total
+    
+    @property
+    def patient_name(self):
+        """Name of the patient on the first prescription, or 'N/A'."""
+        if hasattr(self, 'first_patient_name'):
+            return self.first_patient_name or 'N/A'
+        first_prescription = self.prescriptions.select_related('patient').order_by('pk').first()
+        return first_prescription.patient.full_name if first_prescription else 'N/A'
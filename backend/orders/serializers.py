@@ -2,6 +2,7 @@
 Serializers for the orders app.
 """
 from rest_framework import serializers
+from core.serialization import CompiledReadMixin
 from .models import Order
 from prescriptions.models import Prescription
 from prescriptions.serializers import PrescriptionSerializer, PrescriptionListSerializer
@@ -20,12 +21,12 @@ class OrderItemSerializer(serializers.Serializer):
     orthotic_type = serializers.CharField()
     price = serializers.DecimalField(max_digits=10, decimal_places=2)
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(CompiledReadMixin, serializers.ModelSerializer):
     """
     Serializer for orders.
     """
     prescriptions = PrescriptionListSerializer(many=True, read_only=True, required=False)
-    patient_name = serializers.SerializerMethodField(required=False)
+    patient_name = serializers.CharField(read_only=True)
     total_amount = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True, required=False)
     prescription_ids = serializers.ListField(write_only=True, required=False, allow_empty=True)
     status = serializers.CharField(required=False, default='pending')
@@ -45,13 +46,6 @@ class OrderSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'created_at']
 
-    def get_patient_name(self, obj):
-        """Get the patient name from the first prescription."""
-        first_prescription = obj.prescriptions.first()
-        if first_prescription and first_prescription.patient:
-            return first_prescription.patient.full_name
-        return 'N/A'
-
     def create(self, validated_data):
         """
         Create an order with the provided prescription IDs.
@@ -76,12 +70,32 @@ class OrderSerializer(serializers.ModelSerializer):
             
             return order
 
-class OrderDetailSerializer(serializers.ModelSerializer):
+class BulkOrderGroupSerializer(serializers.Serializer):
+    """
+    One order of a bulk submission.
+    """
+    prescription_ids = serializers.ListField(child=serializers.UUIDField(), allow_empty=False)
+    notes = serializers.CharField(required=False, allow_blank=True, allow_null=True, default='')
+
+
+class BulkOrderSerializer(serializers.Serializer):
+    """
+    A batch of orders for ``POST /api/orders/bulk/``. Groups are validated
+    one by one by the view, so a bad group does not reject the others.
+    """
+    MAX_ORDERS = 500
+
+    orders = serializers.ListField(
+        child=serializers.DictField(), allow_empty=False, max_length=MAX_ORDERS
+    )
+
+
+class OrderDetailSerializer(CompiledReadMixin, serializers.ModelSerializer):
     """
     Detailed serializer for orders, including prescription details.
     """
     prescriptions = PrescriptionListSerializer(many=True, read_only=True)
-    patient_name = serializers.SerializerMethodField()
+    patient_name = serializers.CharField(read_only=True)
     total_amount = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
     shipping_method = serializers.CharField(default="Standard Shipping", read_only=True)
     shipping_address = serializers.CharField(read_only=True)
@@ -102,13 +116,6 @@ class OrderDetailSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'created_at']
     
-    def get_patient_name(self, obj):
-        """Get the patient name from the first prescription."""
-        first_prescription = obj.prescriptions.first()
-        if first_prescription and first_prescription.patient:
-            return first_prescription.patient.full_name
-        return 'N/A'
-    
     def create(self, validated_data):
         """
         Create an order with the provided prescription IDs.
@@ -0,0 +1,55 @@
+"""
+Signal handlers for the orders app.
+"""
+from django.db.models.signals import m2m_changed, pre_save
+from django.dispatch import receiver
+
+from core.caching import invalidate_clinic_cache, track_clinic_changes
+from .models import Order
+
+track_clinic_changes(Order)
+
+
+def prescription_clinic_id(order):
+    """The clinic of the patient on the order's first prescription, if any."""
+    return (
+        Order.prescriptions.through.objects
+        .filter(order_id=order.pk)
+        .order_by('id')
+        .values_list('prescription__patient__clinic_id', flat=True)
+        .first()
+    )
+
+
+@receiver(pre_save, sender=Order)
+def set_order_clinic(sender, instance, raw=False, **kwargs):
+    """New orders belong to the ordering user's clinic until prescriptions are added."""
+    if raw or instance.clinic_id is not None:
+        return
+    instance.clinic_id = instance.user.clinic_id if instance.user_id else None
+
+
+@receiver(m2m_changed, sender=Order.prescriptions.through)
+def sync_order_clinic(sender, instance, action, reverse, pk_set, **kwargs):
+    """Follow the prescriptions' clinic whenever the order's prescriptions change."""
+    if reverse and action == 'pre_clear':
+        # prescription.orders.clear() does not say which orders it touched
+        instance._cleared_order_ids = list(instance.orders.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # prescription.orders.add(...) and friends: instance is the prescription
+        if action == 'post_clear':
+            pk_set = getattr(instance, '_cleared_order_ids', [])
+        orders = Order.objects.filter(pk__in=pk_set)
+    else:
+        orders = [instance]
+    for order in orders:
+        clinic_id = prescription_clinic_id(order)
+        if clinic_id is not None and clinic_id != order.clinic_id:
+            order.clinic_id = clinic_id
+            order.save(update_fields=['clinic', 'updated_at'])
+        else:
+            # The order lists show the prescriptions
+            invalidate_clinic_cache(order.clinic_id)
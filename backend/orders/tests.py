@@ -1,3 +1,174 @@
+from decimal import Decimal
+from importlib import import_module
+
+from django.apps import apps
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from core.benchmarks import create_clinic_user, measure
+from prescriptions.benchmarks import create_prescriptions
+from prescriptions.models import Prescription
+from .benchmarks import create_orders, order_list
+from .models import Order
+
+
+class OrderListQueryBudgetTests(TestCase):
+    """
+    A page of orders is served from annotations and prefetches, so its
+    query count stays within the ``orders.list`` benchmark's budget
+    however many orders and prescriptions there are.
+    """
+
+    def test_list_budget(self):
+        queries, _ = measure(order_list, 500, repeat=1)
+        self.assertLessEqual(queries, order_list.max_queries)
+
+    def test_summary_annotations(self):
+        create_orders(3, prescriptions_per_order=2)
+        Order.objects.create(user=Order.objects.first().user)
+        with CaptureQueriesContext(connection) as queries:
+            orders = list(Order.objects.with_summary())
+            summaries = [(order.total_amount, order.patient_name) for order in orders]
+        self.assertEqual(len(queries), 1)
+        self.assertCountEqual(summaries, [
+            (Decimal('200.00'), 'Benchmark Patient'),
+            (Decimal('200.00'), 'Benchmark Patient'),
+            (Decimal('200.00'), 'Benchmark Patient'),
+            (Decimal('0.00'), 'N/A'),
+        ])
+
+
+class BulkOrderTests(TestCase):
+    """
+    ``POST /api/orders/bulk/`` creates the valid groups of a batch and
+    reports the others, without letting one bad group reject the rest.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        patient, cls.user = create_prescriptions(3)
+        cls.ids = [str(pk) for pk in Prescription.objects.filter(patient=patient).values_list('pk', flat=True)]
+        other_patient, _ = create_prescriptions(1)
+        cls.other_clinic_id = str(Prescription.objects.get(patient=other_patient).pk)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def submit(self, *groups):
+        return self.client.post('/api/orders/bulk/', {'orders': list(groups)}, format='json')
+
+    def test_all_created(self):
+        response = self.submit({'prescription_ids': self.ids[:2], 'notes': 'Rush'}, {'prescription_ids': self.ids[2:]})
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual((response.data['created'], response.data['failed']), (2, 0))
+        order = Order.objects.get(pk=response.data['results'][0]['id'])
+        self.assertEqual(order.notes, 'Rush')
+        self.assertCountEqual([str(pk) for pk in order.prescriptions.values_list('pk', flat=True)], self.ids[:2])
+        self.assertEqual(response.data['results'][0]['total_amount'], '200.00')
+
+    def test_partial_failure(self):
+        response = self.submit({'prescription_ids': self.ids[:1]}, {'prescription_ids': ['not-a-uuid']})
+        self.assertEqual(response.status_code, 207, response.content)
+        self.assertEqual((response.data['created'], response.data['failed']), (1, 1))
+        self.assertTrue(response.data['results'][0]['success'])
+        self.assertEqual(response.data['results'][1]['index'], 1)
+        self.assertFalse(response.data['results'][1]['success'])
+        self.assertIn('prescription_ids', response.data['results'][1]['errors'])
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_other_clinics_prescriptions(self):
+        response = self.submit(
+            {'prescription_ids': self.ids[:1]},
+            {'prescription_ids': [self.ids[1], self.other_clinic_id]},
+        )
+        self.assertEqual(response.status_code, 207, response.content)
+        errors = response.data['results'][1]['errors']['prescription_ids']
+        self.assertIn(self.other_clinic_id, errors[0])
+        self.assertNotIn(self.ids[1], errors[0])
+        self.assertFalse(Order.objects.filter(prescriptions=self.other_clinic_id).exists())
+
+        response = self.submit({'prescription_ids': [self.other_clinic_id]})
+        self.assertEqual(response.status_code, 400, response.content)
+        self.assertEqual(response.data['created'], 0)
+
+    def test_duplicate_ids(self):
+        response = self.submit({'prescription_ids': [self.ids[0], self.ids[0], self.ids[1]]})
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.data['results'][0]['prescriptions_count'], 2)
+        self.assertEqual(Order.objects.get(pk=response.data['results'][0]['id']).prescriptions.count(), 2)
+
+    def test_empty_groups(self):
+        response = self.submit({'prescription_ids': []}, {}, {'prescription_ids': self.ids[:1]})
+        self.assertEqual(response.status_code, 207, response.content)
+        self.assertEqual([result['success'] for result in response.data['results']], [False, False, True])
+
+        response = self.submit()
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('orders', response.data)
+
+    def test_null_notes(self):
+        response = self.submit({'prescription_ids': self.ids[:1], 'notes': None})
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(Order.objects.get(pk=response.data['results'][0]['id']).notes, '')
+
+
+class OrderClinicTests(TestCase):
+    """
+    An order belongs to the clinic of its first prescription's patient,
+    or to the ordering user's clinic while it has no prescriptions.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient, cls.user = create_prescriptions(1)
+        cls.prescription = Prescription.objects.get(patient=cls.patient)
+        other_patient, _ = create_prescriptions(1)
+        cls.other_prescription = Prescription.objects.get(patient=other_patient)
+        cls.clinic_id = cls.patient.clinic_id
+        cls.other_clinic_id = other_patient.clinic_id
+
+    def clinic_of(self, order):
+        return Order.objects.values_list('clinic_id', flat=True).get(pk=order.pk)
+
+    def test_new_order_takes_the_users_clinic(self):
+        self.assertEqual(self.clinic_of(Order.objects.create(user=self.user)), self.clinic_id)
+        _, user = create_clinic_user()
+        order = Order.objects.create(user=user)
+        order.prescriptions.add(self.prescription)
+        self.assertEqual(self.clinic_of(order), self.clinic_id)
+
+    def test_follows_the_first_prescription(self):
+        order = Order.objects.create(user=self.user)
+        order.prescriptions.add(self.other_prescription)
+        self.assertEqual(self.clinic_of(order), self.other_clinic_id)
+        order.prescriptions.add(self.prescription)
+        self.assertEqual(self.clinic_of(order), self.other_clinic_id)
+
+        order.prescriptions.remove(self.other_prescription)
+        self.assertEqual(self.clinic_of(order), self.clinic_id)
+        # Without prescriptions the order keeps its last clinic
+        order.prescriptions.clear()
+        self.assertEqual(self.clinic_of(order), self.clinic_id)
+
+    def test_changes_from_the_prescription_side(self):
+        order = Order.objects.create(user=self.user)
+        self.other_prescription.orders.add(order)
+        self.assertEqual(self.clinic_of(order), self.other_clinic_id)
+
+        self.prescription.orders.add(order)
+        self.other_prescription.orders.clear()
+        self.assertEqual(self.clinic_of(order), self.clinic_id)
+
+    def test_migration_backfill(self):
+        with_prescription = Order.objects.create(user=self.user)
+        with_prescription.prescriptions.add(self.other_prescription)
+        empty = Order.objects.create(user=self.user)
+        Order.objects.update(clinic=None)
 
-# Create your tests here.
+        migration = import_module('orders.migrations.0005_clinic')
+        migration.backfill_order_clinic(apps, None)
+        self.assertEqual(self.clinic_of(with_prescription), self.other_clinic_id)
+        self.assertEqual(self.clinic_of(empty), self.clinic_id)
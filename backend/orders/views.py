@@ -1,38 +1,54 @@
 """
 Views for the orders app.
 """
+from django.db import transaction
 from django.shortcuts import render
+from drf_yasg.utils import swagger_auto_schema
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from .models import Order
-from .serializers import OrderSerializer, OrderDetailSerializer
+from core.caching import ClinicCachedListMixin, invalidate_clinic_cache
+from core.datatables import DataTablesOrderingFilter, DataTablesSearchFilter
+from core.pagination import DataTablesListPagination
+from prescriptions.models import Prescription
+from .models import Order, PRESCRIPTION_PRICE
+from .serializers import BulkOrderGroupSerializer, BulkOrderSerializer, OrderSerializer, OrderDetailSerializer
 import logging
 
 logger = logging.getLogger(__name__)
 
 # Create your views here.
 
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(ClinicCachedListMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing orders.
     """
     permission_classes = [IsAuthenticated]
     serializer_class = OrderSerializer
+    filter_backends = [DataTablesSearchFilter, DataTablesOrderingFilter]
+    pagination_class = DataTablesListPagination
+    search_fields = ['status', 'notes', 'prescriptions__patient__first_name', 'prescriptions__patient__last_name']
+    datatables_columns = {
+        'id': 'id', 'patient_name': 'first_patient_name', 'prescriptions': 'prescriptions_count',
+        'status': 'status', 'created_at': 'created_at',
+    }
     
     def get_queryset(self):
         """
         Filter orders to only include those belonging to the current user's clinic.
+        
+        Reads annotate the count, total and patient name and prefetch the
+        nested prescriptions, so a page of orders costs a fixed number of queries.
         """
         user = self.request.user
         if user.is_staff:
-            return Order.objects.all().order_by('-created_at')
-        elif hasattr(user, 'clinic') and user.clinic:
-            return Order.objects.filter(
-                prescriptions__patient__clinic=user.clinic
-            ).distinct().order_by('-created_at')
-        return Order.objects.none()
+            queryset = Order.objects.all()
+        else:
+            queryset = Order.objects.for_clinic(self.request.tenant)
+        if self.action in ('list', 'retrieve'):
+            queryset = queryset.with_summary().with_prescriptions()
+        return queryset.order_by('-created_at')
     
     def get_serializer_class(self):
         """
@@ -44,18 +60,10 @@ class OrderViewSet(viewsets.ModelViewSet):
     
     def list(self, request, *args, **kwargs):
         """
-        Override list method to handle DataTables request and return data in the expected format.
+        List orders in the DataTables server-side format, one page at a time.
         """
         try:
-            queryset = self.get_queryset()
-            serializer = self.get_serializer(queryset, many=True)
-            data = {
-                'data': serializer.data,  # DataTables expects data in a 'data' key
-                'recordsTotal': queryset.count(),
-                'recordsFiltered': queryset.count(),
-                'draw': request.GET.get('draw', 1)
-            }
-            return Response(data)
+            return super().list(request, *args, **kwargs)
         except Exception as e:
             logger.error(f"Error in order list view: {str(e)}")
             return Response(
@@ -117,3 +125,86 @@ class OrderViewSet(viewsets.ModelViewSet):
         
         logger.error(f"Error creating order: {serializer.errors}")
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    @swagger_auto_schema(
+        request_body=BulkOrderSerializer,
+        operation_description="Create one order per group of prescription ids in a single transaction. "
+                              "Groups that fail validation are reported in the results and not created."
+    )
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Submit a batch of orders, e.g. a clinic's end-of-day prescriptions.
+        
+        Responds 201 when every group was created, 207 when only some were
+        and 400 when none were; ``results`` has one entry per group.
+        """
+        serializer = BulkOrderSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        results, groups = [], []
+        for index, data in enumerate(serializer.validated_data['orders']):
+            group = BulkOrderGroupSerializer(data=data)
+            if group.is_valid():
+                # Repeated ids in a group would violate the M2M unique constraint
+                prescription_ids = list(dict.fromkeys(group.validated_data['prescription_ids']))
+                groups.append((index, prescription_ids, group.validated_data['notes'] or ''))
+                results.append(None)
+            else:
+                results.append({'index': index, 'success': False, 'errors': group.errors})
+        
+        # Check clinic ownership of every requested prescription in one query
+        prescriptions = Prescription.objects.filter(pk__in={pk for _, ids, _ in groups for pk in ids})
+        if not request.user.is_staff:
+            prescriptions = prescriptions.for_clinic(request.tenant)
+        clinic_ids = dict(prescriptions.values_list('pk', 'patient__clinic_id'))
+        
+        orders, prescription_links = [], []
+        for index, prescription_ids, notes in groups:
+            missing = [str(pk) for pk in prescription_ids if pk not in clinic_ids]
+            if missing:
+                results[index] = {
+                    'index': index,
+                    'success': False,
+                    'errors': {'prescription_ids': [f"Prescriptions not found: {', '.join(missing)}"]},
+                }
+                continue
+            # Like orders.signals, the order follows its first prescription's clinic
+            order = Order(user=request.user, clinic_id=clinic_ids[prescription_ids[0]], notes=notes)
+            orders.append(order)
+            prescription_links.extend(
+                Order.prescriptions.through(order_id=order.pk, prescription_id=pk) for pk in prescription_ids
+            )
+            results[index] = {
+                'index': index,
+                'success': True,
+                'id': str(order.pk),
+                'prescriptions_count': len(prescription_ids),
+                'total_amount': str(len(prescription_ids) * PRESCRIPTION_PRICE),
+            }
+        
+        try:
+            with transaction.atomic():
+                Order.objects.bulk_create(orders)
+                Order.prescriptions.through.objects.bulk_create(prescription_links)
+                for clinic_id in {order.clinic_id for order in orders}:
+                    invalidate_clinic_cache(clinic_id)
+        except Exception as e:
+            logger.error(f"Error creating bulk orders: {str(e)}")
+            return Response(
+                {"error": "An error occurred while creating the orders."},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        
+        logger.info(f"User {request.user.id} created {len(orders)} of {len(results)} bulk orders")
+        if not orders:
+            response_status = status.HTTP_400_BAD_REQUEST
+        elif len(orders) < len(results):
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_201_CREATED
+        return Response(
+            {'created': len(orders), 'failed': len(results) - len(orders), 'results': results},
+            status=response_status
+        )
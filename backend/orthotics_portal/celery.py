@@ -0,0 +1,15 @@
+"""
+Celery application for orthotics_portal.
+
+Workers are started with ``celery -A orthotics_portal worker``. Tasks are
+discovered from each installed app's ``tasks`` module.
+"""
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'orthotics_portal.settings')
+
+app = Celery('orthotics_portal')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
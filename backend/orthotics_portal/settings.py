@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 import os
 from pathlib import Path
 from datetime import timedelta
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -68,6 +69,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.tenancy.TenantMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -176,13 +178,23 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.JWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
+    # orjson in place of the standard library's json, see core.renderers
+    'DEFAULT_RENDERER_CLASSES': (
+        'core.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'core.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
 }
 
 # JWT settings
@@ -195,6 +207,8 @@ SIMPLE_JWT = {
 
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True  # For development only
+CORS_ALLOW_HEADERS = (*default_headers, 'upload-offset')
+CORS_EXPOSE_HEADERS = ['Upload-Offset', 'Upload-Length', 'Location', 'ETag']
 
 # Swagger settings
 SWAGGER_SETTINGS = {
@@ -214,6 +228,48 @@ SWAGGER_SETTINGS = {
 
 # File upload settings
 MAX_FILE_SIZE = int(os.environ.get('MAX_FILE_SIZE', 10 * 1024 * 1024))  # 10MB
+SCAN_MAX_FILE_SIZE = int(os.environ.get('SCAN_MAX_FILE_SIZE', 50 * 1024 * 1024))  # 50MB
+
+# Resumable uploads (see prescriptions.uploads): each PATCH carries at most
+# one chunk, and unfinished sessions are removed by clear_stale_uploads.
+UPLOAD_CHUNK_MAX_SIZE = int(os.environ.get('UPLOAD_CHUNK_MAX_SIZE', 8 * 1024 * 1024))  # 8MB
+UPLOAD_SESSION_EXPIRY_HOURS = int(os.environ.get('UPLOAD_SESSION_EXPIRY_HOURS', 24))
+
+# Scans are streamed straight to MEDIA_ROOT/scans/<foot>/ and validated
+# chunk by chunk; every other upload uses Django's default handlers.
+FILE_UPLOAD_HANDLERS = [
+    'prescriptions.upload_handlers.ScanUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
+# Cache settings
+# Redis next to the Celery broker; CACHE_URL=locmem:// (the default with
+# USE_SQLITE) keeps the cache in process, e.g. for tests. Lookup table
+# versions (prescriptions.lookups) and clinic cache generations
+# (core.caching) must be shared by every process, so production needs Redis
+CACHE_URL = os.environ.get(
+    'CACHE_URL',
+    'locmem://' if os.environ.get('USE_SQLITE', 'False').lower() == 'true' else 'redis://redis:6379/1'
+)
+if CACHE_URL.startswith('locmem://'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+            'KEY_PREFIX': 'orthotics_portal',
+            # Fall back to the database quickly when Redis is unreachable
+            'OPTIONS': {'socket_connect_timeout': 1, 'socket_timeout': 1},
+        }
+    }
+# Lifetime of cached clinic list responses, see core.caching
+CLINIC_CACHE_TIMEOUT = int(os.environ.get('CLINIC_CACHE_TIMEOUT', 300))
 
 # Celery settings
 CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://redis:6379/0')
@@ -222,9 +278,23 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+CELERY_TASK_ACKS_LATE = True
+# Tasks record their outcome on the models they touch
+CELERY_TASK_IGNORE_RESULT = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+# Run tasks inline, e.g. for tests or a development setup without a broker
+CELERY_TASK_ALWAYS_EAGER = os.environ.get('CELERY_TASK_ALWAYS_EAGER', 'False').lower() == 'true'
+CELERY_TASK_EAGER_PROPAGATES = True
+# Fail fast when the broker is down instead of blocking the request
+CELERY_BROKER_TRANSPORT_OPTIONS = {'max_retries': 2, 'interval_start': 0, 'interval_step': 0.5}
 
 # Custom user model
 AUTH_USER_MODEL = 'users.User'
+AUTHENTICATION_BACKENDS = [
+    'users.backends.ClinicModelBackend',
+    # Sessions created before ClinicModelBackend still name this backend
+    'django.contrib.auth.backends.ModelBackend',
+]
 
 # CSRF settings
 CSRF_COOKIE_SECURE = False  # Set to True in production with HTTPS
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0004_created_at_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['clinic', 'last_name', 'first_name'], name='patient_clinic_name_idx'),
+        ),
+    ]
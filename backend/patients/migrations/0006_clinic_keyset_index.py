@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0005_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['clinic', 'created_at', 'id'], name='patient_clinic_created_idx'),
+        ),
+    ]
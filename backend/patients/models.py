@@ -4,6 +4,7 @@ Models for the patients app.
 import uuid
 from django.db import models
 from django.utils.translation import gettext_lazy as _
+from core.tenancy import ClinicScopedQuerySet
 
 
 class Patient(models.Model):
@@ -31,8 +32,17 @@ class Patient(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ClinicScopedQuerySet.as_manager()
+
     class Meta:
         ordering = ['last_name', 'first_name']
+        indexes = [
+            # Keyset pagination, see core.pagination.KeysetPagination
+            models.Index(fields=['created_at', 'id'], name='patient_created_idx'),
+            # A clinic's patients, newest first, and in the default ordering
+            models.Index(fields=['clinic', 'created_at', 'id'], name='patient_clinic_created_idx'),
+            models.Index(fields=['clinic', 'last_name', 'first_name'], name='patient_clinic_name_idx'),
+        ]
         verbose_name = _('patient')
         verbose_name_plural = _('patients')
 
@@ -0,0 +1,7 @@
+"""
+Signal handlers for the patients app.
+"""
+from core.caching import track_clinic_changes
+from .models import Patient
+
+track_clinic_changes(Patient)
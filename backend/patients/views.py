@@ -15,7 +15,9 @@ from django.views.decorators.http import require_http_methods
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
-from users.models import Clinic
+from core.caching import ClinicCachedListMixin
+from core.datatables import DataTablesOrderingFilter, DataTablesSearchFilter
+from core.pagination import ListPagination
 from prescriptions.models import Template
 
 logger = logging.getLogger(__name__)
@@ -38,34 +40,29 @@ class PatientDetailView(generics.RetrieveUpdateDestroyAPIView):
 
 
 @method_decorator(csrf_exempt, name='dispatch')
-class PatientViewSet(viewsets.ModelViewSet):
+class PatientViewSet(ClinicCachedListMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows patients to be viewed or edited.
     """
     serializer_class = PatientSerializer
     permission_classes = [permissions.IsAuthenticated]
+    filter_backends = [DataTablesSearchFilter, DataTablesOrderingFilter]
+    pagination_class = ListPagination
+    search_fields = ['first_name', 'last_name', 'external_id']
+    datatables_columns = {
+        'external_id': 'external_id', 'first_name': 'first_name', 'last_name': 'last_name',
+        'date_of_birth': 'date_of_birth', 'gender': 'gender',
+    }
 
     def get_queryset(self):
         """
         Filter patients to show only those from the user's clinic.
         """
-        user = self.request.user
-        if user.is_staff:
+        if self.request.user.is_staff:
             return Patient.objects.all()
         
         # Regular users can only see patients from their clinic
-        if hasattr(user, 'clinic') and user.clinic:
-            return Patient.objects.filter(clinic=user.clinic)
-            
-        # Alternative method using the reverse relationship
-        try:
-            clinic = Clinic.objects.filter(users=user).first()
-            if clinic:
-                return Patient.objects.filter(clinic=clinic)
-        except Exception as e:
-            logger.error(f"Error getting patient queryset: {str(e)}")
-        
-        return Patient.objects.none()
+        return Patient.objects.for_clinic(self.request.tenant)
 
     def perform_create(self, serializer):
         """
@@ -73,7 +70,6 @@ class PatientViewSet(viewsets.ModelViewSet):
         """
         user = self.request.user
         logger.info(f"Creating patient for user: {user.email}")
-        logger.info(f"User clinic direct: {getattr(user, 'clinic', None)}")
         
         template_id = self.request.data.get('template_id')
         logger.info(f"Template ID from request: {template_id}")
@@ -86,19 +82,11 @@ class PatientViewSet(viewsets.ModelViewSet):
                 template_id = default_template.id
                 logger.info(f"Using default template: {template_id}")
 
-        # First try direct relationship
-        if hasattr(user, 'clinic') and user.clinic:
-            logger.info(f"Using direct clinic relationship: {user.clinic}")
-            patient = serializer.save(clinic=user.clinic)
-        else:
-            # Alternative method using the reverse relationship
-            logger.info("Direct clinic not found, trying reverse relationship")
-            clinic = Clinic.objects.filter(users=user).first()
-            logger.info(f"Found clinic through reverse lookup: {clinic}")
-            if not clinic:
-                logger.error(f"No clinic found for user {user.email}")
-                raise serializers.ValidationError({"clinic": "User does not have an associated clinic"})
-            patient = serializer.save(clinic=clinic)
+        clinic = self.request.tenant
+        if not clinic:
+            logger.error(f"No clinic found for user {user.email}")
+            raise serializers.ValidationError({"clinic": "User does not have an associated clinic"})
+        patient = serializer.save(clinic_id=clinic.pk)
 
         # Create a new prescription for the patient
         prescription = Prescription.objects.create(patient=patient, clinician=user, template_id=template_id)
@@ -144,7 +132,7 @@ class PatientViewSet(viewsets.ModelViewSet):
         Return a list of prescriptions for this patient.
         """
         patient = self.get_object()
-        prescriptions = patient.prescriptions.all()
-        from prescriptions.serializers import PrescriptionListSerializer
-        serializer = PrescriptionListSerializer(prescriptions, many=True)
+        prescriptions = patient.prescriptions.list_rows()
+        from prescriptions.serializers import PrescriptionListRowSerializer
+        serializer = PrescriptionListRowSerializer(prescriptions, many=True)
         return Response(serializer.data)
@@ -2,7 +2,8 @@ from django.contrib import admin
 from .models import (
     Template, Prescription, Scan, ClinicalMeasure, IntrinsicAdjustment,
     OffLoading, PlanterModifier, Posting, MaterialSelection, ShoeFitting,
-    DeviceOption, Attachment, PrescriptionStatus, FootType, WearTime, Activity
+    DeviceOption, Attachment, PrescriptionStatus, FootType, WearTime, Activity,
+    ScanMetadata, ScanLOD, UploadSession
 )
 
 @admin.register(PrescriptionStatus)
@@ -37,6 +38,9 @@ class ActivityAdmin(admin.ModelAdmin):
 admin.site.register(Template)
 admin.site.register(Prescription)
 admin.site.register(Scan)
+admin.site.register(ScanMetadata)
+admin.site.register(ScanLOD)
+admin.site.register(UploadSession)
 admin.site.register(ClinicalMeasure)
 admin.site.register(IntrinsicAdjustment)
 admin.site.register(OffLoading)
@@ -5,3 +5,6 @@ class PrescriptionsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'prescriptions'
     verbose_name = 'Prescriptions'
+
+    def ready(self):
+        from . import signals  # noqa: F401
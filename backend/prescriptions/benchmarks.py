@@ -0,0 +1,88 @@
+"""
+Benchmarks for the prescription endpoints, see ``manage.py benchmark``.
+"""
+import uuid
+
+from core.benchmarks import (
+    api_get, api_post, benchmark, create_patient, rendering_benchmark, serialization_benchmark, serialize
+)
+from core.models import Blob
+from core.storage import BLOB_ROOT
+from .cloning import SECTION_RELATIONS
+from .models import Prescription, PrescriptionStatus, Scan, Template
+from .serializers import PrescriptionDetailSerializer, PrescriptionListRowSerializer
+from .views import PrescriptionViewSet
+
+
+def create_prescriptions(rows):
+    """Create ``rows`` prescriptions for one patient and return the patient and clinician."""
+    patient, user = create_patient()
+    template = Template.objects.create(name='Benchmark template')
+    status, _ = PrescriptionStatus.objects.get_or_create(name='Benchmark')
+    Prescription.objects.bulk_create(
+        [
+            Prescription(patient=patient, clinic_id=patient.clinic_id, clinician=user, template=template, status=status)
+            for _ in range(rows)
+        ],
+        batch_size=1000
+    )
+    return patient, user
+
+
+@benchmark('prescriptions.list')
+def prescription_list(rows):
+    _, user = create_prescriptions(rows)
+    return api_get(user, '/api/prescriptions/')
+
+
+@benchmark('patients.prescriptions')
+def patient_prescriptions(rows):
+    patient, user = create_prescriptions(rows)
+    return api_get(user, f'/api/patients/{patient.id}/prescriptions/')
+
+
+def create_complete_prescription(scans):
+    """Create a prescription with every section and ``scans`` scans; return it and its clinician."""
+    patient, user = create_prescriptions(1)
+    prescription = Prescription.objects.get(patient=patient)
+    for relation in SECTION_RELATIONS:
+        Prescription._meta.get_field(relation).related_model.objects.create(prescription=prescription)
+    names = [f'{BLOB_ROOT}/00/00/{uuid.uuid4().hex}.stl' for _ in range(scans)]
+    Blob.objects.bulk_create([Blob(name=name, sha256='0' * 64, size=84, ref_count=1) for name in names])
+    Scan.objects.bulk_create(
+        [Scan(prescription=prescription, left_foot=name, processing_status='ready') for name in names],
+        batch_size=1000
+    )
+    return prescription, user
+
+
+@benchmark('prescriptions.clone', max_queries=19)
+def prescription_clone(rows):
+    # Every section and up to 100 scans; SQLite splits larger inserts into batches.
+    # The budget leaves room for the scans' metadata and LOD inserts.
+    prescription, user = create_complete_prescription(min(rows, 100))
+    return api_post(user, f'/api/prescriptions/{prescription.id}/clone/', {'include_scans': True})
+
+
+@serialization_benchmark('serialize.prescriptions.list')
+def serialize_prescription_list(rows):
+    patient, _ = create_prescriptions(rows)
+    return serialize(PrescriptionListRowSerializer, list(Prescription.objects.filter(patient=patient).list_rows()), many=True)
+
+
+@serialization_benchmark('serialize.prescriptions.detail')
+def serialize_prescription_detail(rows):
+    # One prescription with every section and ``rows`` scans
+    prescription, _ = create_complete_prescription(rows)
+    prescription = (
+        Prescription.objects
+        .select_related(*PrescriptionViewSet.DETAIL_SELECT_RELATED)
+        .prefetch_related(*PrescriptionViewSet.DETAIL_PREFETCH_RELATED)
+        .get(pk=prescription.pk)
+    )
+    return serialize(PrescriptionDetailSerializer, prescription)
+
+
+@rendering_benchmark('render.prescriptions.detail')
+def render_prescription_detail(rows):
+    return serialize_prescription_detail(rows)()
@@ -0,0 +1,97 @@
+"""
+Copying a prescription for a repeat order.
+
+``clone_prescription`` copies a prescription and its workflow sections with
+one ``bulk_create`` per table, so a clone costs the same handful of queries
+whatever it holds. Scans are copied on request: a copied scan points at the
+same stored files as the original, without copying their bytes. A scan that
+finished processing is copied with its metadata and LOD rows, which share
+their thumbnail and LOD files with the original's (see
+``scan_processing.delete_preview_file``); the others are processed again, all
+queued with a single task.
+
+``bulk_create`` sends no ``post_save``, so the blob references and the
+clinic's response cache are updated here instead.
+"""
+import uuid
+from functools import partial
+
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+from django.db.models.fields.files import FieldFile
+
+from core.blobs import acquire_all
+from core.caching import invalidate_clinic_cache
+from .models import Prescription, Scan, ScanLOD, ScanMetadata
+from .scan_processing import FEET
+
+# One-to-one relations from Prescription to its workflow sections
+SECTION_RELATIONS = (
+    'clinical_measures', 'intrinsic_adjustments', 'off_loading', 'planter_modifier',
+    'postings', 'material_selection', 'shoe_fitting', 'device_options',
+)
+
+
+def copy_row(instance, **changes):
+    """An unsaved copy of ``instance`` with a new key and timestamps, and ``changes`` applied."""
+    model = type(instance)
+    values = {}
+    for field in model._meta.concrete_fields:
+        if field.primary_key or getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+            continue
+        value = getattr(instance, field.attname)
+        # Files are shared by name, not by the original's FieldFile
+        values[field.attname] = value.name if isinstance(value, FieldFile) else value
+    copy = model(**values)
+    for name, value in changes.items():
+        setattr(copy, name, value)
+    return copy
+
+
+def _start_processing(scan_ids):
+    from .tasks import process_scans
+
+    process_scans(scan_ids)
+
+
+def clone_prescription(prescription, clinician, include_scans=False, status=None):
+    """
+    Copy ``prescription`` with its sections, and its scans if
+    ``include_scans``, as a new prescription of ``clinician``.
+
+    Load the patient and the sections up front, e.g. with
+    ``select_related('patient', *SECTION_RELATIONS)``, and the scans with
+    ``prefetch_related('scans__metadata', 'scans__lods')``. The clone starts
+    at ``status``.
+    """
+    with transaction.atomic():
+        clone = copy_row(prescription, clinician=clinician, status=status)
+        Prescription.objects.bulk_create([clone])
+
+        for relation in SECTION_RELATIONS:
+            try:
+                section = getattr(prescription, relation)
+            except ObjectDoesNotExist:
+                continue
+            type(section).objects.bulk_create([copy_row(section, prescription=clone)])
+
+        if include_scans:
+            scans, metadata, lods, pending = [], [], [], []
+            for scan in prescription.scans.all():
+                copy = copy_row(scan, prescription=clone, processing_token=uuid.uuid4())
+                scans.append(copy)
+                if scan.processing_status == 'ready':
+                    metadata += [copy_row(row, scan=copy) for row in scan.metadata.all()]
+                    lods += [copy_row(row, scan=copy) for row in scan.lods.all()]
+                else:
+                    copy.processing_status, copy.processing_error = 'pending', ''
+                    pending.append(copy.pk)
+            Scan.objects.bulk_create(scans)
+            ScanMetadata.objects.bulk_create(metadata)
+            ScanLOD.objects.bulk_create(lods)
+            acquire_all([getattr(scan, f'{foot}_foot').name for scan in scans for foot in FEET])
+            if pending:
+                transaction.on_commit(partial(_start_processing, pending))
+
+        invalidate_clinic_cache(prescription.patient.clinic_id)
+    return clone
@@ -0,0 +1,127 @@
+"""
+JSON Patch (RFC 6902) documents for a prescription and its sections.
+
+Paths point at fields of the detail representation, either of the
+prescription itself or of one of its sections::
+
+    [
+        {"op": "replace", "path": "/general_notes", "value": "Cast on 12/3"},
+        {"op": "test", "path": "/postings/left_heel_post_angle", "value": 2},
+        {"op": "replace", "path": "/postings/left_heel_post_angle", "value": 4}
+    ]
+
+``add`` and ``replace`` set a field and ``test`` checks its value; fields
+always exist, so they cannot be removed, moved or copied. A document is
+turned into the body of ``PrescriptionFullSerializer``, which validates all
+of it and writes only the changed columns in one transaction, so the
+workflow can send a burst of edits as a single request.
+"""
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.relations import PKOnlyObject
+from rest_framework.utils import json
+from rest_framework.utils.encoders import JSONEncoder
+
+from core.renderers import ORJSONParser
+from .serializers import PrescriptionFullSerializer
+
+
+class JSONPatchParser(ORJSONParser):
+    media_type = 'application/json-patch+json'
+
+
+class JSONPatchError(Exception):
+    """A patch document that cannot be applied, with its HTTP status."""
+
+    def __init__(self, message, status_code=status.HTTP_400_BAD_REQUEST):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _unescape(token):
+    # RFC 6901: '~1' is '/' and '~0' is '~', in that order
+    return token.replace('~1', '/').replace('~0', '~')
+
+
+def resolve_path(path):
+    """``(section, field)`` addressed by ``path``; ``section`` is ``None`` for the prescription's own fields."""
+    tokens = [_unescape(token) for token in path.split('/')[1:]] if path.startswith('/') else []
+    writable = PrescriptionFullSerializer.Meta.fields
+    if len(tokens) == 1 and tokens[0] in writable:
+        return None, tokens[0]
+    if len(tokens) == 2 and tokens[0] in PrescriptionFullSerializer.SECTIONS:
+        serializer_class = PrescriptionFullSerializer.SECTIONS[tokens[0]][2]
+        field = serializer_class().fields.get(tokens[1])
+        if field is not None and not field.read_only:
+            return tokens[0], tokens[1]
+    raise JSONPatchError(f"'{path}' is not a writable field of the prescription")
+
+
+def _normalized(value):
+    # Compare values the way they travel, e.g. UUIDs and decimals as strings
+    return json.loads(json.dumps(value, cls=JSONEncoder))
+
+
+def _field(section, name):
+    """The serializer field that reads and writes ``name``."""
+    if section is None:
+        serializer = PrescriptionFullSerializer()
+    else:
+        serializer = PrescriptionFullSerializer.SECTIONS[section][2]()
+    return serializer.fields[name]
+
+
+def current_value(prescription, section, name):
+    """The representation of a field as the detail endpoint would show it."""
+    if section is None:
+        instance = prescription
+    else:
+        instance = getattr(prescription, PrescriptionFullSerializer.SECTIONS[section][0], None)
+    if instance is None:
+        return None
+    field = _field(section, name)
+    attribute = field.get_attribute(instance)
+    if attribute is None or (isinstance(attribute, PKOnlyObject) and attribute.pk is None):
+        return None
+    return _normalized(field.to_representation(attribute))
+
+
+def pending_value(section, name, value):
+    """The representation a field will have once ``value`` is written, e.g. 4.0 for "4"."""
+    if value is None:
+        return None
+    field = _field(section, name)
+    try:
+        internal = field.to_internal_value(value)
+    except ValidationError:
+        # The body is rejected when it is validated; until then compare as sent
+        return _normalized(value)
+    return _normalized(field.to_representation(internal))
+
+
+def patch_data(prescription, operations):
+    """
+    The ``PrescriptionFullSerializer`` body that applies ``operations``, as
+    validated by ``JSONPatchOperationSerializer``, to ``prescription``.
+
+    Operations apply in order, so a ``test`` sees the values set before it.
+    Load ``prescription`` with its row locked, in the transaction that saves
+    the body, so the tests still hold when it is written.
+    """
+    data = {}
+    for index, operation in enumerate(operations):
+        section, name = resolve_path(operation['path'])
+        target = data if section is None else data.setdefault(section, {})
+        if operation['op'] == 'test':
+            if name in target:
+                value = pending_value(section, name, target[name])
+            else:
+                value = current_value(prescription, section, name)
+            if value != _normalized(operation['value']):
+                raise JSONPatchError(
+                    f"Test of '{operation['path']}' (operation {index}) failed: the value is {json.dumps(value)}",
+                    status.HTTP_409_CONFLICT
+                )
+        else:
+            target[name] = operation['value']
+    return data
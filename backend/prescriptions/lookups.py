@@ -0,0 +1,80 @@
+"""
+Per-process cache of the prescription lookup tables.
+
+Statuses, foot types, wear times, activity levels and templates change
+almost never but are read on every page load. Each process keeps the rows
+of these tables in memory next to the version they were loaded at. The
+current version of a table is a token in the default Django cache that
+``prescriptions.signals`` replaces whenever a row is saved or deleted, so
+every process reloads the table on its next read::
+
+    version, statuses = lookup_table(PrescriptionStatus)
+
+That relies on all processes sharing the default cache: the Redis cache in
+``CACHES``. With ``CACHE_URL=locmem://`` each process has its own version
+tokens, so a process only sees the changes it made itself; use it for
+tests and single-process development only.
+
+Rows are shared between requests and must be treated as read-only.
+``QuerySet.update()`` and ``bulk_create()`` bypass the signals; call
+``bump_lookup_version()`` after using them on a lookup table.
+"""
+import logging
+import uuid
+
+from django.core.cache import cache
+
+from .models import Activity, FootType, PrescriptionStatus, Template, WearTime
+
+logger = logging.getLogger(__name__)
+
+LOOKUP_MODELS = (PrescriptionStatus, FootType, WearTime, Activity, Template)
+
+# {model label: (version, rows)}
+_tables = {}
+
+
+def _version_key(model):
+    return f'lookups:{model._meta.label_lower}:version'
+
+
+def lookup_version(model):
+    """The current version token of ``model``'s table."""
+    key = _version_key(model)
+    version = cache.get(key)
+    if version is None:
+        # Evicted or never set: start a new version, so no process keeps
+        # serving rows it loaded before the eviction
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def bump_lookup_version(model):
+    """Make every process reload ``model``'s table on its next read."""
+    try:
+        cache.set(_version_key(model), uuid.uuid4().hex, None)
+    except Exception as e:
+        logger.error(f"Error bumping the version of {model._meta.label}: {str(e)}")
+
+
+def lookup_table(model):
+    """
+    ``(version, rows)`` of ``model``'s table, in its default ordering. The
+    version is ``None`` when the cache is unreachable and the rows are fresh.
+    """
+    rows = model._default_manager.all()
+    if not rows.ordered:
+        # Keep pages of unordered tables stable between reloads
+        rows = rows.order_by('pk')
+    try:
+        version = lookup_version(model)
+    except Exception as e:
+        logger.error(f"Error reading the version of {model._meta.label}: {str(e)}")
+        return None, list(rows)
+    cached = _tables.get(model._meta.label_lower)
+    if cached is not None and cached[0] == version:
+        return cached
+    cached = (version, list(rows))
+    _tables[model._meta.label_lower] = cached
+    return cached
@@ -0,0 +1,29 @@
+"""
+Remove resumable uploads that were abandoned before they were used.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from prescriptions.models import UploadSession
+from prescriptions.uploads import discard_upload
+
+
+class Command(BaseCommand):
+    help = "Delete upload sessions, and their partial files, that have not changed for a while"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours', type=float, default=getattr(settings, 'UPLOAD_SESSION_EXPIRY_HOURS', 24),
+            help="Age after the last received chunk at which a session expires"
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        deleted = 0
+        for session in UploadSession.objects.filter(updated_at__lt=cutoff).iterator():
+            discard_upload(session)
+            deleted += 1
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} stale upload sessions"))
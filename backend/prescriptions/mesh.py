@@ -0,0 +1,387 @@
+"""
+Mesh loading and geometry for foot scans.
+
+Every supported scan format is loaded into the same indexed representation:
+a float64 ``(N, 3)`` vertex array and an int64 ``(M, 3)`` triangle array.
+All geometry is computed with vectorized NumPy over those arrays.
+"""
+import re
+from array import array
+from itertools import islice
+
+import numpy as np
+
+from .scan_ingest import (
+    STL_ASCII, STL_BINARY, OBJ, PLY, VRML, STL_HEADER_SIZE, ScanFormatError,
+)
+
+STL_DTYPE = np.dtype([
+    ('normal', '<f4', (3,)),
+    ('vertices', '<f4', (3, 3)),
+    ('attributes', '<u2'),
+])
+
+PLY_TYPES = {
+    b'char': 'i1', b'int8': 'i1', b'uchar': 'u1', b'uint8': 'u1',
+    b'short': 'i2', b'int16': 'i2', b'ushort': 'u2', b'uint16': 'u2',
+    b'int': 'i4', b'int32': 'i4', b'uint': 'u4', b'uint32': 'u4',
+    b'float': 'f4', b'float32': 'f4', b'double': 'f8', b'float64': 'f8',
+}
+
+OBJ_CORNER_RE = re.compile(rb'/\S*')
+
+# Node openings, closing braces, the arrays the loader reads, and comments
+VRML_TOKEN_RE = re.compile(rb'#[^\n]*\n|(\w+)\s*\{|\}|\b(point|coordIndex)\s*\[')
+# Nodes whose point field holds vertices, rather than e.g. texture coordinates
+VRML_COORDINATE_NODES = (b'Coordinate', b'Coordinate3')
+# VRML files are parsed a chunk at a time
+VRML_CHUNK_SIZE = 1024 * 1024
+
+# Triangles are processed in blocks to bound temporary memory
+BLOCK_SIZE = 256 * 1024
+
+
+class Mesh:
+    """
+    An indexed triangle mesh.
+    """
+
+    def __init__(self, vertices, faces):
+        self.vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 3)
+        self.faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+
+    @property
+    def triangle_count(self):
+        return len(self.faces)
+
+    @property
+    def vertex_count(self):
+        return len(self.vertices)
+
+    def bounding_box(self):
+        """Return the axis-aligned bounding box as ``(min_xyz, max_xyz)``."""
+        if not self.vertex_count:
+            return np.zeros(3), np.zeros(3)
+        return self.vertices.min(axis=0), self.vertices.max(axis=0)
+
+    def surface_area(self):
+        """Return the total area of all triangles."""
+        area = 0.0
+        for start in range(0, self.triangle_count, BLOCK_SIZE):
+            corners = self.vertices[self.faces[start:start + BLOCK_SIZE]]
+            cross = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+            area += 0.5 * np.linalg.norm(cross, axis=1).sum()
+        return float(area)
+
+    def foot_dimensions(self):
+        """
+        Estimate the foot length and width.
+
+        The principal axes of the vertex cloud are used as the foot's frame:
+        the axis of greatest spread runs heel to toe and the second runs
+        across the forefoot. Length and width are the extents along them.
+        """
+        if self.vertex_count < 3:
+            return 0.0, 0.0
+        centered = self.vertices - self.vertices.mean(axis=0)
+        covariance = centered.T @ centered / len(centered)
+        _, axes = np.linalg.eigh(covariance)
+        # eigh sorts eigenvalues in ascending order
+        projected = centered @ axes[:, [2, 1]]
+        extents = projected.max(axis=0) - projected.min(axis=0)
+        return float(extents[0]), float(extents[1])
+
+
+def _weld(corners):
+    """Turn an ``(M, 3, 3)`` triangle soup into an indexed ``Mesh``."""
+    points = np.ascontiguousarray(corners.reshape(-1, 3), dtype=np.float32)
+    # Compare vertices as raw 12 byte records, which is much faster than axis=0
+    keys = points.view(np.dtype((np.void, points.dtype.itemsize * 3))).ravel()
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    return Mesh(points[first], inverse.reshape(-1, 3))
+
+
+def _load_binary_stl(path):
+    with open(path, 'rb') as f:
+        f.seek(80)
+        count = int(np.frombuffer(f.read(4), dtype='<u4')[0])
+    triangles = np.memmap(path, dtype=STL_DTYPE, mode='r', offset=STL_HEADER_SIZE, shape=(count,))
+    return _weld(triangles['vertices'])
+
+
+def _load_ascii_stl(path):
+    with open(path, 'rb') as f:
+        lines = (line.split(None, 1)[1] for line in f if line.lstrip().startswith(b'vertex'))
+        corners = np.loadtxt(lines, dtype=np.float64, ndmin=2)
+    return _weld(corners.reshape(-1, 3, 3))
+
+
+def _parse_numbers(text, dtype):
+    """Parse whitespace separated numbers in one call."""
+    if not text or text.isspace():
+        # fromstring reads blank text as [-1]
+        return np.zeros(0, dtype=dtype)
+    return np.fromstring(text, dtype=dtype, sep=' ')
+
+
+def _parse_rows(lines, dtype, columns):
+    """
+    Parse whitespace separated ``lines`` into a ``(len(lines), columns)``
+    array in one call, or return ``None`` when the rows are not all that wide.
+    """
+    values = _parse_numbers(b' '.join(lines), dtype)
+    if values.size != len(lines) * columns:
+        return None
+    return values.reshape(-1, columns)
+
+
+def _load_obj(path):
+    vertex_lines = []
+    face_lines = []
+    # The vertices read before each face, which negative indices count back from
+    face_offsets = array('q')
+    with open(path, 'rb') as f:
+        for line in f:
+            if line.startswith(b'v '):
+                vertex_lines.append(line[2:])
+            elif line.startswith(b'f '):
+                face_lines.append(line[2:])
+                face_offsets.append(len(vertex_lines))
+
+    vertices = _parse_rows(vertex_lines, np.float64, 3)
+    if vertices is None:
+        # Vertices with a w component or a colour
+        vertices = np.array([line.split()[:3] for line in vertex_lines], dtype=np.float64)
+
+    # Only the vertex index of each v/vt/vn corner is used
+    face_lines = [OBJ_CORNER_RE.sub(b'', line) for line in face_lines]
+    offsets = np.frombuffer(face_offsets, dtype=np.int64)
+    corners = _parse_rows(face_lines, np.int64, 3)
+    if corners is None:
+        # Polygons are triangulated as fans
+        polygons = [[int(token) for token in line.split()] for line in face_lines]
+        lengths = np.array([max(len(polygon) - 2, 0) for polygon in polygons], dtype=np.int64)
+        corners = _triangulate(polygons).reshape(-1, 3)
+        offsets = np.repeat(offsets, lengths)
+    # OBJ indices are 1-based, negative ones count from the end
+    offsets = np.broadcast_to(offsets[:, None], corners.shape)
+    faces = np.where(corners > 0, corners - 1, offsets + corners)
+    return Mesh(vertices, faces)
+
+
+def _read_ply_header(f):
+    elements = []
+    encoding = None
+    for raw in f:
+        line = raw.strip()
+        if line == b'end_header':
+            break
+        words = line.split()
+        if not words:
+            continue
+        if words[0] == b'format':
+            encoding = words[1]
+        elif words[0] == b'element':
+            elements.append((words[1], int(words[2]), []))
+        elif words[0] == b'property' and elements:
+            elements[-1][2].append(words[1:])
+    else:
+        raise ScanFormatError("Invalid PLY file format")
+    return encoding, elements
+
+
+def _triangulate(polygons):
+    faces = array('q')
+    for corners in polygons:
+        for i in range(1, len(corners) - 1):
+            faces.extend((corners[0], corners[i], corners[i + 1]))
+    return np.frombuffer(faces, dtype=np.int64)
+
+
+def _load_ply(path):
+    with open(path, 'rb') as f:
+        encoding, elements = _read_ply_header(f)
+        if encoding == b'ascii':
+            return _load_ascii_ply(f, elements)
+        byte_order = '<' if encoding == b'binary_little_endian' else '>'
+        return _load_binary_ply(f, elements, byte_order)
+
+
+def _load_ascii_ply(f, elements):
+    vertices = np.zeros((0, 3))
+    faces = np.zeros((0, 3), dtype=np.int64)
+    for name, count, properties in elements:
+        lines = list(islice(f, count))
+        if len(lines) != count:
+            raise ScanFormatError("PLY file is shorter than its header")
+        if name == b'vertex':
+            names = [prop[-1] for prop in properties]
+            columns = [names.index(axis) for axis in (b'x', b'y', b'z')]
+            rows = _parse_rows(lines, np.float64, len(properties))
+            if rows is None:
+                # Vertices with list properties
+                rows = np.array([line.split()[:len(properties)] for line in lines], dtype=np.float64)
+            vertices = rows[:, columns]
+        elif name == b'face':
+            # Faces are parsed in one go when they are all triangles
+            rows = _parse_rows(lines, np.int64, 4)
+            if rows is not None and (rows[:, 0] == 3).all():
+                faces = rows[:, 1:]
+                continue
+            polygons = []
+            for line in lines:
+                row = line.split()
+                polygons.append([int(v) for v in row[1:1 + int(row[0])]])
+            faces = _triangulate(polygons)
+    return Mesh(vertices, faces)
+
+
+def _load_binary_ply(f, elements, byte_order):
+    vertices = np.zeros((0, 3))
+    faces = np.zeros((0, 3), dtype=np.int64)
+    for name, count, properties in elements:
+        if all(prop[0] != b'list' for prop in properties):
+            dtype = np.dtype([(prop[1].decode(), byte_order + PLY_TYPES[prop[0]]) for prop in properties])
+            data = np.frombuffer(f.read(dtype.itemsize * count), dtype=dtype, count=count)
+            if name == b'vertex':
+                vertices = np.column_stack([data['x'], data['y'], data['z']])
+            continue
+
+        # Faces are read in one go when they are all triangles
+        start = f.tell()
+        if len(properties) == 1:
+            _, count_type, index_type = properties[0][:3]
+            triangle_dtype = np.dtype([
+                ('n', byte_order + PLY_TYPES[count_type]),
+                ('v', byte_order + PLY_TYPES[index_type], (3,)),
+            ])
+            data = np.frombuffer(f.read(triangle_dtype.itemsize * count), dtype=triangle_dtype)
+            if len(data) == count and (data['n'] == 3).all():
+                if name == b'face':
+                    faces = data['v'].astype(np.int64)
+                continue
+            f.seek(start)
+
+        polygons = []
+        for _ in range(count):
+            for prop in properties:
+                if prop[0] != b'list':
+                    f.read(np.dtype(PLY_TYPES[prop[0]]).itemsize)
+                    continue
+                count_dtype = np.dtype(byte_order + PLY_TYPES[prop[1]])
+                index_dtype = np.dtype(byte_order + PLY_TYPES[prop[2]])
+                n = int(np.frombuffer(f.read(count_dtype.itemsize), dtype=count_dtype)[0])
+                indices = np.frombuffer(f.read(index_dtype.itemsize * n), dtype=index_dtype)
+                if prop[3] in (b'vertex_indices', b'vertex_index'):
+                    polygons.append(indices.tolist())
+        if name == b'face':
+            faces = _triangulate(polygons)
+    return Mesh(vertices, faces)
+
+
+def _read_vrml_array(f, buffer, keyword, dtype):
+    """Parse the array of ``keyword`` at the start of ``buffer``; return it and what follows."""
+    parts = []
+    while True:
+        end = buffer.find(b']')
+        if end >= 0:
+            parts.append(_parse_numbers(buffer[:end].replace(b',', b' '), dtype))
+            return np.concatenate(parts), buffer[end + 1:]
+        # A number may continue in the next chunk
+        cut = len(buffer.rstrip(b'0123456789+-.eE'))
+        parts.append(_parse_numbers(buffer[:cut].replace(b',', b' '), dtype))
+        chunk = f.read(VRML_CHUNK_SIZE)
+        if not chunk:
+            raise ScanFormatError(f"VRML {keyword.decode()} array is not closed")
+        buffer = buffer[cut:] + chunk
+
+
+def _read_vrml_face_sets(f):
+    """
+    Yield ``(points, coord_index)`` for every ``IndexedFaceSet`` in a VRML
+    file, reading and parsing it one chunk at a time.
+
+    Points are taken from ``Coordinate`` nodes only: the face set's own
+    ``coord`` in VRML 2.0, or the last ``Coordinate3`` in VRML 1.0.
+    Texture coordinates, normals and colours are skipped.
+    """
+    nodes = []
+    # The face sets being read, innermost last, as [points, coord_index]
+    face_sets = []
+    coordinates = None
+    buffer = b''
+    while True:
+        match = VRML_TOKEN_RE.search(buffer)
+        if match is None:
+            chunk = f.read(VRML_CHUNK_SIZE)
+            if not chunk:
+                return
+            # Keep the tail, which may hold the start of a token
+            buffer = buffer[-64:] + chunk
+            continue
+        node, keyword = match.groups()
+        buffer = buffer[match.end():]
+        if node is not None:
+            nodes.append(node)
+            if node == b'IndexedFaceSet':
+                face_sets.append([None, None])
+        elif keyword == b'point':
+            values, buffer = _read_vrml_array(f, buffer, keyword, np.float64)
+            if nodes and nodes[-1] in VRML_COORDINATE_NODES:
+                coordinates = values
+                if face_sets:
+                    face_sets[-1][0] = values
+        elif keyword == b'coordIndex':
+            values, buffer = _read_vrml_array(f, buffer, keyword, np.int64)
+            if nodes and nodes[-1] == b'IndexedFaceSet':
+                face_sets[-1][1] = values
+        elif match.group(0) == b'}' and nodes:
+            if nodes.pop() == b'IndexedFaceSet':
+                points, index = face_sets.pop()
+                if points is None:
+                    points = coordinates
+                if points is not None and index is not None:
+                    yield points, index
+
+
+def _load_vrml(path):
+    vertex_blocks = []
+    face_blocks = []
+    offset = 0
+    with open(path, 'rb') as f:
+        for points, index in _read_vrml_face_sets(f):
+            if points.size % 3:
+                raise ScanFormatError("VRML coordinates are not 3-D points")
+            vertices = points.reshape(-1, 3)
+            if index.size and index.max() >= len(vertices):
+                raise ScanFormatError("VRML coordIndex refers to a missing point")
+            # Polygons are separated by -1
+            polygons = np.split(index, np.flatnonzero(index == -1))
+            face_blocks.append(_triangulate(p[p >= 0].tolist() for p in polygons) + offset)
+            vertex_blocks.append(vertices)
+            offset += len(vertices)
+    if not vertex_blocks:
+        raise ScanFormatError("VRML file contains no IndexedFaceSet geometry")
+    return Mesh(np.concatenate(vertex_blocks), np.concatenate(face_blocks))
+
+
+LOADERS = {
+    STL_BINARY: _load_binary_stl,
+    STL_ASCII: _load_ascii_stl,
+    OBJ: _load_obj,
+    PLY: _load_ply,
+    VRML: _load_vrml,
+}
+
+
+def load_mesh(path, scan_format):
+    """
+    Load a scan file into a ``Mesh``.
+
+    ``scan_format`` is the format reported by ``scan_ingest.inspect_scan``.
+    """
+    try:
+        loader = LOADERS[scan_format]
+    except KeyError:
+        raise ScanFormatError(f"Unsupported scan format: {scan_format}")
+    return loader(path)
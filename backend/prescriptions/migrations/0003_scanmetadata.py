@@ -0,0 +1,44 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prescriptions', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanMetadata',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('foot', models.CharField(choices=[('left', 'Left'), ('right', 'Right')], max_length=5)),
+                ('file_format', models.CharField(max_length=20)),
+                ('file_size', models.BigIntegerField()),
+                ('sha256', models.CharField(max_length=64)),
+                ('triangle_count', models.PositiveIntegerField()),
+                ('vertex_count', models.PositiveIntegerField()),
+                ('bbox_min_x', models.FloatField()),
+                ('bbox_min_y', models.FloatField()),
+                ('bbox_min_z', models.FloatField()),
+                ('bbox_max_x', models.FloatField()),
+                ('bbox_max_y', models.FloatField()),
+                ('bbox_max_z', models.FloatField()),
+                ('surface_area', models.FloatField()),
+                ('foot_length', models.FloatField()),
+                ('foot_width', models.FloatField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('scan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='metadata', to='prescriptions.scan')),
+            ],
+            options={
+                'verbose_name_plural': 'Scan metadata',
+                'ordering': ['foot'],
+                'unique_together': {('scan', 'foot')},
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+import prescriptions.models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prescriptions', '0003_scanmetadata'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanLOD',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('foot', models.CharField(choices=[('left', 'Left'), ('right', 'Right')], max_length=5)),
+                ('level', models.CharField(choices=[('low', 'Low'), ('medium', 'Medium')], max_length=10)),
+                ('file', models.FileField(upload_to=prescriptions.models.scan_lod_upload_path)),
+                ('file_size', models.PositiveIntegerField()),
+                ('triangle_count', models.PositiveIntegerField()),
+                ('vertex_count', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('scan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lods', to='prescriptions.scan')),
+            ],
+            options={
+                'verbose_name': 'Scan LOD',
+                'verbose_name_plural': 'Scan LODs',
+                'ordering': ['foot', 'triangle_count'],
+                'unique_together': {('scan', 'foot', 'level')},
+            },
+        ),
+    ]
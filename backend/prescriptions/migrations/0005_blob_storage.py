@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:07
+
+import core.storage
+from django.db import migrations, models
+import prescriptions.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prescriptions', '0004_scanlod'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='attachment',
+            name='file',
+            field=models.FileField(storage=core.storage.get_blob_storage, upload_to='prescription_attachments/'),
+        ),
+        migrations.AlterField(
+            model_name='scan',
+            name='left_foot',
+            field=models.FileField(blank=True, null=True, storage=core.storage.get_blob_storage, upload_to=prescriptions.models.left_foot_upload_path),
+        ),
+        migrations.AlterField(
+            model_name='scan',
+            name='right_foot',
+            field=models.FileField(blank=True, null=True, storage=core.storage.get_blob_storage, upload_to=prescriptions.models.right_foot_upload_path),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prescriptions', '0006_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scan',
+            name='processing_error',
+            field=models.TextField(blank=True),
+        ),
+        # Existing scans were processed during their upload request
+        migrations.AddField(
+            model_name='scan',
+            name='processing_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], default='ready', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='scan',
+            name='processing_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='scanmetadata',
+            name='thumbnail',
+            field=models.ImageField(blank=True, null=True, upload_to='scans/thumbnails/'),
+        ),
+    ]
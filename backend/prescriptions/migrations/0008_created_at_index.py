@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prescriptions', '0007_scan_processing_status'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='prescription',
+            index=models.Index(fields=['created_at', 'id'], name='prescription_created_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prescriptions', '0010_section_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scan',
+            name='processing_token',
+            field=models.UUIDField(blank=True, editable=False, null=True),
+        ),
+    ]
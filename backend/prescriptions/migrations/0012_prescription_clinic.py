@@ -0,0 +1,35 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:40
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+def backfill_prescription_clinic(apps, schema_editor):
+    Prescription = apps.get_model('prescriptions', 'Prescription')
+    Patient = apps.get_model('patients', 'Patient')
+    Prescription.objects.update(clinic_id=Subquery(
+        Patient.objects.filter(pk=OuterRef('patient_id')).values('clinic_id')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+        ('patients', '0005_query_indexes'),
+        ('prescriptions', '0011_scan_processing_token'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prescription',
+            name='clinic',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='prescriptions', to='users.clinic'),
+        ),
+        migrations.RunPython(backfill_prescription_clinic, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='prescription',
+            index=models.Index(fields=['clinic', 'created_at', 'id'], name='prescription_clinic_idx'),
+        ),
+    ]
@@ -3,8 +3,12 @@ Models for the prescriptions app.
 """
 import uuid
 from django.db import models
+from django.db.models import F, Value
+from django.db.models.functions import Concat
 from django.conf import settings
 from patients.models import Patient
+from core.storage import get_blob_storage
+from core.tenancy import ClinicScopedQuerySet
 import os
 
 def ensure_scan_directories():
@@ -29,6 +33,10 @@ def left_foot_upload_path(instance, filename):
 def right_foot_upload_path(instance, filename):
     return scan_upload_path(instance, filename, 'right')
 
+def scan_lod_upload_path(instance, filename):
+    """Generate upload path for decimated scan previews."""
+    return os.path.join('scans', 'lod', str(instance.scan_id), f"{instance.foot}_{instance.level}.lod")
+
 class Template(models.Model):
     """
     Model for prescription templates.
@@ -43,6 +51,26 @@ class Template(models.Model):
     def __str__(self):
         return self.name
 
+class PrescriptionQuerySet(ClinicScopedQuerySet):
+    # Columns rendered by PrescriptionListRowSerializer
+    LIST_COLUMNS = (
+        'id', 'patient_name', 'clinician_name', 'template_name',
+        'status', 'status_name', 'created_at', 'updated_at',
+    )
+
+    def with_display_names(self):
+        """Annotate the names shown in prescription lists, joined in the same query."""
+        return self.annotate(
+            patient_name=Concat('patient__first_name', Value(' '), 'patient__last_name'),
+            clinician_name=Concat('clinician__first_name', Value(' '), 'clinician__last_name'),
+            template_name=F('template__name'),
+            status_name=F('status__name'),
+        )
+
+    def list_rows(self):
+        """Plain dict rows for list endpoints, without building model instances."""
+        return self.with_display_names().values(*self.LIST_COLUMNS)
+
 class Prescription(models.Model):
     """
     Model for prescription data.
@@ -55,6 +83,10 @@ class Prescription(models.Model):
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='prescriptions')
+    # Clinic of the patient, kept in sync by prescriptions.signals
+    clinic = models.ForeignKey(
+        'users.Clinic', on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='prescriptions'
+    )
     clinician = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='prescriptions')
     template = models.ForeignKey(Template, on_delete=models.CASCADE, related_name='prescriptions')
     created_at = models.DateTimeField(auto_now_add=True)
@@ -79,6 +111,18 @@ class Prescription(models.Model):
     left_foot_notes = models.TextField(blank=True)
     right_foot_notes = models.TextField(blank=True)
     
+    objects = PrescriptionQuerySet.as_manager()
+    
+    class Meta:
+        indexes = [
+            # Keyset pagination, see core.pagination.KeysetPagination
+            models.Index(fields=['created_at', 'id'], name='prescription_created_idx'),
+            # A patient's prescriptions, newest first
+            models.Index(fields=['patient', 'created_at'], name='prescription_patient_idx'),
+            # A clinic's prescriptions, newest first
+            models.Index(fields=['clinic', 'created_at', 'id'], name='prescription_clinic_idx'),
+        ]
+    
     def __str__(self):
         return f"Prescription for {self.patient.full_name} by {self.clinician.get_full_name()}"
 
@@ -88,8 +132,20 @@ class Scan(models.Model):
     """
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     prescription = models.ForeignKey(Prescription, on_delete=models.CASCADE, related_name='scans')
-    left_foot = models.FileField(upload_to=left_foot_upload_path, null=True, blank=True)
-    right_foot = models.FileField(upload_to=right_foot_upload_path, null=True, blank=True)
+    left_foot = models.FileField(upload_to=left_foot_upload_path, storage=get_blob_storage, null=True, blank=True)
+    right_foot = models.FileField(upload_to=right_foot_upload_path, storage=get_blob_storage, null=True, blank=True)
+    
+    # Post-processing state, see prescriptions.tasks
+    PROCESSING_STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ]
+    processing_status = models.CharField(max_length=20, choices=PROCESSING_STATUS_CHOICES, default='pending')
+    processing_error = models.TextField(blank=True)
+    # The chain queued last; steps of the chains it superseded do nothing
+    processing_token = models.UUIDField(null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -101,6 +157,85 @@ class Scan(models.Model):
         ensure_scan_directories()
         super().save(*args, **kwargs)
 
+class ScanMetadata(models.Model):
+    """
+    Mesh facts for one foot of a scan, computed once when the file is uploaded.
+    
+    Lengths are in the scan's own units (millimetres for every scanner the
+    portal supports) and areas in square units.
+    """
+    FOOT_CHOICES = [
+        ('left', 'Left'),
+        ('right', 'Right'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    scan = models.ForeignKey(Scan, on_delete=models.CASCADE, related_name='metadata')
+    foot = models.CharField(max_length=5, choices=FOOT_CHOICES)
+    
+    # File facts
+    file_format = models.CharField(max_length=20)
+    file_size = models.BigIntegerField()
+    sha256 = models.CharField(max_length=64)
+    
+    # Mesh facts
+    triangle_count = models.PositiveIntegerField()
+    vertex_count = models.PositiveIntegerField()
+    bbox_min_x = models.FloatField()
+    bbox_min_y = models.FloatField()
+    bbox_min_z = models.FloatField()
+    bbox_max_x = models.FloatField()
+    bbox_max_y = models.FloatField()
+    bbox_max_z = models.FloatField()
+    surface_area = models.FloatField()
+    foot_length = models.FloatField()
+    foot_width = models.FloatField()
+    thumbnail = models.ImageField(upload_to='scans/thumbnails/', null=True, blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['foot']
+        unique_together = ('scan', 'foot')
+        verbose_name_plural = "Scan metadata"
+
+    def __str__(self):
+        return f"{self.get_foot_display()} scan metadata for {self.scan_id}"
+
+class ScanLOD(models.Model):
+    """
+    A decimated level-of-detail copy of one foot of a scan.
+    
+    Files use the compact binary format from ``prescriptions.lod``. The
+    original upload serves as the full level and is not duplicated here.
+    """
+    FOOT_CHOICES = ScanMetadata.FOOT_CHOICES
+    LEVEL_CHOICES = [
+        ('low', 'Low'),
+        ('medium', 'Medium'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    scan = models.ForeignKey(Scan, on_delete=models.CASCADE, related_name='lods')
+    foot = models.CharField(max_length=5, choices=FOOT_CHOICES)
+    level = models.CharField(max_length=10, choices=LEVEL_CHOICES)
+    file = models.FileField(upload_to=scan_lod_upload_path)
+    file_size = models.PositiveIntegerField()
+    triangle_count = models.PositiveIntegerField()
+    vertex_count = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['foot', 'triangle_count']
+        unique_together = ('scan', 'foot', 'level')
+        verbose_name = "Scan LOD"
+        verbose_name_plural = "Scan LODs"
+
+    def __str__(self):
+        return f"{self.get_foot_display()} {self.level} LOD for {self.scan_id}"
+
 class ClinicalMeasure(models.Model):
     """
     Model for clinical measurements for each foot.
@@ -121,6 +256,8 @@ class ClinicalMeasure(models.Model):
     right_forefoot_valgus = models.FloatField(null=True, blank=True)
     right_heel_to_mpj_centre = models.FloatField(null=True, blank=True)
     right_posterior_heel_to_heel_centre = models.FloatField(null=True, blank=True)
+    
+    updated_at = models.DateTimeField(auto_now=True)
 
 class IntrinsicAdjustment(models.Model):
     """
@@ -200,6 +337,8 @@ class IntrinsicAdjustment(models.Model):
     right_skive_degree = models.FloatField(null=True, blank=True)
     right_skive_inclination = models.CharField(max_length=20, choices=SKIVE_INCLINATION_CHOICES, null=True, blank=True)
     right_skive_specific_inclination = models.FloatField(null=True, blank=True)
+    
+    updated_at = models.DateTimeField(auto_now=True)
 
 class OffLoading(models.Model):
     """
@@ -304,6 +443,8 @@ class Posting(models.Model):
     right_forefoot_post_medial = models.BooleanField(default=False)
     right_forefoot_post_lateral = models.BooleanField(default=False)
     right_forefoot_post_angle = models.FloatField(null=True, blank=True)
+    
+    updated_at = models.DateTimeField(auto_now=True)
 
 class MaterialSelection(models.Model):
     """
@@ -367,6 +508,8 @@ class MaterialSelection(models.Model):
     extension_forefoot = models.BooleanField(default=False)
     extension_midfoot_medial = models.BooleanField(default=False)
     extension_midfoot_lateral = models.BooleanField(default=False)
+    
+    updated_at = models.DateTimeField(auto_now=True)
 
 class ShoeFitting(models.Model):
     """
@@ -384,6 +527,8 @@ class ShoeFitting(models.Model):
     sizing_style = models.CharField(max_length=20, choices=SIZING_STYLE_CHOICES, default='mens')
     orthosis_size = models.CharField(max_length=10)
     to_fit_shoe = models.CharField(max_length=255)
+    
+    updated_at = models.DateTimeField(auto_now=True)
 
 class DeviceOption(models.Model):
     """
@@ -400,6 +545,8 @@ class DeviceOption(models.Model):
     heel_width = models.FloatField(null=True, blank=True)
     midfoot_width = models.FloatField(null=True, blank=True)
     forefoot_width = models.FloatField(null=True, blank=True)
+    
+    updated_at = models.DateTimeField(auto_now=True)
 
 class Attachment(models.Model):
     """
@@ -407,10 +554,53 @@ class Attachment(models.Model):
     """
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     prescription = models.ForeignKey(Prescription, on_delete=models.CASCADE, related_name='attachments')
-    file = models.FileField(upload_to='prescription_attachments/')
+    file = models.FileField(upload_to='prescription_attachments/', storage=get_blob_storage)
     filename = models.CharField(max_length=255)
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
+class UploadSession(models.Model):
+    """
+    A resumable upload of a scan or attachment.
+    
+    Bytes are appended to ``MEDIA_ROOT/uploads/<id>.part`` chunk by chunk
+    until ``offset`` reaches ``length``; the finished file is then handed to
+    ``PrescriptionViewSet.scans`` or ``PrescriptionViewSet.attachments``.
+    """
+    TARGET_CHOICES = [
+        ('left_foot', 'Left foot scan'),
+        ('right_foot', 'Right foot scan'),
+        ('attachment', 'Attachment'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    prescription = models.ForeignKey(Prescription, on_delete=models.CASCADE, related_name='upload_sessions')
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='upload_sessions')
+    target = models.CharField(max_length=20, choices=TARGET_CHOICES)
+    filename = models.CharField(max_length=255)
+    length = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # PrescriptionViewSet.uploads lists a user's sessions per prescription
+            models.Index(fields=['prescription', 'created_by', 'created_at'], name='upload_prescription_idx'),
+            # clear_stale_uploads
+            models.Index(fields=['updated_at'], name='upload_updated_idx'),
+        ]
+
+    def __str__(self):
+        return f"Upload of {self.filename} ({self.offset}/{self.length})"
+
+    @property
+    def is_complete(self):
+        return self.offset >= self.length
+
+    @property
+    def part_path(self):
+        return os.path.join(settings.MEDIA_ROOT, 'uploads', f"{self.id}.part")
+
 class PrescriptionStatus(models.Model):
     """
     Model for prescription status options.
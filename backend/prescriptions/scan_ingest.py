@@ -0,0 +1,231 @@
+"""
+Streaming inspection of uploaded 3D scan files.
+
+The inspector is fed one chunk at a time, so a scan can be hashed, validated
+and sniffed while it is being written to disk without ever holding the whole
+file in memory.
+"""
+import hashlib
+import os
+import re
+import struct
+
+SCAN_EXTENSIONS = ['.stl', '.wrl', '.vrml', '.obj', '.ply']
+
+# Scan formats recognised by the inspector
+STL_BINARY = 'stl_binary'
+STL_ASCII = 'stl_ascii'
+OBJ = 'obj'
+PLY = 'ply'
+VRML = 'vrml'
+
+# Binary STL layout: 80 byte header, uint32 triangle count, 50 bytes per triangle
+STL_HEADER_SIZE = 84
+STL_TRIANGLE_SIZE = 50
+
+# Headers are parsed from a bounded prefix of the file
+MAX_HEADER_SIZE = 64 * 1024
+
+PLY_FORMAT_RE = re.compile(rb'^format (ascii|binary_little_endian|binary_big_endian) 1\.0$')
+PLY_ELEMENT_RE = re.compile(rb'^element (\w+) (\d+)$')
+
+
+def _are_numbers(tokens):
+    try:
+        for token in tokens:
+            float(token)
+    except ValueError:
+        return False
+    return True
+
+
+class ScanFormatError(ValueError):
+    """Raised when an uploaded scan does not match its declared format."""
+
+
+class ScanInfo:
+    """
+    Facts gathered about a scan while it was streamed.
+    """
+
+    def __init__(self, scan_format, size, sha256, triangle_count=None, vertex_count=None):
+        self.format = scan_format
+        self.size = size
+        self.sha256 = sha256
+        self.triangle_count = triangle_count
+        self.vertex_count = vertex_count
+
+    def __repr__(self):
+        return f"<ScanInfo {self.format} {self.size} bytes sha256={self.sha256[:12]}>"
+
+
+class ScanInspector:
+    """
+    Incrementally hash and validate a scan file.
+
+    Call ``feed()`` with each chunk in order and ``finish()`` once the last
+    chunk has been fed. Memory use is bounded by ``MAX_HEADER_SIZE`` plus the
+    longest text line, regardless of the file size.
+    """
+
+    def __init__(self, filename):
+        self.extension = os.path.splitext(filename or '')[1].lower()
+        if self.extension not in SCAN_EXTENSIONS:
+            raise ScanFormatError(
+                f"File extension not allowed. Allowed extensions are: {', '.join(SCAN_EXTENSIONS)}"
+            )
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._prefix = b''
+        self._line_tail = b''
+        self._text = True
+        self._facets = 0
+        self._obj_vertices = 0
+        self._obj_faces = 0
+
+    def feed(self, chunk):
+        """Consume the next chunk of the upload."""
+        if not chunk:
+            return
+        self.size += len(chunk)
+        self._hash.update(chunk)
+
+        if len(self._prefix) < MAX_HEADER_SIZE:
+            self._prefix += chunk[:MAX_HEADER_SIZE - len(self._prefix)]
+
+        if self.extension == '.stl':
+            self._scan_lines(chunk, self._count_stl_line)
+        elif self.extension == '.obj':
+            self._scan_lines(chunk, self._count_obj_line)
+
+    def finish(self):
+        """
+        Validate the complete stream and return a ``ScanInfo``.
+
+        Raises ``ScanFormatError`` if the content does not match the extension.
+        """
+        if self._line_tail:
+            line, self._line_tail = self._line_tail, b''
+            if self.extension == '.stl':
+                self._count_stl_line(line)
+            elif self.extension == '.obj':
+                self._count_obj_line(line)
+
+        if self.size == 0:
+            raise ScanFormatError("The uploaded scan file is empty.")
+
+        sha256 = self._hash.hexdigest()
+        if self.extension == '.stl':
+            return self._finish_stl(sha256)
+        if self.extension == '.obj':
+            return self._finish_obj(sha256)
+        if self.extension == '.ply':
+            return self._finish_ply(sha256)
+        return self._finish_vrml(sha256)
+
+    def _scan_lines(self, chunk, handler):
+        """Run ``handler`` over every complete line, carrying partial lines over."""
+        if not self._text:
+            return
+        data = self._line_tail + chunk
+        lines = data.split(b'\n')
+        self._line_tail = lines.pop()
+        for line in lines:
+            handler(line)
+        # A "line" this long means the content is binary, not text
+        if len(self._line_tail) > MAX_HEADER_SIZE:
+            self._text = False
+            self._line_tail = b''
+
+    def _count_stl_line(self, line):
+        if line.strip().startswith(b'endfacet'):
+            self._facets += 1
+
+    def _count_obj_line(self, line):
+        # OBJ has many more statements (mg, lod, usemap, bmat, ...) than
+        # meshes use; the file is sniffed on its vertices and faces only
+        if b'\0' in line:
+            # Text has no NUL bytes
+            self._text = False
+            return
+        tokens = line.split()
+        if not tokens:
+            return
+        if tokens[0] == b'v':
+            if len(tokens) >= 4 and _are_numbers(tokens[1:4]):
+                self._obj_vertices += 1
+        elif tokens[0] == b'f':
+            # Polygons are counted as the triangles of a fan
+            self._obj_faces += max(len(tokens) - 3, 0)
+
+    def _finish_stl(self, sha256):
+        if len(self._prefix) >= STL_HEADER_SIZE:
+            triangle_count = struct.unpack('<I', self._prefix[80:84])[0]
+            expected_size = STL_HEADER_SIZE + STL_TRIANGLE_SIZE * triangle_count
+            # Allow some tolerance for exporters that pad the file
+            if abs(expected_size - self.size) < 100:
+                return ScanInfo(STL_BINARY, self.size, sha256,
+                                triangle_count=triangle_count,
+                                vertex_count=triangle_count * 3)
+
+        if self._prefix.lstrip().startswith(b'solid') and self._text and self._facets:
+            return ScanInfo(STL_ASCII, self.size, sha256,
+                            triangle_count=self._facets,
+                            vertex_count=self._facets * 3)
+
+        raise ScanFormatError("Invalid STL file format")
+
+    def _finish_obj(self, sha256):
+        if not self._text or not self._obj_vertices:
+            raise ScanFormatError("Invalid OBJ file format")
+        return ScanInfo(OBJ, self.size, sha256,
+                        triangle_count=self._obj_faces,
+                        vertex_count=self._obj_vertices)
+
+    def _finish_ply(self, sha256):
+        end = self._prefix.find(b'end_header')
+        if not self._prefix.startswith(b'ply') or end == -1:
+            raise ScanFormatError("Invalid PLY file format")
+
+        lines = [line.strip() for line in self._prefix[:end].splitlines()[1:]]
+        if not any(PLY_FORMAT_RE.match(line) for line in lines):
+            raise ScanFormatError("Invalid PLY file format")
+
+        counts = {}
+        for line in lines:
+            match = PLY_ELEMENT_RE.match(line)
+            if match:
+                counts[match.group(1).decode('ascii')] = int(match.group(2))
+        if 'vertex' not in counts:
+            raise ScanFormatError("Invalid PLY file format")
+
+        return ScanInfo(PLY, self.size, sha256,
+                        triangle_count=counts.get('face'),
+                        vertex_count=counts['vertex'])
+
+    def _finish_vrml(self, sha256):
+        if not self._prefix.startswith((b'#VRML V1.0', b'#VRML V2.0')):
+            raise ScanFormatError("Invalid VRML file format")
+        return ScanInfo(VRML, self.size, sha256)
+
+
+def inspect_scan(file_obj):
+    """
+    Inspect an uploaded file chunk by chunk and return its ``ScanInfo``.
+
+    Uploads that went through ``ScanUploadHandler`` were already inspected
+    while streaming, so their result is reused instead of re-reading the file.
+    """
+    info = getattr(file_obj, 'scan_info', None)
+    if info is not None:
+        return info
+    error = getattr(file_obj, 'scan_error', None)
+    if error:
+        raise ScanFormatError(error)
+
+    inspector = ScanInspector(file_obj.name)
+    for chunk in file_obj.chunks():
+        inspector.feed(chunk)
+    if hasattr(file_obj, 'seek'):
+        file_obj.seek(0)
+    return inspector.finish()
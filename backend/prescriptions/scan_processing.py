@@ -0,0 +1,218 @@
+"""
+Post-upload processing for foot scans.
+
+These steps run in the background through the Celery tasks in
+``prescriptions.tasks``.
+"""
+import io
+import logging
+import os
+import shutil
+from contextlib import contextmanager
+
+import numpy as np
+from django.core.files.base import ContentFile
+from django.core.files.temp import NamedTemporaryFile
+from PIL import Image, ImageDraw
+
+from .lod import LOD_LEVELS, decimate, encode_lod
+from .mesh import load_mesh
+from .models import ScanLOD, ScanMetadata
+from .scan_ingest import ScanInspector
+
+logger = logging.getLogger(__name__)
+
+FEET = ('left', 'right')
+
+THUMBNAIL_SIZE = 256
+THUMBNAIL_TRIANGLES = 20000
+
+
+def delete_preview_file(field_file):
+    """
+    Delete a thumbnail or LOD file unless another row still uses it; the
+    copies of a cloned scan share their previews with the original.
+    """
+    instance = field_file.instance
+    others = type(instance).objects.filter(**{field_file.field.name: field_file.name}).exclude(pk=instance.pk)
+    if not others.exists():
+        field_file.delete(save=False)
+
+
+@contextmanager
+def local_scan_path(field_file):
+    """
+    Yield a local filesystem path for a stored scan.
+
+    Files on the local filesystem are used in place; remote storages are
+    copied chunk by chunk into a temporary file first.
+    """
+    try:
+        path = field_file.path
+    except NotImplementedError:
+        path = None
+    if path is not None:
+        yield path
+        return
+
+    _, ext = os.path.splitext(field_file.name)
+    with NamedTemporaryFile(suffix=ext) as tmp:
+        with field_file.open('rb') as source:
+            shutil.copyfileobj(source, tmp)
+        tmp.flush()
+        yield tmp.name
+
+
+def inspect_stored_scan(field_file):
+    """Hash and sniff a stored scan file without loading it into memory."""
+    inspector = ScanInspector(field_file.name)
+    with field_file.open('rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            inspector.feed(chunk)
+    return inspector.finish()
+
+
+def build_scan_metadata(scan, foot, scan_info=None):
+    """
+    Compute and store the ``ScanMetadata`` for one foot of a scan.
+
+    ``scan_info`` is the result of the upload-time inspection; it is
+    recomputed from the stored file when not supplied.
+    """
+    field_file = getattr(scan, f'{foot}_foot')
+    if not field_file:
+        ScanMetadata.objects.filter(scan=scan, foot=foot).delete()
+        return None
+
+    if scan_info is None:
+        scan_info = inspect_stored_scan(field_file)
+
+    with local_scan_path(field_file) as path:
+        mesh = load_mesh(path, scan_info.format)
+
+    bbox_min, bbox_max = mesh.bounding_box()
+    foot_length, foot_width = mesh.foot_dimensions()
+    metadata, _ = ScanMetadata.objects.update_or_create(
+        scan=scan,
+        foot=foot,
+        defaults={
+            'file_format': scan_info.format,
+            'file_size': scan_info.size,
+            'sha256': scan_info.sha256,
+            'triangle_count': mesh.triangle_count,
+            'vertex_count': mesh.vertex_count,
+            'bbox_min_x': float(bbox_min[0]),
+            'bbox_min_y': float(bbox_min[1]),
+            'bbox_min_z': float(bbox_min[2]),
+            'bbox_max_x': float(bbox_max[0]),
+            'bbox_max_y': float(bbox_max[1]),
+            'bbox_max_z': float(bbox_max[2]),
+            'surface_area': mesh.surface_area(),
+            'foot_length': foot_length,
+            'foot_width': foot_width,
+        }
+    )
+    logger.info(
+        f"Scan {scan.id} {foot}: {mesh.triangle_count} triangles, "
+        f"{foot_length:.1f} x {foot_width:.1f}"
+    )
+    return metadata
+
+
+def build_scan_lods(scan, foot):
+    """
+    Build the decimated ``ScanLOD`` levels for one foot of a scan.
+
+    Levels are generated from the finest down, each decimating the previous
+    one, so the full mesh is only clustered once. Levels the original
+    already fits into are skipped; clients fall back to the full scan.
+    """
+    field_file = getattr(scan, f'{foot}_foot')
+    metadata = ScanMetadata.objects.filter(scan=scan, foot=foot).first()
+    # Deleting the rows removes their files (see prescriptions.signals)
+    ScanLOD.objects.filter(scan=scan, foot=foot).delete()
+    if not field_file or metadata is None:
+        return []
+
+    with local_scan_path(field_file) as path:
+        mesh = load_mesh(path, metadata.file_format)
+
+    lods = []
+    for level, target in sorted(LOD_LEVELS.items(), key=lambda item: -item[1]):
+        if mesh.triangle_count <= target:
+            continue
+        mesh = decimate(mesh, target)
+        data = encode_lod(mesh)
+        lod = ScanLOD(
+            scan=scan,
+            foot=foot,
+            level=level,
+            file_size=len(data),
+            triangle_count=mesh.triangle_count,
+            vertex_count=mesh.vertex_count,
+        )
+        lod.file.save(f'{foot}_{level}.lod', ContentFile(data), save=True)
+        lods.append(lod)
+        logger.info(f"Scan {scan.id} {foot}: {level} LOD with {mesh.triangle_count} triangles, {len(data)} bytes")
+    return lods
+
+
+def render_thumbnail(mesh, size=THUMBNAIL_SIZE):
+    """
+    Render a shaded PNG of the mesh seen from below the foot.
+
+    The view follows the principal axes: heel to toe runs left to right and
+    the camera looks along the axis of least spread. Triangles are drawn
+    back to front and shaded by how directly they face the camera.
+    """
+    mesh = decimate(mesh, THUMBNAIL_TRIANGLES)
+    image = Image.new('RGB', (size, size), (248, 249, 250))
+    if mesh.vertex_count < 3 or not mesh.triangle_count:
+        return _png_bytes(image)
+
+    centered = mesh.vertices - mesh.vertices.mean(axis=0)
+    _, axes = np.linalg.eigh(centered.T @ centered)
+    # eigh sorts ascending: length, width, then depth
+    projected = centered @ axes[:, [2, 1, 0]]
+
+    extent = np.ptp(projected[:, :2], axis=0).max() or 1.0
+    scale = size * 0.9 / extent
+    offset = size / 2 - (projected[:, :2].min(axis=0) + projected[:, :2].max(axis=0)) / 2 * scale
+    points = projected[:, :2] * scale + offset
+
+    corners = projected[mesh.faces]
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    lengths = np.linalg.norm(normals, axis=1)
+    facing = np.abs(normals[:, 2]) / np.where(lengths > 0, lengths, 1.0)
+    shades = (70 + 170 * facing).astype(np.uint8)
+
+    draw = ImageDraw.Draw(image)
+    for face in np.argsort(corners[:, :, 2].mean(axis=1)):
+        shade = int(shades[face])
+        draw.polygon(
+            [tuple(point) for point in points[mesh.faces[face]]],
+            fill=(shade // 3, shade // 2, shade)
+        )
+    return _png_bytes(image)
+
+
+def _png_bytes(image):
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
+
+
+def render_scan_thumbnail(scan, foot):
+    """Render and store the thumbnail on one foot's ``ScanMetadata``."""
+    metadata = ScanMetadata.objects.filter(scan=scan, foot=foot).first()
+    field_file = getattr(scan, f'{foot}_foot')
+    if metadata is None or not field_file:
+        return None
+
+    with local_scan_path(field_file) as path:
+        mesh = load_mesh(path, metadata.file_format)
+
+    if metadata.thumbnail:
+        delete_preview_file(metadata.thumbnail)
+    metadata.thumbnail.save(f'{scan.id}_{foot}.png', ContentFile(render_thumbnail(mesh)), save=True)
+    return metadata
@@ -1,14 +1,21 @@
 """
 Serializers for the prescriptions app.
 """
+import functools
+
 from rest_framework import serializers
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from core.serialization import CompiledReadMixin
 from patients.serializers import PatientSerializer
 from .models import (
     Template, Prescription, Scan, ClinicalMeasure, IntrinsicAdjustment,
     OffLoading, PlanterModifier, Posting, MaterialSelection, ShoeFitting,
-    DeviceOption, Attachment, PrescriptionStatus, FootType, WearTime, Activity
+    DeviceOption, Attachment, PrescriptionStatus, FootType, WearTime, Activity,
+    ScanMetadata, ScanLOD, UploadSession
 )
+from .scan_ingest import ScanFormatError, ScanInspector, inspect_scan
+from .uploads import max_upload_size
 
 User = get_user_model()
 
@@ -22,6 +29,36 @@ class TemplateSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at']
         ref_name = 'PrescriptionTemplate'
 
+class ScanMetadataSerializer(serializers.ModelSerializer):
+    """
+    Serializer for the ScanMetadata model.
+    """
+    bounding_box = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = ScanMetadata
+        fields = [
+            'foot', 'file_format', 'file_size', 'sha256',
+            'triangle_count', 'vertex_count', 'bounding_box',
+            'surface_area', 'foot_length', 'foot_width', 'thumbnail',
+        ]
+        read_only_fields = fields
+    
+    def get_bounding_box(self, obj):
+        return {
+            'min': [obj.bbox_min_x, obj.bbox_min_y, obj.bbox_min_z],
+            'max': [obj.bbox_max_x, obj.bbox_max_y, obj.bbox_max_z],
+        }
+
+class ScanLODSerializer(serializers.ModelSerializer):
+    """
+    Serializer for the ScanLOD model.
+    """
+    class Meta:
+        model = ScanLOD
+        fields = ['foot', 'level', 'file_size', 'triangle_count', 'vertex_count']
+        read_only_fields = fields
+
 class ScanSerializer(serializers.ModelSerializer):
     """
     Serializer for the Scan model.
@@ -30,15 +67,20 @@ class ScanSerializer(serializers.ModelSerializer):
     """
     left_foot_url = serializers.SerializerMethodField(read_only=True)
     right_foot_url = serializers.SerializerMethodField(read_only=True)
+    metadata = ScanMetadataSerializer(many=True, read_only=True)
+    lods = ScanLODSerializer(many=True, read_only=True)
     
     class Meta:
         model = Scan
         fields = [
             'id', 'prescription', 'left_foot', 'right_foot', 
-            'left_foot_url', 'right_foot_url',
-            'created_at', 'updated_at'
+            'left_foot_url', 'right_foot_url', 'processing_status', 'processing_error',
+            'metadata', 'lods', 'created_at', 'updated_at'
+        ]
+        read_only_fields = [
+            'id', 'created_at', 'updated_at', 'left_foot_url', 'right_foot_url',
+            'processing_status', 'processing_error', 'metadata', 'lods'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at', 'left_foot_url', 'right_foot_url']
     
     def get_left_foot_url(self, obj):
         """Get the full URL for the left foot scan."""
@@ -70,99 +112,34 @@ class ScanSerializer(serializers.ModelSerializer):
     
     def validate_left_foot(self, value):
         """Validate the left foot scan file."""
-        if value:
-            # Check file size (50MB max for 3D files)
-            max_size = 50 * 1024 * 1024  # 50 MB
-            if value.size > max_size:
-                raise serializers.ValidationError(
-                    f"File size should not exceed {max_size / (1024 * 1024)}MB."
-                )
-            
-            # Check file extension
-            allowed_extensions = ['.stl', '.wrl', '.vrml', '.obj', '.ply']
-            import os
-            ext = os.path.splitext(value.name)[1].lower()
-            if ext not in allowed_extensions:
-                raise serializers.ValidationError(
-                    f"File extension not allowed. Allowed extensions are: {', '.join(allowed_extensions)}"
-                )
-            
-            # Basic content validation for STL files
-            if ext == '.stl':
-                try:
-                    header = value.read(5).decode('utf-8')
-                    value.seek(0)  # Reset file pointer
-                    if not (header.startswith('solid') or self._is_binary_stl(value)):
-                        raise serializers.ValidationError("Invalid STL file format")
-                except UnicodeDecodeError:
-                    # If we can't decode as UTF-8, check if it's a binary STL
-                    if not self._is_binary_stl(value):
-                        raise serializers.ValidationError("Invalid STL file format")
-                    value.seek(0)  # Reset file pointer
-        return value
+        return self._validate_scan_file(value)
     
     def validate_right_foot(self, value):
         """Validate the right foot scan file."""
-        if value:
-            # Check file size (50MB max for 3D files)
-            max_size = 50 * 1024 * 1024  # 50 MB
-            if value.size > max_size:
-                raise serializers.ValidationError(
-                    f"File size should not exceed {max_size / (1024 * 1024)}MB."
-                )
-            
-            # Check file extension
-            allowed_extensions = ['.stl', '.wrl', '.vrml', '.obj', '.ply']
-            import os
-            ext = os.path.splitext(value.name)[1].lower()
-            if ext not in allowed_extensions:
-                raise serializers.ValidationError(
-                    f"File extension not allowed. Allowed extensions are: {', '.join(allowed_extensions)}"
-                )
-            
-            # Basic content validation for STL files
-            if ext == '.stl':
-                try:
-                    header = value.read(5).decode('utf-8')
-                    value.seek(0)  # Reset file pointer
-                    if not (header.startswith('solid') or self._is_binary_stl(value)):
-                        raise serializers.ValidationError("Invalid STL file format")
-                except UnicodeDecodeError:
-                    # If we can't decode as UTF-8, check if it's a binary STL
-                    if not self._is_binary_stl(value):
-                        raise serializers.ValidationError("Invalid STL file format")
-                    value.seek(0)  # Reset file pointer
-        return value
+        return self._validate_scan_file(value)
     
-    def _is_binary_stl(self, file_obj):
-        """Check if the file is a binary STL format."""
+    def _validate_scan_file(self, value):
+        """
+        Check the size, extension and content of a scan file.
+        
+        Uploads streamed through ``ScanUploadHandler`` were already inspected
+        chunk by chunk, anything else is inspected here without seeking around
+        or buffering the whole file.
+        """
+        if not value:
+            return value
+        
+        max_size = getattr(settings, 'SCAN_MAX_FILE_SIZE', 50 * 1024 * 1024)
+        if value.size > max_size:
+            raise serializers.ValidationError(
+                f"File size should not exceed {max_size / (1024 * 1024)}MB."
+            )
+        
         try:
-            # Save current position
-            current_pos = file_obj.tell()
-            
-            # Binary STL files have an 80-byte header followed by a 4-byte number
-            file_obj.seek(0)
-            header = file_obj.read(80)
-            num_triangles_bytes = file_obj.read(4)
-            
-            # Reset file position
-            file_obj.seek(current_pos)
-            
-            # If we couldn't read 84 bytes, it's not a valid binary STL
-            if len(header) != 80 or len(num_triangles_bytes) != 4:
-                return False
-            
-            # Check if the file size matches what we expect for the number of triangles
-            import struct
-            num_triangles = struct.unpack('<I', num_triangles_bytes)[0]
-            expected_size = 80 + 4 + (50 * num_triangles)
-            actual_size = file_obj.size
-            
-            # Allow some tolerance in the size comparison
-            return abs(expected_size - actual_size) < 100
-            
-        except Exception:
-            return False
+            value.scan_info = inspect_scan(value)
+        except ScanFormatError as e:
+            raise serializers.ValidationError(str(e))
+        return value
 
 class ClinicalMeasureSerializer(serializers.ModelSerializer):
     """
@@ -314,6 +291,30 @@ class AttachmentSerializer(serializers.ModelSerializer):
         fields = ['id', 'prescription', 'file', 'filename', 'uploaded_at']
         read_only_fields = ['id', 'uploaded_at']
 
+class UploadSessionSerializer(serializers.ModelSerializer):
+    """
+    Serializer for the UploadSession model.
+    """
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'target', 'filename', 'length', 'offset', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'offset', 'created_at', 'updated_at']
+    
+    def validate(self, attrs):
+        max_size = max_upload_size(attrs['target'])
+        if attrs['length'] > max_size:
+            raise serializers.ValidationError(
+                {'length': f"File size should not exceed {max_size / (1024 * 1024)}MB."}
+            )
+        if attrs['length'] < 0:
+            raise serializers.ValidationError({'length': "Length cannot be negative."})
+        if attrs['target'] != 'attachment':
+            try:
+                ScanInspector(attrs['filename'])
+            except ScanFormatError as e:
+                raise serializers.ValidationError({'filename': str(e)})
+        return attrs
+
 class PrescriptionStatusSerializer(serializers.ModelSerializer):
     """
     Serializer for the PrescriptionStatus model.
@@ -379,7 +380,23 @@ class PrescriptionListSerializer(serializers.ModelSerializer):
     def get_status_name(self, obj):
         return obj.status.name if obj.status else None
 
-class PrescriptionDetailSerializer(serializers.ModelSerializer):
+class PrescriptionListRowSerializer(CompiledReadMixin, serializers.Serializer):
+    """
+    Read-only serializer for ``Prescription.objects.list_rows()``.
+
+    Renders the same fields as ``PrescriptionListSerializer`` from rows whose
+    names were annotated in SQL, so a list costs one query however long it is.
+    """
+    id = serializers.UUIDField(read_only=True)
+    patient_name = serializers.CharField(read_only=True)
+    clinician_name = serializers.CharField(read_only=True)
+    template_name = serializers.CharField(read_only=True)
+    status = serializers.IntegerField(read_only=True)
+    status_name = serializers.CharField(read_only=True)
+    created_at = serializers.DateTimeField(read_only=True)
+    updated_at = serializers.DateTimeField(read_only=True)
+
+class PrescriptionDetailSerializer(CompiledReadMixin, serializers.ModelSerializer):
     """
     Detailed serializer for a complete prescription with all related data.
     """
@@ -394,7 +411,7 @@ class PrescriptionDetailSerializer(serializers.ModelSerializer):
     clinical_measures = ClinicalMeasureSerializer(read_only=True)
     intrinsic_adjustments = IntrinsicAdjustmentSerializer(read_only=True)
     off_loading = OffLoadingSerializer(read_only=True)
-    planter_modifiers = PlanterModifierSerializer(read_only=True)
+    planter_modifiers = PlanterModifierSerializer(source='planter_modifier', read_only=True)
     postings = PostingSerializer(read_only=True)
     material_selection = MaterialSelectionSerializer(read_only=True)
     shoe_fitting = ShoeFittingSerializer(read_only=True)
@@ -439,5 +456,130 @@ class PrescriptionCreateSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id']
 
+class PrescriptionCloneSerializer(serializers.Serializer):
+    """
+    Options for copying a prescription into a repeat order.
+    """
+    include_scans = serializers.BooleanField(
+        default=False, help_text="Share the original's scans with the copy"
+    )
+    status = serializers.PrimaryKeyRelatedField(
+        queryset=PrescriptionStatus.objects.all(), required=False, allow_null=True, default=None,
+        help_text="Status of the copy"
+    )
+
+@functools.lru_cache(maxsize=None)
+def section_serializer(serializer_class):
+    """``serializer_class`` without its ``prescription`` field, for use inside a prescription."""
+    meta = serializer_class.Meta
+    attrs = {
+        'fields': [name for name in meta.fields if name != 'prescription'],
+        'read_only_fields': getattr(meta, 'read_only_fields', []),
+    }
+    return type(serializer_class.__name__, (serializer_class,), {
+        'Meta': type('Meta', (meta,), attrs),
+        '__module__': __name__,
+    })
+
+
+class PrescriptionFullSerializer(serializers.ModelSerializer):
+    """
+    Writes a prescription and all of its workflow sections in one go.
+    
+    Accepts the prescription's own fields next to one object per section
+    (``clinical_measures``, ``postings``, ...), the same shape the detail
+    endpoint returns. Every section is validated before anything is saved,
+    and only rows whose values actually change are written.
+    """
+    # {request key: (related name on Prescription, model, serializer)}
+    SECTIONS = {
+        'clinical_measures': ('clinical_measures', ClinicalMeasure, section_serializer(ClinicalMeasureSerializer)),
+        'intrinsic_adjustments': ('intrinsic_adjustments', IntrinsicAdjustment, section_serializer(IntrinsicAdjustmentSerializer)),
+        'off_loading': ('off_loading', OffLoading, section_serializer(OffLoadingSerializer)),
+        'planter_modifiers': ('planter_modifier', PlanterModifier, section_serializer(PlanterModifierSerializer)),
+        'postings': ('postings', Posting, section_serializer(PostingSerializer)),
+        'material_selection': ('material_selection', MaterialSelection, section_serializer(MaterialSelectionSerializer)),
+        'shoe_fitting': ('shoe_fitting', ShoeFitting, section_serializer(ShoeFittingSerializer)),
+        'device_options': ('device_options', DeviceOption, section_serializer(DeviceOptionSerializer)),
+    }
+    
+    class Meta:
+        model = Prescription
+        fields = [
+            'template', 'status', 'foot_type', 'wear_time', 'activity_level',
+            'turnaround', 'contact_clinician', 'confirm_before_manufacture', 'clinician_computer_aided_design',
+            'general_notes', 'left_foot_notes', 'right_foot_notes',
+        ]
+    
+    def get_fields(self):
+        fields = super().get_fields()
+        for name in self.SECTIONS:
+            fields[name] = serializers.DictField(required=False)
+        return fields
+    
+    def to_internal_value(self, data):
+        """Validate the prescription and every section, and report all errors together."""
+        errors = {}
+        try:
+            attrs = super().to_internal_value(data)
+        except serializers.ValidationError as exc:
+            attrs, errors = {}, dict(exc.detail)
+        
+        self.sections = []
+        for name, (related_name, model, serializer_class) in self.SECTIONS.items():
+            attrs.pop(name, None)
+            if name not in data or name in errors:
+                continue
+            row = getattr(self.instance, related_name, None) if self.instance else None
+            # A missing section row starts from the model defaults, so PATCH can fill it in
+            serializer = serializer_class(row, data=data[name], partial=self.partial or row is None)
+            if serializer.is_valid():
+                self.sections.append((related_name, model, row, serializer.validated_data))
+            else:
+                errors[name] = serializer.errors
+        if errors:
+            raise serializers.ValidationError(errors)
+        return attrs
+    
+    @staticmethod
+    def changed_fields(row, values):
+        return [name for name, value in values.items() if getattr(row, name) != value]
+    
+    def update(self, instance, validated_data):
+        """Save the changed sections, then the prescription if anything changed."""
+        changed = self.changed_fields(instance, validated_data)
+        sections_changed = False
+        for related_name, model, row, values in self.sections:
+            if row is None:
+                row = model.objects.create(prescription=instance, **values)
+                setattr(instance, related_name, row)
+                sections_changed = True
+                continue
+            section_fields = self.changed_fields(row, values)
+            if section_fields:
+                for name in section_fields:
+                    setattr(row, name, values[name])
+                if any(field.name == 'updated_at' for field in model._meta.fields):
+                    section_fields.append('updated_at')
+                row.save(update_fields=section_fields)
+                sections_changed = True
+        
+        for name in changed:
+            setattr(instance, name, validated_data[name])
+        if changed or sections_changed:
+            # Saved even for section-only changes, so updated_at reflects them
+            instance.save(update_fields=changed + ['updated_at'])
+        return instance
+
+
+class JSONPatchOperationSerializer(serializers.Serializer):
+    """
+    One operation of a JSON Patch document, see ``prescriptions.json_patch``.
+    """
+    op = serializers.ChoiceField(choices=['add', 'replace', 'test'])
+    path = serializers.CharField(help_text="JSON Pointer to a field, e.g. /postings/left_heel_post_angle")
+    value = serializers.JSONField(allow_null=True)
+
+
 # Add an alias for backwards compatibility
 PrescriptionSerializer = PrescriptionListSerializer 
\ No newline at end of file
@@ -0,0 +1,119 @@
+"""
+Signal handlers for the prescriptions app.
+"""
+import logging
+import uuid
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core.blobs import stored_names, track_blob_references
+from core.caching import invalidate_all_clinic_caches, track_clinic_changes
+from patients.models import Patient
+from .lookups import LOOKUP_MODELS, bump_lookup_version
+from .models import Prescription, Scan, ScanLOD, ScanMetadata, Attachment
+from .scan_processing import FEET, delete_preview_file
+
+logger = logging.getLogger(__name__)
+
+# Scan and attachment files live in the shared, reference-counted blob store
+track_blob_references(Scan, 'left_foot', 'right_foot')
+track_blob_references(Attachment, 'file')
+
+track_clinic_changes(Prescription)
+
+
+@receiver(pre_save, sender=Prescription)
+def set_prescription_clinic(sender, instance, raw=False, **kwargs):
+    """Prescriptions belong to their patient's clinic; set the patient, not only ``patient_id``."""
+    if raw:
+        return
+    if Prescription.patient.is_cached(instance):
+        instance.clinic_id = instance.patient.clinic_id
+    elif instance._state.adding or instance.clinic_id is None:
+        instance.clinic_id = Patient.objects.filter(pk=instance.patient_id).values_list('clinic_id', flat=True).first()
+
+
+@receiver(post_save, sender=Patient)
+def sync_prescription_clinic(sender, instance, raw=False, **kwargs):
+    """Move a patient's prescriptions along when the patient changes clinic."""
+    update_fields = kwargs.get('update_fields')
+    if raw or kwargs.get('created') or (update_fields and 'clinic' not in update_fields):
+        return
+    Prescription.objects.filter(patient=instance).exclude(clinic_id=instance.clinic_id).update(clinic_id=instance.clinic_id)
+
+
+@receiver(pre_save, sender=Scan)
+def mark_scan_for_processing(sender, instance, raw=False, **kwargs):
+    """Reset the processing status when a foot gets a new or different file."""
+    if raw:
+        return
+    # The blob tracker's pre_save ran first and filled in the stored names
+    # of files that were deferred when the scan was loaded
+    stored = stored_names(instance)
+    changed = []
+    for foot in FEET:
+        field = f'{foot}_foot'
+        if field not in instance.__dict__:
+            # Still deferred, so unchanged
+            continue
+        field_file = getattr(instance, field)
+        is_new_upload = bool(field_file) and not field_file._committed
+        if is_new_upload or instance._state.adding or (field_file.name or '') != stored.get(field, ''):
+            if field_file or stored.get(field, ''):
+                changed.append(foot)
+    if changed:
+        if instance.processing_status in ('pending', 'processing') and not instance._state.adding:
+            # The chain queued for earlier changes is superseded before it
+            # finished, so the new one processes its feet as well
+            changed = list(FEET)
+        instance.processing_status = 'pending'
+        instance.processing_error = ''
+        instance.processing_token = uuid.uuid4()
+    instance._changed_scan_feet = changed
+
+
+@receiver(post_save, sender=Scan)
+def queue_scan_processing(sender, instance, raw=False, **kwargs):
+    """Hand changed feet to the Celery post-processing chain once committed."""
+    feet = getattr(instance, '_changed_scan_feet', [])
+    instance._changed_scan_feet = []
+    if raw or not feet:
+        return
+    token = instance.processing_token
+
+    def enqueue():
+        from .tasks import process_scan
+
+        process_scan(instance.pk, feet, token)
+
+    transaction.on_commit(enqueue)
+
+
+@receiver(post_delete, sender=ScanLOD)
+def delete_scan_lod_file(sender, instance, **kwargs):
+    """LOD files go with the last row using them."""
+    if instance.file:
+        delete_preview_file(instance.file)
+
+
+@receiver(post_delete, sender=ScanMetadata)
+def delete_scan_thumbnail(sender, instance, **kwargs):
+    if instance.thumbnail:
+        delete_preview_file(instance.thumbnail)
+
+
+def invalidate_lookup_table(sender, **kwargs):
+    """Expire the cached copies of a lookup table, see ``prescriptions.lookups``."""
+    # Bump now for this transaction, and again on commit so no process
+    # caches the old rows under the new version in between
+    bump_lookup_version(sender)
+    transaction.on_commit(lambda: bump_lookup_version(sender))
+    # Prescription lists show status and template names
+    invalidate_all_clinic_caches()
+
+
+for lookup_model in LOOKUP_MODELS:
+    post_save.connect(invalidate_lookup_table, sender=lookup_model, dispatch_uid=f'lookup-save-{lookup_model.__name__}')
+    post_delete.connect(invalidate_lookup_table, sender=lookup_model, dispatch_uid=f'lookup-delete-{lookup_model.__name__}')
@@ -0,0 +1,171 @@
+"""
+Celery tasks for scan post-processing.
+
+Saving a ``Scan`` with new or changed files queues ``scan_processing_chain``,
+which runs ``start_scan_processing`` and then, for every changed foot:
+
+    validate_scan          re-read the stored file, sniff its format and
+                           compute its SHA-256 checksum in a single pass
+    extract_scan_metadata  load the mesh and store its ``ScanMetadata``
+    render_scan_thumbnail  render a PNG preview onto the metadata
+    build_scan_lods        build the decimated ``ScanLOD`` levels
+
+and finally ``finish_scan_processing``. ``Scan.processing_status`` follows
+the chain so clients can poll it; the first failing step marks the scan
+``failed`` with its error and stops the chain.
+
+Every chain carries the ``Scan.processing_token`` it was queued with, and
+each step only acts while the scan still has that token. A save that
+queues a new chain sets a new token, so an older chain still running
+cannot mark the scan ready before the new one is done, nor mark it failed.
+"""
+import logging
+from contextlib import contextmanager
+
+from celery import chain, shared_task
+from django.utils import timezone
+
+from core.storage import is_blob_name
+from .models import Scan
+from .scan_ingest import ScanFormatError, ScanInfo
+from .scan_processing import (
+    FEET,
+    build_scan_lods as build_lods,
+    build_scan_metadata,
+    inspect_stored_scan,
+    render_scan_thumbnail as render_thumbnail,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def _scan_step(scan_id, token, step):
+    """Record a failing step on the scan before letting the error stop the chain."""
+    try:
+        yield
+    except Exception as e:
+        logger.error(f"Error in {step} for scan {scan_id}: {str(e)}")
+        Scan.objects.filter(pk=scan_id, processing_token=token).update(
+            processing_status='failed',
+            processing_error=f"{step}: {str(e)}",
+            updated_at=timezone.now(),
+        )
+        raise
+
+
+def _get_scan(scan_id, token):
+    """The scan, or ``None`` if it is gone or a later chain superseded this one."""
+    return Scan.objects.filter(pk=scan_id, processing_token=token).first()
+
+
+@shared_task
+def start_scan_processing(scan_id, token=None):
+    Scan.objects.filter(pk=scan_id, processing_token=token).update(
+        processing_status='processing', processing_error='', updated_at=timezone.now()
+    )
+
+
+@shared_task
+def validate_scan(scan_id, foot, token=None):
+    """
+    Check the stored file is a well-formed scan and compute its checksum.
+
+    Blob names carry the digest computed while the file was uploaded, so a
+    mismatch means the bytes changed on the way to disk.
+    """
+    with _scan_step(scan_id, token, f'{foot} validation'):
+        scan = _get_scan(scan_id, token)
+        field_file = getattr(scan, f'{foot}_foot') if scan else None
+        if not field_file:
+            return None
+
+        scan_info = inspect_stored_scan(field_file)
+        if is_blob_name(field_file.name):
+            expected = field_file.name.rsplit('/', 1)[-1].split('.', 1)[0]
+            if scan_info.sha256 != expected:
+                raise ScanFormatError(f"Checksum mismatch: expected {expected}, got {scan_info.sha256}")
+        return {'format': scan_info.format, 'size': scan_info.size, 'sha256': scan_info.sha256}
+
+
+@shared_task
+def extract_scan_metadata(scan_info, scan_id, foot, token=None):
+    """Store the ``ScanMetadata`` for a validated foot (``scan_info`` from ``validate_scan``)."""
+    with _scan_step(scan_id, token, f'{foot} metadata'):
+        scan = _get_scan(scan_id, token)
+        if scan is None:
+            return None
+        if scan_info is not None:
+            scan_info = ScanInfo(scan_info['format'], scan_info['size'], scan_info['sha256'])
+            build_scan_metadata(scan, foot, scan_info)
+        else:
+            # The foot was cleared
+            build_scan_metadata(scan, foot)
+        return foot
+
+
+@shared_task
+def render_scan_thumbnail(scan_id, foot, token=None):
+    with _scan_step(scan_id, token, f'{foot} thumbnail'):
+        scan = _get_scan(scan_id, token)
+        if scan is not None:
+            render_thumbnail(scan, foot)
+
+
+@shared_task
+def build_scan_lods(scan_id, foot, token=None):
+    with _scan_step(scan_id, token, f'{foot} LODs'):
+        scan = _get_scan(scan_id, token)
+        if scan is not None:
+            build_lods(scan, foot)
+
+
+@shared_task
+def finish_scan_processing(scan_id, token=None):
+    finished = Scan.objects.filter(pk=scan_id, processing_token=token, processing_status='processing').update(
+        processing_status='ready', processing_error='', updated_at=timezone.now()
+    )
+    if finished:
+        logger.info(f"Finished processing scan {scan_id}")
+
+
+def scan_processing_chain(scan_id, feet, token=None):
+    """Build the post-processing chain for the given feet of a scan and its ``processing_token``."""
+    token = str(token) if token else None
+    steps = [start_scan_processing.si(scan_id, token)]
+    for foot in feet:
+        steps += [
+            validate_scan.si(scan_id, foot, token),
+            extract_scan_metadata.s(scan_id, foot, token),
+            render_scan_thumbnail.si(scan_id, foot, token),
+            build_scan_lods.si(scan_id, foot, token),
+        ]
+    steps.append(finish_scan_processing.si(scan_id, token))
+    return chain(*steps)
+
+
+def process_scan(scan_id, feet, token=None):
+    """
+    Queue the post-processing chain for ``feet`` of a scan. Without a
+    broker the scan stays pending; set ``CELERY_TASK_ALWAYS_EAGER`` to
+    process inline instead.
+    """
+    try:
+        scan_processing_chain(str(scan_id), feet, token).apply_async()
+    except Exception as e:
+        logger.error(f"Could not queue processing for scan {scan_id}: {str(e)}")
+
+
+@shared_task
+def queue_pending_scans(scan_ids):
+    """Queue the post-processing chain of every scan in ``scan_ids`` still pending."""
+    for scan in Scan.objects.filter(pk__in=scan_ids, processing_status='pending'):
+        process_scan(scan.pk, [foot for foot in FEET if getattr(scan, f'{foot}_foot')], scan.processing_token)
+
+
+def process_scans(scan_ids):
+    """Queue processing for many scans, e.g. the copies of a clone, with a single task."""
+    try:
+        queue_pending_scans.delay([str(scan_id) for scan_id in scan_ids])
+    except Exception as e:
+        logger.error(f"Could not queue processing for {len(scan_ids)} scans: {str(e)}")
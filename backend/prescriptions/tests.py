@@ -1,3 +1,948 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import StopFutureHandlers
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+
+from core.benchmarks import create_clinic_user, create_patient, create_scan_metadata, measure
+from core.models import Blob
+from .benchmarks import create_complete_prescription, prescription_clone
+from .models import (
+    Template, Prescription, Scan, ClinicalMeasure, IntrinsicAdjustment,
+    OffLoading, PlanterModifier, Posting, MaterialSelection, ShoeFitting,
+    DeviceOption, Attachment, PrescriptionStatus, ScanLOD, FootType, WearTime, Activity, UploadSession
+)
+from . import lookups
+from .lod import LOD_HEADER, LOD_MAGIC, LOD_VERSION, decimate, decode_lod, encode_lod
+from .mesh import STL_DTYPE, Mesh, load_mesh
+from .scan_ingest import OBJ, PLY, STL_ASCII, STL_BINARY, VRML, ScanFormatError, ScanInspector, inspect_scan
+from .serializers import ScanSerializer
+from .tasks import finish_scan_processing, start_scan_processing, validate_scan
+from .upload_handlers import ScanUploadHandler
+from .uploads import UploadError, append_chunk
+
+
+class PrescriptionQueryCountTests(TestCase):
+    """
+    Upper bounds on the queries each prescription endpoint runs.
+
+    The bounds must not depend on how many prescriptions, scans or
+    attachments exist; if one fails, a serializer gained a relation that
+    ``PrescriptionViewSet.get_queryset`` does not load up front.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient, cls.user = create_patient()
+        cls.template = Template.objects.create(name='Standard')
+        cls.status = PrescriptionStatus.objects.create(name='Draft')
+        cls.foot_type = FootType.objects.create(name='Neutral')
+        cls.wear_time = WearTime.objects.create(name='All day')
+        cls.activity = Activity.objects.create(name='Walking')
+        cls.prescription = cls.create_prescription()
+        cls.add_details(cls.prescription, scans=1)
+
+    @classmethod
+    def create_prescription(cls):
+        return Prescription.objects.create(
+            patient=cls.patient, clinician=cls.user, template=cls.template,
+            status=cls.status, foot_type=cls.foot_type, wear_time=cls.wear_time,
+            activity_level=cls.activity
+        )
+
+    @classmethod
+    def add_details(cls, prescription, scans):
+        for model in (
+            ClinicalMeasure, IntrinsicAdjustment, OffLoading, PlanterModifier,
+            Posting, MaterialSelection, ShoeFitting, DeviceOption,
+        ):
+            model.objects.create(prescription=prescription)
+        for _ in range(scans):
+            scan = Scan.objects.create(prescription=prescription)
+            for foot in ('left', 'right'):
+                create_scan_metadata(scan, foot)
+            Attachment.objects.create(prescription=prescription, file='blobs/00/00/notes.pdf', filename='notes.pdf')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertMaxQueries(self, limit, method, url, **kwargs):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, **kwargs)
+        self.assertLess(response.status_code, 400, response.content)
+        self.assertLessEqual(
+            len(queries), limit,
+            f"{method.upper()} {url} ran {len(queries)} queries:\n"
+            + "\n".join(query['sql'] for query in queries.captured_queries)
+        )
+        return response
+
+    def test_list(self):
+        response = self.assertMaxQueries(2, 'get', '/api/prescriptions/')
+        row = response.data['results'][0]
+        self.assertEqual(row['patient_name'], 'Benchmark Patient')
+        self.assertEqual(row['clinician_name'], 'Benchmark Clinician')
+        self.assertEqual(row['template_name'], 'Standard')
+        self.assertEqual((row['status'], row['status_name']), (self.status.id, 'Draft'))
+        for _ in range(5):
+            self.create_prescription()
+        self.assertMaxQueries(2, 'get', '/api/prescriptions/')
+
+    def test_patient_prescriptions(self):
+        patient = self.prescription.patient
+        url = f'/api/patients/{patient.id}/prescriptions/'
+        self.assertMaxQueries(2, 'get', url)
+        Prescription.objects.bulk_create([
+            Prescription(patient=patient, clinic_id=patient.clinic_id, clinician=self.user, template=self.template)
+            for _ in range(20)
+        ])
+        response = self.assertMaxQueries(2, 'get', url)
+        self.assertEqual(len(response.data), 21)
+
+    def test_retrieve(self):
+        url = f'/api/prescriptions/{self.prescription.id}/'
+        response = self.assertMaxQueries(5, 'get', url)
+        for key in ('clinical_measures', 'planter_modifiers', 'device_options', 'scans', 'attachments'):
+            self.assertIn(key, response.data)
+        self.assertEqual(len(response.data['scans'][0]['metadata']), 2)
+
+        self.add_details(self.create_prescription(), scans=0)
+        for _ in range(3):
+            scan = Scan.objects.create(prescription=self.prescription)
+            Attachment.objects.create(prescription=self.prescription, file=f'blobs/00/00/{scan.id}.pdf', filename='x.pdf')
+        self.assertMaxQueries(5, 'get', url)
+
+    def test_update(self):
+        self.assertMaxQueries(3, 'patch', f'/api/prescriptions/{self.prescription.id}/')
+
+    def test_scans(self):
+        url = f'/api/prescriptions/{self.prescription.id}/scans/'
+        self.assertMaxQueries(4, 'get', url)
+        Scan.objects.create(prescription=self.prescription)
+        self.assertMaxQueries(4, 'get', url)
+
+    def test_attachments(self):
+        self.assertMaxQueries(2, 'get', f'/api/prescriptions/{self.prescription.id}/attachments/')
+
+    def test_sub_resources(self):
+        for action in (
+            'clinical_measures', 'intrinsic_adjustments', 'off_loadings', 'plantar-modifiers',
+            'postings', 'material_selection', 'shoe_fitting', 'device_options',
+        ):
+            with self.subTest(action=action):
+                self.assertMaxQueries(2, 'get', f'/api/prescriptions/{self.prescription.id}/{action}/')
+
+    def test_full_update(self):
+        url = f'/api/prescriptions/{self.prescription.id}/full/'
+        body = {
+            'general_notes': 'Ready for manufacture',
+            'clinical_measures': {'left_scan_angle': 4.5},
+            'off_loading': {'custom_notes': 'Dome under 2nd MTPJ'},
+        }
+        # Load with prefetches, savepoint, one update per changed row and
+        # the clinic lookup of the cache invalidation
+        response = self.assertMaxQueries(11, 'patch', url, data=body, format='json')
+        self.assertEqual(response.data['general_notes'], 'Ready for manufacture')
+        self.assertEqual(response.data['clinical_measures']['left_scan_angle'], 4.5)
+        self.assertEqual(response.data['off_loading']['custom_notes'], 'Dome under 2nd MTPJ')
+
+        # Nothing changed, nothing written
+        with CaptureQueriesContext(connection) as queries:
+            self.client.patch(url, data=body, format='json')
+        self.assertFalse([query for query in queries.captured_queries if query['sql'].startswith('UPDATE')])
+
+        response = self.client.patch(url, data={'clinical_measures': {'left_scan_angle': 'steep'}, 'status': 0}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data), {'clinical_measures', 'status'})
+
+    def test_json_patch(self):
+        url = f'/api/prescriptions/{self.prescription.id}/json-patch/'
+
+        def patch(operations):
+            return self.client.patch(url, data=json.dumps(operations), content_type='application/json-patch+json')
+
+        operations = [
+            {'op': 'replace', 'path': '/general_notes', 'value': 'Cast on 12/3'},
+            {'op': 'test', 'path': '/postings/left_heel_post_angle', 'value': None},
+            {'op': 'replace', 'path': '/postings/left_heel_post_angle', 'value': 4},
+            {'op': 'test', 'path': '/postings/left_heel_post_angle', 'value': 4},
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = patch(operations)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.data['general_notes'], 'Cast on 12/3')
+        self.assertEqual(response.data['postings']['left_heel_post_angle'], 4)
+        updates = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 2)
+        self.assertNotIn('left_foot_notes', ' '.join(updates))
+
+        # Only the changed columns are written, so nothing at all the second time
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(patch(operations[2:]).status_code, 200)
+        self.assertFalse([query for query in queries.captured_queries if query['sql'].startswith('UPDATE')])
+
+        response = patch([
+            {'op': 'test', 'path': '/postings/left_heel_post_angle', 'value': 2},
+            {'op': 'replace', 'path': '/general_notes', 'value': 'Overwritten'},
+        ])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Prescription.objects.get(pk=self.prescription.pk).general_notes, 'Cast on 12/3')
+
+        # Tests see a pending value as it will be stored
+        response = patch([
+            {'op': 'replace', 'path': '/postings/left_heel_post_angle', 'value': '6'},
+            {'op': 'test', 'path': '/postings/left_heel_post_angle', 'value': 6},
+            {'op': 'replace', 'path': '/template', 'value': str(self.prescription.template_id).upper()},
+            {'op': 'test', 'path': '/template', 'value': str(self.prescription.template_id)},
+        ])
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.data['postings']['left_heel_post_angle'], 6)
+        response = patch([
+            {'op': 'replace', 'path': '/postings/left_heel_post_angle', 'value': '7'},
+            {'op': 'test', 'path': '/postings/left_heel_post_angle', 'value': '6'},
+        ])
+        self.assertEqual(response.status_code, 409)
+
+        for operation in (
+            {'op': 'replace', 'path': '/patient', 'value': 1},
+            {'op': 'replace', 'path': '/postings/id', 'value': 1},
+            {'op': 'remove', 'path': '/general_notes'},
+        ):
+            with self.subTest(operation=operation):
+                self.assertEqual(patch([operation]).status_code, 400)
+
+    def test_conditional_requests(self):
+        for action in (
+            'clinical_measures', 'intrinsic_adjustments', 'off_loadings', 'plantar-modifiers',
+            'postings', 'material_selection', 'shoe_fitting', 'device_options', 'scans', 'attachments',
+        ):
+            with self.subTest(action=action):
+                url = f'/api/prescriptions/{self.prescription.id}/{action}/'
+                etag = self.client.get(url)['ETag']
+                self.assertTrue(etag.startswith('W/"'))
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], etag)
+
+        url = f'/api/prescriptions/{self.prescription.id}/clinical_measures/'
+        etag = self.client.get(url)['ETag']
+        response = self.client.patch(url, data={'left_scan_angle': 3}, format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        # A write based on the version before the last one is rejected
+        response = self.client.patch(url, data={'left_scan_angle': 5}, format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(ClinicalMeasure.objects.get(prescription=self.prescription).left_scan_angle, 3)
+
+    def test_sub_resource_saves(self):
+        prescription = self.create_prescription()
+        for action, body in (
+            ('clinical_measures', {'left_scan_angle': 4.5}),
+            ('postings', {'left_heel_post_angle': 2}),
+            ('plantar-modifiers', {'left_y_rib': 3}),
+            ('device_options', {'heel_width': 60}),
+        ):
+            with self.subTest(action=action):
+                url = f'/api/prescriptions/{prescription.id}/{action}/'
+                method = 'post' if action == 'plantar-modifiers' else 'patch'
+                # The prescription and one upsert, whether the row exists yet or not
+                self.assertMaxQueries(2, method, url, data=body, format='json')
+                self.assertMaxQueries(2, method, url, data=body, format='json')
+
+
+class PrescriptionCloneTests(TestCase):
+    """
+    A repeat order copies a prescription with one insert per table, so its
+    query count stays within the ``prescriptions.clone`` benchmark's budget
+    however many scans are copied.
+    """
+
+    def test_clone_budget(self):
+        small, _ = measure(prescription_clone, 1, repeat=1)
+        large, _ = measure(prescription_clone, 50, repeat=1)
+        self.assertEqual(small, large)
+        self.assertLessEqual(large, prescription_clone.max_queries)
+
+    def add_previews(self, scan):
+        """Metadata with a thumbnail and a LOD for the left foot, as processing leaves them."""
+        create_scan_metadata(
+            scan, 'left', thumbnail=default_storage.save(f'scans/thumbnails/{scan.id}_left.png', ContentFile(b'png'))
+        )
+        ScanLOD.objects.create(
+            scan=scan, foot='left', level='low', file_size=3, triangle_count=1, vertex_count=3,
+            file=default_storage.save(f'scans/lods/{scan.id}/left_low.lod', ContentFile(b'lod')),
+        )
+
+    def test_clone(self):
+        prescription, user = create_complete_prescription(2)
+        Prescription.objects.filter(pk=prescription.pk).update(general_notes='Repeat of last year')
+        ClinicalMeasure.objects.filter(prescription=prescription).update(left_scan_angle=4.5)
+        client = APIClient()
+        client.force_authenticate(user)
+
+        response = client.post(f'/api/prescriptions/{prescription.id}/clone/', {'include_scans': True}, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        clone = Prescription.objects.get(pk=response.data['id'])
+        self.assertNotEqual(clone.pk, prescription.pk)
+        self.assertEqual(clone.general_notes, 'Repeat of last year')
+        self.assertIsNone(clone.status)
+        self.assertEqual(clone.clinical_measures.left_scan_angle, 4.5)
+        self.assertNotEqual(clone.clinical_measures.pk, prescription.clinical_measures.pk)
+        for relation in ('intrinsic_adjustments', 'off_loading', 'planter_modifier', 'postings',
+                         'material_selection', 'shoe_fitting', 'device_options'):
+            self.assertIsNotNone(getattr(clone, relation))
+
+        # Scans share the stored files, which now have a reference each
+        names = sorted(clone.scans.values_list('left_foot', flat=True))
+        self.assertEqual(names, sorted(prescription.scans.values_list('left_foot', flat=True)))
+        self.assertEqual(set(Blob.objects.filter(name__in=names).values_list('ref_count', flat=True)), {2})
+        self.assertEqual(set(clone.scans.values_list('processing_status', flat=True)), {'ready'})
+
+        response = client.post(f'/api/prescriptions/{prescription.id}/clone/', {}, format='json')
+        self.assertFalse(Prescription.objects.get(pk=response.data['id']).scans.exists())
+
+    def test_clone_scan_results(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        with override_settings(MEDIA_ROOT=media_root.name):
+            prescription, user = create_complete_prescription(2)
+            ready, failed = prescription.scans.all()
+            self.add_previews(ready)
+            Scan.objects.filter(pk=failed.pk).update(processing_status='failed', processing_error='left validation')
+            client = APIClient()
+            client.force_authenticate(user)
+
+            response = client.post(f'/api/prescriptions/{prescription.id}/clone/', {'include_scans': True}, format='json')
+            self.assertEqual(response.status_code, 201, response.content)
+            copies = {scan.left_foot.name: scan for scan in Scan.objects.filter(prescription=response.data['id'])}
+
+            # Processed scans keep their results, sharing the preview files
+            copy = copies[ready.left_foot.name]
+            self.assertEqual(copy.processing_status, 'ready')
+            names = [ready.metadata.get().thumbnail.name, ready.lods.get().file.name]
+            self.assertEqual([copy.metadata.get().thumbnail.name, copy.lods.get().file.name], names)
+            # The others are processed again
+            failed_copy = copies[failed.left_foot.name]
+            self.assertEqual((failed_copy.processing_status, failed_copy.processing_error), ('pending', ''))
+
+            # Preview files go with the last scan using them
+            copy.delete()
+            self.assertTrue(all(default_storage.exists(name) for name in names))
+            ready.delete()
+            self.assertFalse(any(default_storage.exists(name) for name in names))
+
+
+class BlobReferenceTests(TestCase):
+    """Rows keep their blobs' reference counts however their file fields were loaded."""
+
+    def test_deferred_file_fields(self):
+        prescription, _ = create_complete_prescription(0)
+        first, second = 'blobs/00/00/first.pdf', 'blobs/00/00/second.pdf'
+        Blob.objects.bulk_create([
+            Blob(name=name, sha256='0' * 64, size=84, ref_count=count) for name, count in ((first, 1), (second, 0))
+        ])
+        # Created with the name of a stored blob, like bulk-created rows
+        attachment = Attachment.objects.create(prescription=prescription, file=first, filename='notes.pdf')
+
+        # Saving a row with only its key loaded loads and saves every field
+        Attachment.objects.only('id').get(pk=attachment.pk).save()
+        self.assertEqual(Blob.objects.get(name=first).ref_count, 1)
+
+        # Loading a row does not fetch its deferred files
+        with self.assertNumQueries(1):
+            attachment = Attachment.objects.defer('file').get(pk=attachment.pk)
+        attachment.file = second
+        attachment.save()
+        self.assertEqual(Blob.objects.get(name=first).ref_count, 0)
+        self.assertEqual(Blob.objects.get(name=second).ref_count, 1)
+
+        attachment = Attachment.objects.only('id').get(pk=attachment.pk)
+        attachment.refresh_from_db(fields=['filename'])
+        attachment.delete()
+        self.assertEqual(Blob.objects.get(name=second).ref_count, 0)
+
+
+    def test_deferred_scan_files(self):
+        prescription, _ = create_complete_prescription(1)
+        name = Scan.objects.get(prescription=prescription).left_foot.name
+        other = 'blobs/00/00/other.stl'
+        Blob.objects.create(name=other, sha256='0' * 64, size=84, ref_count=0)
+
+        scan = Scan.objects.only('id').get(prescription=prescription)
+        scan.save()
+        self.assertEqual(Scan.objects.get(pk=scan.pk).processing_status, 'ready')
+
+        scan = Scan.objects.defer('left_foot', 'right_foot').get(pk=scan.pk)
+        scan.left_foot = other
+        scan.save()
+        self.assertEqual(scan.processing_status, 'pending')
+        self.assertEqual(Blob.objects.get(name=name).ref_count, 0)
+        self.assertEqual(Blob.objects.get(name=other).ref_count, 1)
+
+
+class ScanProcessingTests(TestCase):
+    """Only the processing chain queued last for a scan may mark it ready or failed."""
+
+    def test_superseded_chain(self):
+        prescription, _ = create_complete_prescription(1)
+        scan = Scan.objects.get(prescription=prescription)
+        superseded, current = str(uuid.uuid4()), str(uuid.uuid4())
+        Scan.objects.filter(pk=scan.pk).update(processing_status='processing', processing_token=current)
+
+        start_scan_processing(scan.pk, superseded)
+        self.assertIsNone(validate_scan(scan.pk, 'left', superseded))
+        finish_scan_processing(scan.pk, superseded)
+        self.assertEqual(Scan.objects.get(pk=scan.pk).processing_status, 'processing')
+
+        finish_scan_processing(scan.pk, current)
+        self.assertEqual(Scan.objects.get(pk=scan.pk).processing_status, 'ready')
+
+    def test_new_files_supersede_the_queued_chain(self):
+        prescription, _ = create_complete_prescription(1)
+        scan = Scan.objects.get(prescription=prescription)
+        scan.right_foot = scan.left_foot.name
+        scan.save()
+        queued = scan.processing_token
+        self.assertIsNotNone(queued)
+
+        scan.left_foot = None
+        scan.save()
+        self.assertNotEqual(scan.processing_token, queued)
+        self.assertEqual(scan.processing_status, 'pending')
+
+
+class UploadChunkTests(TestCase):
+    """
+    Chunks of a resumable upload are written without holding a lock; the
+    offset they were sent for decides which of them is kept.
+    """
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings = override_settings(MEDIA_ROOT=media_root.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        prescription, user = create_complete_prescription(0)
+        self.session = UploadSession.objects.create(
+            prescription=prescription, created_by=user, target='attachment', filename='notes.pdf', length=8
+        )
+
+    def test_resent_chunk_conflicts(self):
+        first, second = (UploadSession.objects.get(pk=self.session.pk) for _ in range(2))
+        self.assertEqual(append_chunk(first, io.BytesIO(b'abcd'), 0, 4), 4)
+        with self.assertRaises(UploadError) as raised:
+            append_chunk(second, io.BytesIO(b'abcd'), 0, 4)
+        self.assertEqual(raised.exception.status_code, 409)
+        self.assertEqual(second.offset, 4)
+
+        self.assertEqual(append_chunk(second, io.BytesIO(b'efgh'), 4, 4), 8)
+        with open(self.session.part_path, 'rb') as part:
+            self.assertEqual(part.read(), b'abcdefgh')
+
+
+class SectionUpsertTests(TransactionTestCase):
+    """
+    Autosaves of a section that does not exist yet can arrive at the same
+    time; every one of them must create or update the single row.
+    """
+
+    def setUp(self):
+        patient, self.user = create_patient()
+        self.prescription = Prescription.objects.create(
+            patient=patient, clinician=self.user, template=Template.objects.create(name='Standard')
+        )
+
+    def save_in_parallel(self, method, url, bodies):
+        def save(body):
+            client = APIClient()
+            client.force_authenticate(self.user)
+            try:
+                return getattr(client, method)(url, data=body, format='json').status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=len(bodies)) as pool:
+            return list(pool.map(save, bodies))
+
+    @skipUnlessDBFeature('can_return_columns_from_insert')
+    def test_parallel_saves(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            # Set TEST NAME in DATABASES to run this against a SQLite file
+            self.skipTest("In-memory SQLite fails concurrent writes with 'database table is locked'")
+        for action, model, field in (
+            ('clinical_measures', ClinicalMeasure, 'left_scan_angle'),
+            ('intrinsic_adjustments', IntrinsicAdjustment, 'left_pfa_value_mm'),
+            ('off_loadings', OffLoading, 'custom_notes'),
+            ('postings', Posting, 'left_heel_post_angle'),
+            ('device_options', DeviceOption, 'heel_width'),
+        ):
+            with self.subTest(action=action):
+                url = f'/api/prescriptions/{self.prescription.id}/{action}/'
+                codes = self.save_in_parallel('patch', url, [{field: value} for value in range(1, 9)])
+                # Sections that report creation do so for exactly one save
+                self.assertLessEqual(set(codes), {200, 201}, codes)
+                self.assertLessEqual(codes.count(201), 1, codes)
+                self.assertEqual(model.objects.filter(prescription=self.prescription).count(), 1)
+                value = getattr(model.objects.get(prescription=self.prescription), field)
+                self.assertIn(float(value), range(1, 9))
+
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_parallel_conditional_saves(self):
+        url = f'/api/prescriptions/{self.prescription.id}/postings/'
+        client = APIClient()
+        client.force_authenticate(self.user)
+        etag = client.get(url)['ETag']
+        bodies = [{'left_heel_post_angle': value} for value in range(1, 9)]
+
+        def save(body):
+            client = APIClient()
+            client.force_authenticate(self.user)
+            try:
+                return client.patch(url, data=body, format='json', HTTP_IF_MATCH=etag).status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=len(bodies)) as pool:
+            codes = list(pool.map(save, bodies))
+        # Only one save was based on the version the others were based on too
+        self.assertEqual(sorted(codes), [200] + [412] * (len(bodies) - 1), codes)
+
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_parallel_json_patches(self):
+        url = f'/api/prescriptions/{self.prescription.id}/json-patch/'
+        bodies = [
+            [
+                {'op': 'test', 'path': '/general_notes', 'value': ''},
+                {'op': 'replace', 'path': '/general_notes', 'value': f'Edit {value}'},
+            ]
+            for value in range(8)
+        ]
+        codes = self.save_in_parallel('patch', url, bodies)
+        # Only the first patch found the notes still empty
+        self.assertEqual(sorted(codes), [200] + [409] * (len(bodies) - 1), codes)
+
+
+
+class MeshLoaderTests(SimpleTestCase):
+    """Every scan format loads the same unit square as two triangles."""
+
+    SQUARE = [(0, 0, 0), (1, 0, 0), (1, 1, 0), (0, 1, 0)]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def load(self, scan_format, content):
+        path = os.path.join(self.directory, 'scan')
+        with open(path, 'wb') as f:
+            f.write(content.encode() if isinstance(content, str) else content)
+        return load_mesh(path, scan_format)
+
+    def assertSquare(self, mesh):
+        triangles = sorted(tuple(tuple(corner) for corner in mesh.vertices[face].tolist()) for face in mesh.faces)
+        a, b, c, d = (tuple(map(float, corner)) for corner in self.SQUARE)
+        self.assertEqual(triangles, sorted([(a, b, c), (a, c, d)]))
+
+    def test_binary_stl(self):
+        triangles = np.zeros(2, dtype=STL_DTYPE)
+        triangles['vertices'] = [[self.SQUARE[i] for i in face] for face in ((0, 1, 2), (0, 2, 3))]
+        content = b'\0' * 80 + np.array([2], dtype='<u4').tobytes() + triangles.tobytes()
+        self.assertSquare(self.load(STL_BINARY, content))
+
+    def test_ascii_stl(self):
+        facets = ''.join(
+            'facet normal 0 0 1\n outer loop\n'
+            + ''.join(f'  vertex {x} {y} {z}\n' for x, y, z in (self.SQUARE[i] for i in face))
+            + ' endloop\nendfacet\n'
+            for face in ((0, 1, 2), (0, 2, 3))
+        )
+        self.assertSquare(self.load(STL_ASCII, f'solid square\n{facets}endsolid square\n'))
+
+    def test_obj(self):
+        vertices = ''.join(f'v {x} {y} {z}\n' for x, y, z in self.SQUARE)
+        for faces in (
+            'vt 0 0\nvt 1 0\nvt 1 1\nvt 0 1\nvn 0 0 1\nf 1/1/1 2/2/1 3/3/1 4/4/1\n',
+            'f 1//1 2//1 3//1\nf -4 -2 -1\n',
+        ):
+            with self.subTest(faces=faces):
+                self.assertSquare(self.load(OBJ, f'# square\n{vertices}vn 0 0 1\n{faces}'))
+
+    def test_ascii_ply(self):
+        header = (
+            'ply\nformat ascii 1.0\nelement vertex 4\nproperty float x\nproperty float y\nproperty float z\n'
+            'element face {faces}\nproperty list uchar int vertex_indices\nend_header\n'
+        )
+        vertices = ''.join(f'{x} {y} {z}\n' for x, y, z in self.SQUARE)
+        for faces in ('4 0 1 2 3\n', '3 0 1 2\n3 0 2 3\n'):
+            with self.subTest(faces=faces):
+                self.assertSquare(self.load(PLY, header.format(faces=faces.count('\n')) + vertices + faces))
+
+    def test_vrml(self):
+        points = ', '.join(f'{x} {y} {z}' for x, y, z in self.SQUARE)
+        vrml2 = (
+            '#VRML V2.0 utf8\n# texture coordinates and normals come first\n'
+            'Shape { geometry IndexedFaceSet {\n'
+            '  texCoord TextureCoordinate { point [ 0 0, 1 0, 1 1, 0 1 ] }\n'
+            '  normal Normal { vector [ 0 0 1 ] }\n'
+            f'  coord DEF square Coordinate {{ point [ {points} ] }}\n'
+            '  texCoordIndex [ 0 1 2 3 -1 ]\n'
+            '  coordIndex [ 0, 1, 2, 3, -1 ]\n'
+            '} }\n'
+        )
+        vrml1 = (
+            '#VRML V1.0 ascii\nSeparator {\n'
+            '  TextureCoordinate2 { point [ 0 0, 1 0, 1 1, 0 1 ] }\n'
+            f'  Coordinate3 {{ point [ {points} ] }}\n'
+            '  IndexedFaceSet { coordIndex [ 0, 1, 2, -1, 0, 2, 3, -1 ] }\n'
+            '}\n'
+        )
+        for content in (vrml2, vrml1):
+            with self.subTest(content=content):
+                self.assertSquare(self.load(VRML, content))
+                # Arrays and tokens split across chunks
+                with mock.patch('prescriptions.mesh.VRML_CHUNK_SIZE', 5):
+                    self.assertSquare(self.load(VRML, content))
+
+    def test_vrml_without_coordinates(self):
+        content = (
+            '#VRML V2.0 utf8\nShape { geometry IndexedFaceSet {\n'
+            '  texCoord TextureCoordinate { point [ 0 0, 1 0, 1 1, 0 1 ] }\n'
+            '  coordIndex [ 0, 1, 2, 3, -1 ]\n'
+            '} }\n'
+        )
+        with self.assertRaises(ScanFormatError):
+            self.load(VRML, content)
+        with self.assertRaises(ScanFormatError):
+            self.load(VRML, content.replace('TextureCoordinate', 'Coordinate'))
+
+
+class LODTests(SimpleTestCase):
+    """Decimation budgets and the compact LOD encoding."""
+
+    def grid(self, size):
+        """A gently curved ``size`` x ``size`` grid spanning 300mm."""
+        x, y = np.meshgrid(np.linspace(0, 300, size), np.linspace(0, 100, size))
+        vertices = np.column_stack([x.ravel(), y.ravel(), (np.sin(x / 50) * 10).ravel()])
+        corner = (np.arange(size - 1)[:, None] * size + np.arange(size - 1)).ravel()
+        faces = np.concatenate([
+            np.column_stack([corner, corner + 1, corner + size + 1]),
+            np.column_stack([corner, corner + size + 1, corner + size]),
+        ])
+        return Mesh(vertices, faces)
+
+    def test_decimate_meets_budget(self):
+        mesh = self.grid(101)
+        self.assertEqual(mesh.triangle_count, 20000)
+        for target in (5000, 500):
+            with self.subTest(target=target):
+                low = decimate(mesh, target)
+                self.assertLessEqual(low.triangle_count, target)
+                self.assertGreater(low.triangle_count, target // 4)
+                self.assertLess(low.faces.max(), low.vertex_count)
+                # Clustering averages vertices, so the outline shrinks by under a cell
+                for decimated, original in zip(low.bounding_box(), mesh.bounding_box()):
+                    np.testing.assert_allclose(decimated, original, atol=15)
+
+    def test_decimate_within_budget_is_unchanged(self):
+        mesh = self.grid(11)
+        self.assertIs(decimate(mesh, mesh.triangle_count), mesh)
+
+    def test_encode_header(self):
+        mesh = self.grid(11)
+        data = encode_lod(mesh)
+        magic, version, index_size, vertex_count, triangle_count, *bbox = LOD_HEADER.unpack_from(data)
+        self.assertEqual((magic, version, index_size), (LOD_MAGIC, LOD_VERSION, 2))
+        self.assertEqual((vertex_count, triangle_count), (121, 200))
+        np.testing.assert_allclose(bbox[:3], mesh.bounding_box()[0], atol=1e-4)
+        np.testing.assert_allclose(bbox[3:], mesh.bounding_box()[1], atol=1e-4)
+        # 121 * 6 vertex bytes need 2 bytes of padding before the triangles
+        self.assertEqual(len(data), LOD_HEADER.size + 121 * 6 + 2 + 200 * 3 * 2)
+
+    def test_encode_roundtrip(self):
+        mesh = self.grid(11)
+        decoded = decode_lod(encode_lod(mesh))
+        np.testing.assert_array_equal(decoded.faces, mesh.faces)
+        # 16-bit quantization over a 300mm extent
+        np.testing.assert_allclose(decoded.vertices, mesh.vertices, atol=300 / 65535)
+
+    def test_encode_wide_indices(self):
+        vertices = np.zeros((70000, 3))
+        vertices[:, 0] = np.arange(70000)
+        mesh = Mesh(vertices, [[0, 1, 69999]])
+        data = encode_lod(mesh)
+        self.assertEqual(LOD_HEADER.unpack_from(data)[2], 4)
+        np.testing.assert_array_equal(decode_lod(data).faces, [[0, 1, 69999]])
+
+    def test_decode_rejects_other_files(self):
+        with self.assertRaises(ValueError):
+            decode_lod(b'solid' + b'\0' * LOD_HEADER.size)
+
+
+class LookupCacheTests(TestCase):
+    """
+    Lookup tables are read from the per-process cache until a row changes,
+    and their list endpoints answer conditional requests with a 304.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        _, cls.user = create_clinic_user()
+        cls.status = PrescriptionStatus.objects.create(name='Draft')
+
+    def setUp(self):
+        cache.clear()
+        lookups._tables.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get_statuses(self, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get('/api/prescriptions/status/', **headers)
+
+    def names(self, response):
+        return [row['name'] for row in response.data['results']]
+
+    def test_version_bumps_on_save_and_delete(self):
+        version = lookups.lookup_version(PrescriptionStatus)
+        self.assertEqual(lookups.lookup_version(PrescriptionStatus), version)
+        other = lookups.lookup_version(FootType)
+
+        self.status.name = 'Drafted'
+        self.status.save()
+        saved = lookups.lookup_version(PrescriptionStatus)
+        self.assertNotEqual(saved, version)
+
+        self.status.delete()
+        self.assertNotIn(lookups.lookup_version(PrescriptionStatus), (version, saved))
+        self.assertEqual(lookups.lookup_version(FootType), other)
+
+    def test_rows_are_kept_until_a_change(self):
+        version, rows = lookups.lookup_table(PrescriptionStatus)
+        with self.assertNumQueries(0):
+            self.assertEqual(lookups.lookup_table(PrescriptionStatus), (version, rows))
+
+        PrescriptionStatus.objects.create(name='Submitted')
+        new_version, rows = lookups.lookup_table(PrescriptionStatus)
+        self.assertNotEqual(new_version, version)
+        self.assertEqual([status.name for status in rows], ['Draft', 'Submitted'])
+
+    def test_not_modified(self):
+        response = self.get_statuses()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.names(response), ['Draft'])
+        etag = response['ETag']
+
+        response = self.get_statuses(etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+
+    def test_etag_changes_after_an_edit(self):
+        etag = self.get_statuses()['ETag']
+        self.status.name = 'Drafted'
+        self.status.save()
+
+        response = self.get_statuses(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.names(response), ['Drafted'])
+
+    def test_cache_unreachable(self):
+        self.get_statuses()
+        with mock.patch.object(lookups, 'cache') as unreachable:
+            unreachable.get.side_effect = unreachable.set.side_effect = ConnectionError('cache is down')
+            with self.assertLogs('prescriptions.lookups', 'ERROR'):
+                self.status.name = 'Drafted'
+                self.status.save()
+                version, rows = lookups.lookup_table(PrescriptionStatus)
+                response = self.get_statuses()
+
+        # Rows are read from the database on every request instead
+        self.assertIsNone(version)
+        self.assertEqual([status.name for status in rows], ['Drafted'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+        self.assertEqual(self.names(response), ['Drafted'])
+
+
+def binary_stl(triangles):
+    """A binary STL of ``triangles`` empty facets."""
+    return b'\0' * 80 + np.array([triangles], dtype='<u4').tobytes() + b'\0' * 50 * triangles
+
+
+SAMPLE_SCANS = {
+    'scan.stl': binary_stl(2),
+    'ascii.stl': b'solid s\nfacet normal 0 0 1\n outer loop\n  vertex 0 0 0\n  vertex 1 0 0\n  vertex 1 1 0\n'
+                 b' endloop\nendfacet\nendsolid s\n',
+    'scan.obj': b'# quad\nv 0 0 0\nv 1 0 0\nv 1 1 0\nv 0 1 0\nvn 0 0 1\nf 1//1 2//1 3//1 4//1\n',
+    'scan.ply': b'ply\nformat binary_little_endian 1.0\nelement vertex 4\nproperty float x\n'
+                b'element face 2\nproperty list uchar int vertex_indices\nend_header\n' + b'\0' * 64,
+    'scan.wrl': b'#VRML V2.0 utf8\nShape { geometry IndexedFaceSet { coordIndex [ 0 1 2 -1 ] } }\n',
+    'scan.vrml': b'#VRML V1.0 ascii\nSeparator { }\n',
+}
+
+# (format, triangle count, vertex count) of each sample
+SAMPLE_INFO = {
+    'scan.stl': (STL_BINARY, 2, 6),
+    'ascii.stl': (STL_ASCII, 1, 3),
+    'scan.obj': (OBJ, 2, 4),
+    'scan.ply': (PLY, 2, 4),
+    'scan.wrl': (VRML, None, None),
+    'scan.vrml': (VRML, None, None),
+}
+
+
+class ScanInspectorTests(SimpleTestCase):
+    """Scans are sniffed from their content while they stream in."""
+
+    def inspect(self, name, content, chunk_size=7):
+        inspector = ScanInspector(name)
+        for start in range(0, len(content), chunk_size):
+            inspector.feed(content[start:start + chunk_size])
+        return inspector.finish()
+
+    def test_accepted_formats(self):
+        for name, content in SAMPLE_SCANS.items():
+            for chunk_size in (7, len(content)):
+                with self.subTest(name=name, chunk_size=chunk_size):
+                    info = self.inspect(name, content, chunk_size)
+                    self.assertEqual((info.format, info.triangle_count, info.vertex_count), SAMPLE_INFO[name])
+                    self.assertEqual(info.size, len(content))
+
+    def test_binary_blob_as_obj(self):
+        blob = bytes(range(256)) * 64
+        for content in (blob, binary_stl(100)):
+            with self.assertRaisesMessage(ScanFormatError, 'Invalid OBJ file format'):
+                self.inspect('scan.obj', content, 4096)
+        # Text without any vertices is no mesh either
+        with self.assertRaisesMessage(ScanFormatError, 'Invalid OBJ file format'):
+            self.inspect('scan.obj', b'# just a comment\nf 1 2 3\n')
+
+    def test_content_must_match_the_extension(self):
+        for name, content in (
+            ('scan.stl', SAMPLE_SCANS['scan.obj']),
+            ('scan.ply', SAMPLE_SCANS['scan.wrl']),
+            ('scan.ply', b'ply\nelement vertex 4\nend_header\n'),
+            ('scan.wrl', SAMPLE_SCANS['scan.ply']),
+        ):
+            with self.subTest(name=name, content=content[:20]):
+                with self.assertRaises(ScanFormatError):
+                    self.inspect(name, content)
+        with self.assertRaisesMessage(ScanFormatError, 'empty'):
+            self.inspect('scan.stl', b'')
+        with self.assertRaisesMessage(ScanFormatError, 'File extension not allowed'):
+            ScanInspector('scan.txt')
+
+    def test_inspect_scan_rewinds(self):
+        upload = SimpleUploadedFile('scan.obj', SAMPLE_SCANS['scan.obj'])
+        self.assertEqual(inspect_scan(upload).format, OBJ)
+        self.assertEqual(upload.read(), SAMPLE_SCANS['scan.obj'])
+
+
+class ScanUploadTests(TestCase):
+    """
+    ``left_foot``/``right_foot`` uploads are validated while they stream to
+    disk, and rejected by the serializer if they are not a scan or too large.
+    """
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings = override_settings(MEDIA_ROOT=media_root.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.media_root = media_root.name
+
+    def stream(self, field_name, name, content, chunk_size=10):
+        handler = ScanUploadHandler()
+        try:
+            handler.new_file(field_name, name, 'application/octet-stream', len(content))
+        except StopFutureHandlers:
+            pass
+        for start in range(0, len(content), chunk_size):
+            remaining = handler.receive_data_chunk(content[start:start + chunk_size], start)
+            if handler.foot is None:
+                self.assertEqual(remaining, content[start:start + chunk_size])
+        upload = handler.file_complete(len(content))
+        if upload is not None:
+            self.addCleanup(upload.close)
+        return upload
+
+    def test_handler_streams_to_media_root(self):
+        upload = self.stream('left_foot', 'scan.stl', SAMPLE_SCANS['scan.stl'])
+        self.assertEqual(upload.scan_info.format, STL_BINARY)
+        self.assertIsNone(upload.scan_error)
+        path = upload.temporary_file_path()
+        self.assertEqual(os.path.dirname(path), os.path.join(self.media_root, 'scans', 'left'))
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), SAMPLE_SCANS['scan.stl'])
+        # The serializer reuses the streamed result
+        self.assertIs(ScanSerializer().validate_left_foot(upload).scan_info, upload.scan_info)
+
+    def test_handler_rejects(self):
+        with override_settings(SCAN_MAX_FILE_SIZE=50):
+            upload = self.stream('right_foot', 'scan.stl', SAMPLE_SCANS['scan.stl'])
+        self.assertIn('File size should not exceed', upload.scan_error)
+        self.assertEqual(os.path.getsize(upload.temporary_file_path()), 0)
+
+        upload = self.stream('left_foot', 'scan.obj', bytes(range(256)) * 8)
+        self.assertEqual(upload.scan_error, 'Invalid OBJ file format')
+        with self.assertRaisesMessage(ValidationError, 'Invalid OBJ file format'):
+            ScanSerializer().validate_left_foot(upload)
+
+    def test_handler_passes_other_fields_on(self):
+        self.assertIsNone(self.stream('attachment', 'notes.txt', b'not a scan at all'))
+
+    def test_serializer_inspects_other_uploads(self):
+        serializer = ScanSerializer()
+        for name, content in SAMPLE_SCANS.items():
+            with self.subTest(name=name):
+                upload = serializer.validate_left_foot(SimpleUploadedFile(name, content))
+                self.assertEqual(upload.scan_info.format, SAMPLE_INFO[name][0])
+        with override_settings(SCAN_MAX_FILE_SIZE=50):
+            with self.assertRaisesMessage(ValidationError, 'File size should not exceed'):
+                serializer.validate_left_foot(SimpleUploadedFile('scan.stl', SAMPLE_SCANS['scan.stl']))
+
+    def test_post_scans(self):
+        prescription, user = create_complete_prescription(0)
+        client = APIClient()
+        client.force_authenticate(user)
+        url = f'/api/prescriptions/{prescription.pk}/scans/'
+
+        response = client.post(url, {'left_foot': SimpleUploadedFile('scan.obj', bytes(range(256)) * 8)})
+        self.assertEqual(response.status_code, 400, response.content)
+        self.assertIn('Invalid OBJ file format', str(response.data['left_foot']))
+
+        with override_settings(SCAN_MAX_FILE_SIZE=50):
+            response = client.post(url, {'left_foot': SimpleUploadedFile('scan.stl', SAMPLE_SCANS['scan.stl'])})
+        self.assertEqual(response.status_code, 400, response.content)
+        self.assertIn('File size should not exceed', str(response.data['left_foot']))
+
+        response = client.post(url, {
+            'left_foot': SimpleUploadedFile('scan.stl', SAMPLE_SCANS['scan.stl']),
+            'right_foot': SimpleUploadedFile('scan.obj', SAMPLE_SCANS['scan.obj']),
+        })
+        self.assertEqual(response.status_code, 201, response.content)
+        scan = Scan.objects.get(prescription=prescription)
+        with scan.left_foot.open('rb') as f:
+            self.assertEqual(f.read(), SAMPLE_SCANS['scan.stl'])
@@ -0,0 +1,118 @@
+"""
+Upload handlers for the prescriptions app.
+"""
+import logging
+import os
+
+from django.conf import settings
+from django.core.files.temp import NamedTemporaryFile
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers
+
+from .scan_ingest import ScanFormatError, ScanInspector
+
+logger = logging.getLogger(__name__)
+
+SCAN_FIELDS = {
+    'left_foot': 'left',
+    'right_foot': 'right',
+}
+
+
+class StreamedScanFile(UploadedFile):
+    """
+    A scan written straight into ``MEDIA_ROOT/scans/<foot>/`` while uploading.
+
+    The temporary file lives under MEDIA_ROOT, on the same filesystem as the
+    blob store, so saving it is a rename rather than a second copy.
+    """
+
+    def __init__(self, foot, name, content_type, size, charset, content_type_extra=None):
+        _, ext = os.path.splitext(name)
+        directory = os.path.join(settings.MEDIA_ROOT, 'scans', foot)
+        os.makedirs(directory, mode=0o755, exist_ok=True)
+        file = NamedTemporaryFile(prefix='.incoming-', suffix='.upload' + ext, dir=directory)
+        super().__init__(file, name, content_type, size, charset, content_type_extra)
+        self.scan_info = None
+        self.scan_error = None
+
+    def temporary_file_path(self):
+        """Return the full path of this file."""
+        return self.file.name
+
+    def close(self):
+        try:
+            return self.file.close()
+        except FileNotFoundError:
+            # The file was moved into place by the storage backend
+            pass
+
+
+class ScanUploadHandler(FileUploadHandler):
+    """
+    Stream ``left_foot``/``right_foot`` uploads to disk, hashing and
+    validating each chunk as it arrives.
+
+    Memory use is constant no matter how large the scan is. Any other file
+    field is passed through untouched to the next configured handler.
+    """
+
+    def new_file(self, field_name, file_name, *args, **kwargs):
+        super().new_file(field_name, file_name, *args, **kwargs)
+        self.foot = SCAN_FIELDS.get(field_name)
+        if self.foot is None:
+            return
+
+        self.max_size = getattr(settings, 'SCAN_MAX_FILE_SIZE', 50 * 1024 * 1024)
+        self.received = 0
+        self.error = None
+        try:
+            self.inspector = ScanInspector(file_name)
+        except ScanFormatError as e:
+            self.inspector = None
+            self.error = str(e)
+
+        self.file = StreamedScanFile(
+            self.foot, self.file_name, self.content_type, 0,
+            self.charset, self.content_type_extra
+        )
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.foot is None:
+            return raw_data
+
+        self.received += len(raw_data)
+        if self.error:
+            return None
+        if self.received > self.max_size:
+            self.error = f"File size should not exceed {self.max_size / (1024 * 1024)}MB."
+            return None
+
+        self.inspector.feed(raw_data)
+        self.file.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if self.foot is None:
+            return None
+
+        self.file.seek(0)
+        self.file.size = self.received
+        if not self.error:
+            try:
+                self.file.scan_info = self.inspector.finish()
+            except ScanFormatError as e:
+                self.error = str(e)
+        if self.error:
+            # Drop whatever was written; validation reports the error
+            self.file.truncate(0)
+            self.file.scan_error = self.error
+            logger.warning(f"Rejected {self.foot} scan upload {self.file_name}: {self.error}")
+        else:
+            logger.info(f"Streamed {self.foot} scan {self.file_name}: {self.file.scan_info}")
+        return self.file
+
+    def upload_interrupted(self):
+        if getattr(self, 'foot', None) and hasattr(self, 'file'):
+            self.file.close()
@@ -0,0 +1,180 @@
+"""
+Resumable uploads for scans and attachments.
+
+A client creates an ``UploadSession`` with the file's name and length, then
+sends the bytes in any number of ``PATCH`` requests, each carrying the
+``Upload-Offset`` it starts at. Every chunk is appended straight to disk, so
+a dropped connection only loses the chunk in flight: ``HEAD`` reports the
+offset to resume from. Once complete, the upload id is passed to the scans
+or attachments endpoint in place of a multipart file.
+"""
+import logging
+import os
+import uuid
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.db.models import F
+from django.http import UnreadablePostError
+from django.utils import timezone
+from rest_framework import status
+
+from .models import UploadSession
+from .scan_ingest import ScanFormatError, ScanInspector
+
+logger = logging.getLogger(__name__)
+
+CHUNK_CONTENT_TYPE = 'application/offset+octet-stream'
+READ_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """An upload request that cannot be honoured, with its HTTP status."""
+
+    def __init__(self, message, status_code=status.HTTP_400_BAD_REQUEST):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def max_upload_size(target):
+    if target == 'attachment':
+        return getattr(settings, 'MAX_FILE_SIZE', 10 * 1024 * 1024)
+    return getattr(settings, 'SCAN_MAX_FILE_SIZE', 50 * 1024 * 1024)
+
+
+def max_chunk_size():
+    return getattr(settings, 'UPLOAD_CHUNK_MAX_SIZE', 8 * 1024 * 1024)
+
+
+def upload_headers(session):
+    return {
+        'Upload-Offset': str(session.offset),
+        'Upload-Length': str(session.length),
+        'Cache-Control': 'no-store',
+    }
+
+
+def append_chunk(session, stream, offset, content_length):
+    """
+    Append one chunk from ``stream`` to the session's part file.
+
+    ``offset`` must match the bytes already received. Whatever arrives
+    before a client disconnects is kept, so the next chunk can resume there.
+
+    No lock is held while the chunk streams in. The chunk is written at its
+    offset, and the session's offset is then advanced only if nothing else
+    advanced it meanwhile; of two requests sending the same chunk, the
+    second gets a 409.
+    """
+    if offset != session.offset:
+        raise UploadError(
+            f"Upload-Offset {offset} does not match the current offset {session.offset}",
+            status.HTTP_409_CONFLICT
+        )
+    if content_length > max_chunk_size():
+        raise UploadError(
+            f"Chunks should not exceed {max_chunk_size() / (1024 * 1024)}MB.",
+            status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        )
+    if session.offset + content_length > session.length:
+        raise UploadError("Chunk extends past the declared Upload-Length")
+
+    os.makedirs(os.path.dirname(session.part_path), mode=0o755, exist_ok=True)
+    received = 0
+    # Written in place rather than appended, over whatever a chunk that was
+    # cut off before its offset was saved left behind
+    with os.fdopen(os.open(session.part_path, os.O_WRONLY | os.O_CREAT, 0o644), 'wb') as part:
+        part.seek(offset)
+        try:
+            while stream is not None:
+                data = stream.read(READ_SIZE)
+                if not data:
+                    break
+                part.write(data)
+                received += len(data)
+        except (OSError, UnreadablePostError) as e:
+            logger.warning(f"Upload {session.id} interrupted after {received} bytes: {str(e)}")
+
+    updated = UploadSession.objects.filter(pk=session.pk, offset=offset).update(
+        offset=F('offset') + received, updated_at=timezone.now()
+    )
+    if not updated:
+        session.refresh_from_db(fields=['offset'])
+        raise UploadError(
+            f"Upload-Offset {offset} was written by another request; the current offset is {session.offset}",
+            status.HTTP_409_CONFLICT
+        )
+    session.offset = offset + received
+    return session.offset
+
+
+class SessionUploadedFile(UploadedFile):
+    """
+    A completed upload session, ready to be assigned to a ``FileField``.
+
+    It behaves like a temporary-file upload, so the storage backend moves the
+    part file into place instead of copying it. Scans are inspected the same
+    way ``ScanUploadHandler`` inspects streamed uploads.
+    """
+
+    def __init__(self, session):
+        file = open(session.part_path, 'rb')
+        super().__init__(file, session.filename, 'application/octet-stream', session.length)
+        self.session = session
+        self.scan_info = None
+        self.scan_error = None
+        if session.target != 'attachment':
+            self._inspect()
+
+    def _inspect(self):
+        try:
+            inspector = ScanInspector(self.name)
+            for chunk in self.chunks(READ_SIZE):
+                inspector.feed(chunk)
+            self.scan_info = inspector.finish()
+        except ScanFormatError as e:
+            self.scan_error = str(e)
+        self.seek(0)
+
+    def temporary_file_path(self):
+        return self.file.name
+
+    def close(self):
+        try:
+            return self.file.close()
+        except FileNotFoundError:
+            # The file was moved into place by the storage backend
+            pass
+
+
+def find_upload(prescription, user, upload_id, **filters):
+    """Return the user's upload session ``upload_id``, or ``None``."""
+    try:
+        upload_id = uuid.UUID(str(upload_id))
+    except ValueError:
+        return None
+    return UploadSession.objects.filter(
+        id=upload_id, prescription=prescription, created_by=user, **filters
+    ).first()
+
+
+def open_upload(prescription, user, upload_id, target):
+    """Return the finished upload ``upload_id`` as a file for ``target``."""
+    session = find_upload(prescription, user, upload_id, target=target)
+    if session is None:
+        raise UploadError(f"Upload {upload_id} not found", status.HTTP_404_NOT_FOUND)
+    if not session.is_complete:
+        raise UploadError(
+            f"Upload {upload_id} is incomplete ({session.offset} of {session.length} bytes)",
+            status.HTTP_409_CONFLICT
+        )
+    return SessionUploadedFile(session)
+
+
+def discard_upload(session):
+    """Delete a session and whatever is left of its part file."""
+    try:
+        os.remove(session.part_path)
+    except FileNotFoundError:
+        pass
+    session.delete()
@@ -0,0 +1,107 @@
+"""
+Single-statement saves of the one-to-one sections of a prescription.
+
+The workflow autosaves a section (clinical measures, postings, ...) every
+time the clinician edits it. ``upsert_section`` writes it with one
+``INSERT ... ON CONFLICT (prescription_id) DO UPDATE ... RETURNING``, so a
+save costs one round trip whether or not the row exists yet, and two saves
+of a new section cannot race into an ``IntegrityError`` on its one-to-one
+key::
+
+    posting, created = upsert_section(Posting, prescription, serializer.validated_data)
+
+Fields missing from the values keep their stored value, or get their
+default when the row is inserted. Like ``QuerySet.update()``, the statement
+bypasses ``save()`` and the model's signals.
+
+Databases that cannot return rows from an upsert fall back to
+``bulk_create(update_conflicts=True)`` followed by a read of the row.
+"""
+from django.db import connections, models, router
+
+CONFLICT_FIELD = 'prescription'
+
+
+def _insert_fields(model):
+    return [
+        field for field in model._meta.concrete_fields
+        # Database-generated keys are left to the database
+        if not (field.primary_key and isinstance(field, models.AutoField))
+    ]
+
+
+def _update_fields(insert_fields, names):
+    """The fields named in ``names``, plus the ``auto_now`` ones, that a conflict overwrites."""
+    return [
+        field for field in insert_fields
+        if not field.primary_key and field.name != CONFLICT_FIELD
+        and (field.name in names or getattr(field, 'auto_now', False))
+    ]
+
+
+def _upsert_sql(model, insert_fields, update_fields, connection):
+    quote = connection.ops.quote_name
+    conflict_column = quote(model._meta.get_field(CONFLICT_FIELD).column)
+    # Always assign something, so an empty save still returns the row
+    assignments = ', '.join(
+        f'{quote(field.column)} = EXCLUDED.{quote(field.column)}' for field in update_fields
+    ) or f'{conflict_column} = EXCLUDED.{conflict_column}'
+    return (
+        f'INSERT INTO {quote(model._meta.db_table)} '
+        f'({", ".join(quote(field.column) for field in insert_fields)}) '
+        f'VALUES ({", ".join(["%s"] * len(insert_fields))}) '
+        f'ON CONFLICT ({conflict_column}) DO UPDATE SET {assignments} '
+        f'RETURNING {", ".join(quote(field.column) for field in model._meta.concrete_fields)}'
+    )
+
+
+def _from_db(model, connection, values):
+    """A model instance from a row of raw column values, as a queryset would build it."""
+    fields = model._meta.concrete_fields
+    converted = []
+    for field, value in zip(fields, values):
+        column = field.get_col(model._meta.db_table)
+        for converter in connection.ops.get_db_converters(column) + column.get_db_converters(connection):
+            value = converter(value, column, connection)
+        converted.append(value)
+    return model.from_db(connection.alias, [field.attname for field in fields], converted)
+
+
+def _was_inserted(model, sent, stored):
+    # An update leaves the key (or the creation time, for database-generated
+    # keys) alone, so the stored row only holds the sent one if it was inserted
+    field = model._meta.pk
+    if isinstance(field, models.AutoField):
+        field = model._meta.get_field('created_at')
+    return getattr(sent, field.attname) == getattr(stored, field.attname)
+
+
+def upsert_section(model, prescription, values, defaults=None):
+    """
+    Insert or update the ``model`` row of ``prescription``; return ``(instance, created)``.
+
+    ``values`` are validated field values, e.g. a serializer's ``validated_data``.
+    ``defaults`` are only used when the row is inserted, as in ``get_or_create()``.
+    """
+    alias = router.db_for_write(model)
+    connection = connections[alias]
+    instance = model(**{CONFLICT_FIELD: prescription, **(defaults or {}), **values})
+    insert_fields = _insert_fields(model)
+    update_fields = _update_fields(insert_fields, values)
+
+    if connection.vendor in ('postgresql', 'sqlite') and connection.features.can_return_columns_from_insert:
+        params = [
+            field.get_db_prep_save(field.pre_save(instance, add=True), connection)
+            for field in insert_fields
+        ]
+        with connection.cursor() as cursor:
+            cursor.execute(_upsert_sql(model, insert_fields, update_fields, connection), params)
+            stored = _from_db(model, connection, cursor.fetchone())
+    else:
+        manager = model._default_manager.db_manager(alias)
+        manager.bulk_create(
+            [instance], update_conflicts=True, unique_fields=[CONFLICT_FIELD],
+            update_fields=[field.name for field in update_fields] or [CONFLICT_FIELD],
+        )
+        stored = manager.get(**{CONFLICT_FIELD: prescription})
+    return stored, _was_inserted(model, instance, stored)
@@ -13,27 +13,80 @@ from drf_yasg import openapi
 from .models import (
     Template, Prescription, Scan, ClinicalMeasure, IntrinsicAdjustment,
     OffLoading, PlanterModifier, Posting, MaterialSelection, ShoeFitting,
-    DeviceOption, Attachment, PrescriptionStatus, FootType, WearTime, Activity
+    DeviceOption, Attachment, PrescriptionStatus, FootType, WearTime, Activity,
+    ScanLOD, UploadSession
 )
-from users.models import Clinic
+from .cloning import SECTION_RELATIONS, clone_prescription
+from .json_patch import JSONPatchError, JSONPatchParser, patch_data
+from .lod import FULL_LEVEL, LOD_CONTENT_TYPE, LOD_LEVELS
+from .lookups import lookup_table
+from .scan_processing import FEET
+from .upserts import upsert_section
+from .uploads import (
+    CHUNK_CONTENT_TYPE, UploadError, append_chunk, discard_upload, find_upload, open_upload,
+    upload_headers
+)
+from core.caching import ClinicCachedListMixin
+from core.conditional import (
+    atomic_if_match, lock_rows, not_modified, not_modified_response, precondition_failed,
+    precondition_failed_response, rows_etag, with_etag
+)
+from core.datatables import DataTablesOrderingFilter, DataTablesSearchFilter
+from core.renderers import ORJSONParser
+from core.pagination import ListPagination
 from .serializers import (
-    TemplateSerializer, PrescriptionListSerializer, PrescriptionDetailSerializer,
-    PrescriptionCreateSerializer, ScanSerializer, ClinicalMeasureSerializer,
+    TemplateSerializer, PrescriptionListSerializer, PrescriptionListRowSerializer, PrescriptionDetailSerializer,
+    PrescriptionCreateSerializer, PrescriptionFullSerializer, PrescriptionCloneSerializer, ScanSerializer, ClinicalMeasureSerializer,
     IntrinsicAdjustmentSerializer, OffLoadingSerializer, PlanterModifierSerializer,
     PostingSerializer, MaterialSelectionSerializer, ShoeFittingSerializer,
     DeviceOptionSerializer, AttachmentSerializer, PrescriptionStatusSerializer,
-    FootTypeSerializer, WearTimeSerializer, ActivitySerializer
+    FootTypeSerializer, WearTimeSerializer, ActivitySerializer, UploadSessionSerializer,
+    JSONPatchOperationSerializer, section_serializer
 )
 from patients.models import Patient
 import logging
 from rest_framework.exceptions import ValidationError
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.http import FileResponse, Http404, JsonResponse
+from django.utils.cache import patch_cache_control
+from django.utils.http import quote_etag
 
 logger = logging.getLogger(__name__)
 
+
+class CachedLookupMixin:
+    """
+    List a lookup table from the per-process cache in ``prescriptions.lookups``.
+    
+    Responses carry the table's version as their ``ETag``; clients that send
+    it back in ``If-None-Match`` get a ``304 Not Modified`` without a body.
+    """
+    
+    def filter_lookup_rows(self, rows):
+        return rows
+    
+    def list(self, request, *args, **kwargs):
+        model = self.queryset.model
+        version, rows = lookup_table(model)
+        etag = quote_etag(f'{model._meta.model_name}-{version}') if version else None
+        if etag and not_modified(request, etag):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            rows = self.filter_lookup_rows(rows)
+            page = self.paginate_queryset(rows)
+            if page is not None:
+                response = self.get_paginated_response(self.get_serializer(page, many=True).data)
+            else:
+                response = Response(self.get_serializer(rows, many=True).data)
+        if etag:
+            response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
 @method_decorator(csrf_exempt, name='dispatch')
-class TemplateViewSet(viewsets.ModelViewSet):
+class TemplateViewSet(CachedLookupMixin, viewsets.ModelViewSet):
     """
     API endpoint for prescription templates.
     
@@ -97,33 +150,74 @@ class TemplateViewSet(viewsets.ModelViewSet):
             active = active.lower() == 'true'
             queryset = queryset.filter(is_active=active)
         return queryset
+    
+    def filter_lookup_rows(self, rows):
+        """The cached counterpart of ``get_queryset``."""
+        active = self.request.query_params.get('active')
+        if active is not None:
+            active = active.lower() == 'true'
+            rows = [template for template in rows if template.is_active == active]
+        return rows
 
 @method_decorator(csrf_exempt, name='dispatch')
-class PrescriptionViewSet(viewsets.ModelViewSet):
+class PrescriptionViewSet(ClinicCachedListMixin, viewsets.ModelViewSet):
     """
     API endpoint for prescriptions.
     """
     permission_classes = [permissions.IsAuthenticated]
+    filter_backends = [DataTablesSearchFilter, DataTablesOrderingFilter]
+    pagination_class = ListPagination
+    # Annotations from PrescriptionQuerySet.list_rows()
+    search_fields = ['patient_name', 'clinician_name', 'template_name', 'status_name']
+    datatables_columns = {
+        'patient_name': 'patient_name', 'clinician_name': 'clinician_name',
+        'template_name': 'template_name', 'status_name': 'status_name',
+        'created_at': 'created_at', 'updated_at': 'updated_at',
+    }
+    
+    # Related rows each serializer renders, loaded up front so the number of
+    # queries stays fixed however many nested serializers there are.
+    # The list action reads annotated rows instead (see PrescriptionQuerySet)
+    # and sub-resource actions only need the prescription itself.
+    LIST_SELECT_RELATED = ('patient', 'clinician', 'template', 'status')
+    DETAIL_SELECT_RELATED = LIST_SELECT_RELATED + (
+        'foot_type', 'wear_time', 'activity_level',
+        'clinical_measures', 'intrinsic_adjustments', 'off_loading', 'planter_modifier',
+        'postings', 'material_selection', 'shoe_fitting', 'device_options',
+    )
+    DETAIL_PREFETCH_RELATED = ('scans__metadata', 'scans__lods', 'attachments')
     
     def get_serializer_class(self):
         if self.action == 'create':
             return PrescriptionCreateSerializer
         elif self.action == 'retrieve':
             return PrescriptionDetailSerializer
+        elif self.action == 'list':
+            return PrescriptionListRowSerializer
         return PrescriptionListSerializer
     
     def get_queryset(self):
         """
-        Get prescriptions for the current user's clinic.
+        Get prescriptions for the current user's clinic, with the related
+        data the current action serializes.
         """
-        user = self.request.user
-        if user.is_staff:
-            return Prescription.objects.all().order_by('-created_at')
-        # Get the user's clinic
-        clinic = Clinic.objects.filter(users=user).first()
-        if clinic:
-            return Prescription.objects.filter(patient__clinic=clinic).order_by('-created_at')
-        return Prescription.objects.none()
+        if self.request.user.is_staff:
+            queryset = Prescription.objects.all()
+        else:
+            queryset = Prescription.objects.for_clinic(self.request.tenant)
+        
+        if self.action == 'list':
+            queryset = queryset.list_rows()
+        elif self.action in ('retrieve', 'full', 'json_patch'):
+            queryset = queryset.select_related(*self.DETAIL_SELECT_RELATED)
+            queryset = queryset.prefetch_related(*self.DETAIL_PREFETCH_RELATED)
+        elif self.action in ('update', 'partial_update'):
+            queryset = queryset.select_related(*self.LIST_SELECT_RELATED)
+        elif self.action == 'clone':
+            queryset = queryset.select_related('patient', *SECTION_RELATIONS).prefetch_related(
+                'scans__metadata', 'scans__lods'
+            )
+        return queryset.order_by('-created_at')
     
     def perform_create(self, serializer):
         """
@@ -186,6 +280,7 @@ class PrescriptionViewSet(viewsets.ModelViewSet):
         return super().destroy(request, *args, **kwargs)
     
     @action(detail=True, methods=['get', 'put', 'patch', 'post'])
+    @atomic_if_match
     def scans(self, request, pk=None):
         """
         Get or update scan images for the prescription.
@@ -193,15 +288,28 @@ class PrescriptionViewSet(viewsets.ModelViewSet):
         GET: Get scan images for the prescription
         PUT/PATCH: Update scan images for an existing scan
         POST: Create a new scan for the prescription
+        
+        Files can be sent as multipart ``left_foot``/``right_foot`` or as the
+        ids of finished resumable uploads in ``left_foot_upload``/``right_foot_upload``.
         """
+        uploads = {}
         try:
             prescription = self.get_object()
             logger.info(f"Processing scan request for prescription {prescription.id}")
             
-            if request.method == 'GET':
-                scans = Scan.objects.filter(prescription=prescription)
-                serializer = ScanSerializer(scans, many=True, context={'request': request})
-                return Response(serializer.data)
+            if request.method == 'GET' or 'If-Match' in request.headers:
+                if request.method != 'GET':
+                    # Held until the write commits, see atomic_if_match
+                    lock_rows(Prescription.objects.filter(pk=prescription.pk))
+                scans = Scan.objects.filter(prescription=prescription).prefetch_related('metadata', 'lods')
+                etag = rows_etag(*self._scan_rows(scans))
+                if request.method == 'GET':
+                    if not_modified(request, etag):
+                        return not_modified_response(etag)
+                    serializer = ScanSerializer(scans, many=True, context={'request': request})
+                    return with_etag(Response(serializer.data), etag)
+                if precondition_failed(request, etag):
+                    return precondition_failed_response(etag)
             
             if request.method == 'POST':
                 # Create a new scan
@@ -217,6 +325,10 @@ class PrescriptionViewSet(viewsets.ModelViewSet):
                     data['right_foot'] = request.FILES['right_foot']
                     logger.info(f"Right foot scan received for prescription {prescription.id}")
                 
+                # Handle finished resumable uploads
+                uploads = self._finished_scan_uploads(request, prescription)
+                data.update(uploads)
+                
                 if not ('left_foot' in data or 'right_foot' in data):
                     return Response(
                         {"error": "At least one scan file must be provided."},
@@ -250,6 +362,9 @@ class PrescriptionViewSet(viewsets.ModelViewSet):
             if 'right_foot' in request.FILES:
                 data['right_foot'] = request.FILES['right_foot']
             
+            uploads = self._finished_scan_uploads(request, prescription)
+            data.update(uploads)
+            
             serializer = ScanSerializer(scan, data=data, partial=request.method == 'PATCH', context={'request': request})
             if serializer.is_valid():
                 serializer.save()
@@ -264,12 +379,141 @@ class PrescriptionViewSet(viewsets.ModelViewSet):
                 {"error": "Prescription not found"},
                 status=status.HTTP_404_NOT_FOUND
             )
+        except UploadError as e:
+            return Response({"error": str(e)}, status=e.status_code)
         except Exception as e:
             logger.error(f"Error handling scan upload for prescription {pk}: {str(e)}")
             return Response(
                 {"error": f"Error processing scan upload: {str(e)}"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+        finally:
+            # A finished upload is used once, whether or not it was valid
+            for upload in uploads.values():
+                upload.close()
+                discard_upload(upload.session)
+    
+    def _scan_rows(self, scans):
+        """The rows a serialized scan is made of, for its ``ETag``."""
+        return [row for scan in scans for row in (scan, *scan.metadata.all(), *scan.lods.all())]
+    
+    def _finished_scan_uploads(self, request, prescription):
+        """Open the finished resumable uploads named in the request body."""
+        uploads = {}
+        for field in ('left_foot', 'right_foot'):
+            upload_id = request.data.get(f'{field}_upload')
+            if upload_id and field not in request.FILES:
+                uploads[field] = open_upload(prescription, request.user, upload_id, field)
+                logger.info(f"Resumable {field} upload {upload_id} received for prescription {prescription.id}")
+        return uploads
+    
+    @swagger_auto_schema(
+        method='get',
+        operation_description="Poll the post-processing status of a scan. processing_status moves from "
+                              "'pending' through 'processing' to 'ready' or 'failed'.",
+        responses={200: ScanSerializer()}
+    )
+    @action(detail=True, methods=['get'], url_path=r'scans/(?P<scan_id>[^/.]+)/status')
+    def scan_status(self, request, pk=None, scan_id=None):
+        """
+        Get the processing status of a scan, with its metadata and LODs once ready.
+        """
+        try:
+            prescription = self.get_object()
+            scan = Scan.objects.filter(prescription=prescription, id=scan_id).prefetch_related('metadata', 'lods').first()
+            if scan is None:
+                return Response(
+                    {"error": "Scan not found"},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            # Polled while the scan is processed; unchanged polls get a 304
+            etag = rows_etag(*self._scan_rows([scan]))
+            if not_modified(request, etag):
+                return not_modified_response(etag)
+            serializer = ScanSerializer(scan, context={'request': request})
+            return with_etag(Response(serializer.data), etag)
+        
+        except Http404:
+            raise
+        except DjangoValidationError:
+            return Response({"error": "Scan not found"}, status=status.HTTP_404_NOT_FOUND)
+        except Exception as e:
+            logger.error(f"Error getting status of scan {scan_id}: {str(e)}")
+            return Response(
+                {"error": f"Error getting scan status: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+    
+    @swagger_auto_schema(
+        method='get',
+        operation_description="Download a level-of-detail version of one foot of a scan. "
+                              "'low' and 'medium' are decimated meshes in the compact LOD format; "
+                              "'full' is the original upload.",
+        manual_parameters=[
+            openapi.Parameter(
+                'foot', openapi.IN_QUERY,
+                description="Which foot to download",
+                type=openapi.TYPE_STRING, enum=['left', 'right'], required=True
+            )
+        ],
+        responses={200: "Binary mesh", 404: "Scan or level not available"}
+    )
+    @action(detail=True, methods=['get'], url_path=r'scans/(?P<scan_id>[^/.]+)/lod/(?P<level>[^/.]+)')
+    def scan_lod(self, request, pk=None, scan_id=None, level=None):
+        """
+        Serve a decimated preview or the full mesh of a scan.
+        
+        LODs are built in the background after upload, so a level can be
+        missing for a short while; clients should fall back to the next one.
+        """
+        try:
+            prescription = self.get_object()
+            foot = request.query_params.get('foot')
+            if foot not in FEET:
+                return Response(
+                    {"error": "foot must be 'left' or 'right'"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if level != FULL_LEVEL and level not in LOD_LEVELS:
+                return Response(
+                    {"error": f"Unknown level '{level}'"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            scan = get_object_or_404(Scan, id=scan_id, prescription=prescription)
+            if level == FULL_LEVEL:
+                field_file = getattr(scan, f'{foot}_foot')
+                content_type = 'application/octet-stream'
+                etag = rows_etag(scan)
+            else:
+                lod = ScanLOD.objects.filter(scan=scan, foot=foot, level=level).first()
+                field_file = lod.file if lod else None
+                content_type = LOD_CONTENT_TYPE
+                etag = rows_etag(lod)
+            
+            if not field_file:
+                return Response(
+                    {"error": f"No {level} {foot} scan available"},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            if not_modified(request, etag):
+                return not_modified_response(etag)
+            # LODs are rebuilt in place, so clients revalidate instead of
+            # keeping a copy for a fixed time
+            response = FileResponse(field_file.open('rb'), content_type=content_type)
+            response['Content-Length'] = field_file.size
+            return with_etag(response, etag)
+        
+        except Http404:
+            raise
+        except DjangoValidationError:
+            return Response({"error": "Scan not found"}, status=status.HTTP_404_NOT_FOUND)
+        except Exception as e:
+            logger.error(f"Error serving {level} scan for prescription {pk}: {str(e)}")
+            return Response(
+                {"error": f"Error serving scan: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
     
     @swagger_auto_schema(
         method='get',
@@ -305,16 +549,20 @@ class PrescriptionViewSet(viewsets.ModelViewSet):
             )
 
         try:
-            clinical_measure, created = ClinicalMeasure.objects.get_or_create(
-                prescription=prescription
-            )
+            if request.method == 'GET':
+                clinical_measure, created = ClinicalMeasure.objects.get_or_create(
+                    prescription=prescription
+                )
+                etag = rows_etag(clinical_measure)
+                if not_modified(request, etag):
+                    return not_modified_response(etag)
+                serializer = ClinicalMeasureSerializer(clinical_measure)
+                return with_etag(Response(serializer.data), etag)
 
-            if request.method == 'POST':
-                serializer = ClinicalMeasureSerializer(clinical_measure, data=request.data)
-                if serializer.is_valid():
-                    serializer.save()
-                    return Response(serializer.data, status=status.HTTP_201_CREATED)
-                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            status_code = status.HTTP_201_CREATED if request.method == 'POST' else status.HTTP_200_OK
+            return self._save_section(
+                request, prescription, ClinicalMeasure, ClinicalMeasureSerializer, status_code=status_code
+            )
             
         except Exception as e:
             return Response(
@@ -359,30 +607,19 @@ class PrescriptionViewSet(viewsets.ModelViewSet):
             )
 
         try:
-            # Get or create the instance
-            instance, created = IntrinsicAdjustment.objects.get_or_create(
-                prescription=prescription
-            )
-            
             if request.method == 'GET':
+                # Get or create the instance
+                instance, created = IntrinsicAdjustment.objects.get_or_create(
+                    prescription=prescription
+                )
+                etag = rows_etag(instance)
+                if not_modified(request, etag):
+                    return not_modified_response(etag)
                 serializer = IntrinsicAdjustmentSerializer(instance)
-                return Response(serializer.data)
-            
-            # For POST, PUT, PATCH - update the instance
-            data = request.data.copy()
-            data['prescription'] = prescription.id
-            
-            serializer = IntrinsicAdjustmentSerializer(
-                instance,
-                data=data,
-                partial=request.method == 'PATCH'
-            )
+                return with_etag(Response(serializer.data), etag)
             
-            if serializer.is_valid():
-                serializer.save()
-                status_code = status.HTTP_201_CREATED if created else status.HTTP_200_OK
-                return Response(serializer.data, status=status_code)
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            # For POST, PUT, PATCH - create or update the instance
+            return self._save_section(request, prescription, IntrinsicAdjustment, IntrinsicAdjustmentSerializer)
             
         except Exception as e:
             logger.error(f"Error handling intrinsic adjustments for prescription {pk}: {str(e)}")
@@ -428,30 +665,19 @@ class PrescriptionViewSet(viewsets.ModelViewSet):
             )
 
         try:
-            # Get or create the instance
-            instance, created = OffLoading.objects.get_or_create(
-                prescription=prescription
-            )
-            
             if request.method == 'GET':
+                # Get or create the instance
+                instance, created = OffLoading.objects.get_or_create(
+                    prescription=prescription
+                )
+                etag = rows_etag(instance)
+                if not_modified(request, etag):
+                    return not_modified_response(etag)
                 serializer = OffLoadingSerializer(instance)
-                return Response(serializer.data)
-            
-            # For POST, PUT, PATCH - update the instance
-            data = request.data.copy()
-            data['prescription'] = prescription.id
+                return with_etag(Response(serializer.data), etag)
             
-            serializer = OffLoadingSerializer(
-                instance,
-                data=data,
-                partial=request.method == 'PATCH'
-            )
-            
-            if serializer.is_valid():
-                serializer.save()
-                status_code = status.HTTP_201_CREATED if created else status.HTTP_200_OK
-                return Response(serializer.data, status=status_code)
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            # For POST, PUT, PATCH - create or update the instance
+            return self._save_section(request, prescription, OffLoading, OffLoadingSerializer)
             
         except Exception as e:
             logger.error(f"Error handling off-loading for prescription {pk}: {str(e)}")
@@ -493,12 +719,15 @@ class PrescriptionViewSet(viewsets.ModelViewSet):
             try:
                 # Use filter().first() instead of direct attribute access
                 planter_modifier = PlanterModifier.objects.filter(prescription=prescription).first()
+                etag = rows_etag(planter_modifier)
+                if not_modified(request, etag):
+                    return not_modified_response(etag)
                 if planter_modifier:
                     serializer = PlanterModifierSerializer(planter_modifier)
-                    return Response(serializer.data)
+                    return with_etag(Response(serializer.data), etag)
                 else:
                     # Return empty data if no plantar modifiers exist yet
-                    return Response({})
+                    return with_etag(Response({}), etag)
             except Exception as e:
                 logger.error(f"Error retrieving plantar modifiers: {str(e)}")
                 return Response(
@@ -508,33 +737,10 @@ class PrescriptionViewSet(viewsets.ModelViewSet):
 
         elif request.method == 'POST':
             try:
-                # Add prescription to the data
-                data = request.data.copy()
-                data['prescription'] = prescription.id
-
-                # Try to get existing planter modifier or create new one
-                planter_modifier = PlanterModifier.objects.filter(prescription=prescription).first()
-                
-                if planter_modifier:
-                    # Update existing
-                    serializer = PlanterModifierSerializer(
-                        planter_modifier,
-                        data=data,
-                        partial=True
-                    )
-                else:
-                    # Create new
-                    serializer = PlanterModifierSerializer(data=data)
-
-                if serializer.is_valid():
-                    serializer.save()
-                    return Response(
-                        serializer.data,
-                        status=status.HTTP_201_CREATED
-                    )
-                return Response(
-                    serializer.errors,
-                    status=status.HTTP_400_BAD_REQUEST
+                # Update the existing planter modifier or create a new one
+                return self._save_section(
+                    request, prescription, PlanterModifier, PlanterModifierSerializer,
+                    partial=True, status_code=status.HTTP_201_CREATED
                 )
             except Exception as e:
                 logger.error(f"Error saving plantar modifiers: {str(e)}")
@@ -552,37 +758,40 @@ class PrescriptionViewSet(viewsets.ModelViewSet):
             prescription = self.get_object()
             logger.info(f"Processing posting request for prescription {prescription.id}")
             
-            # Get or create the posting instance
-            instance, created = Posting.objects.get_or_create(
-                prescription=prescription,
-                defaults={
-                    'prescription': prescription,
-                    'left_heel_post_angle': 0,
-                    'right_heel_post_angle': 0,
-                    'left_heel_post_pitch': 0,
-                    'right_heel_post_pitch': 0,
-                    'left_heel_post_raise': 0,
-                    'right_heel_post_raise': 0,
-                    'left_heel_post_taper': 0,
-                    'right_heel_post_taper': 0,
-                    'left_forefoot_post_width': 'none',
-                    'right_forefoot_post_width': 'none',
-                    'left_forefoot_post_medial': False,
-                    'left_forefoot_post_lateral': False,
-                    'right_forefoot_post_medial': False,
-                    'right_forefoot_post_lateral': False,
-                    'left_forefoot_post_angle': 0,
-                    'right_forefoot_post_angle': 0
-                }
-            )
+            # Values of a new posting
+            defaults = {
+                'left_heel_post_angle': 0,
+                'right_heel_post_angle': 0,
+                'left_heel_post_pitch': 0,
+                'right_heel_post_pitch': 0,
+                'left_heel_post_raise': 0,
+                'right_heel_post_raise': 0,
+                'left_heel_post_taper': 0,
+                'right_heel_post_taper': 0,
+                'left_forefoot_post_width': 'none',
+                'right_forefoot_post_width': 'none',
+                'left_forefoot_post_medial': False,
+                'left_forefoot_post_lateral': False,
+                'right_forefoot_post_medial': False,
+                'right_forefoot_post_lateral': False,
+                'left_forefoot_post_angle': 0,
+                'right_forefoot_post_angle': 0
+            }
             
             if request.method == 'GET':
+                # Get or create the posting instance
+                instance, created = Posting.objects.get_or_create(
+                    prescription=prescription,
+                    defaults=defaults
+                )
+                etag = rows_etag(instance)
+                if not_modified(request, etag):
+                    return not_modified_response(etag)
                 serializer = PostingSerializer(instance)
-                return Response(serializer.data)
+                return with_etag(Response(serializer.data), etag)
             
             # For PUT/PATCH requests
             data = request.data.copy()
-            data['prescription'] = prescription.id
             
             # Ensure all numeric fields are properly converted
             numeric_fields = [
@@ -618,19 +827,7 @@ class PrescriptionViewSet(viewsets.ModelViewSet):
                 if field in data and data[field] not in valid_widths:
                     data[field] = 'none'
             
-            serializer = PostingSerializer(
-                instance,
-                data=data,
-                partial=request.method == 'PATCH'
-            )
-            
-            if serializer.is_valid():
-                serializer.save()
-                status_code = status.HTTP_201_CREATED if created else status.HTTP_200_OK
-                return Response(serializer.data, status=status_code)
-            
-            logger.error(f"Validation error for posting: {serializer.errors}")
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            return self._save_section(request, prescription, Posting, PostingSerializer, data=data, defaults=defaults)
             
         except Exception as e:
             logger.error(f"Error handling posting for prescription {pk}: {str(e)}")
@@ -646,16 +843,18 @@ class PrescriptionViewSet(viewsets.ModelViewSet):
         """
         try:
             prescription = self.get_object()
-            instance, created = MaterialSelection.objects.get_or_create(prescription=prescription)
-            
             if request.method == 'GET':
+                instance, created = MaterialSelection.objects.get_or_create(prescription=prescription)
+                etag = rows_etag(instance)
+                if not_modified(request, etag):
+                    return not_modified_response(etag)
                 serializer = MaterialSelectionSerializer(instance)
-                return Response(serializer.data)
+                return with_etag(Response(serializer.data), etag)
             
-            serializer = MaterialSelectionSerializer(instance, data=request.data, partial=request.method == 'PATCH')
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
-            return Response(serializer.data)
+            return self._save_section(
+                request, prescription, MaterialSelection, MaterialSelectionSerializer,
+                status_code=status.HTTP_200_OK
+            )
             
         except Exception as e:
             logger.error(f"Error handling material selection: {str(e)}")
@@ -672,28 +871,22 @@ class PrescriptionViewSet(viewsets.ModelViewSet):
         try:
             prescription = self.get_object()
             
-            # Get or create the shoe fitting instance
-            instance, created = ShoeFitting.objects.get_or_create(
-                prescription=prescription,
-                defaults={'prescription': prescription}
-            )
-            
             if request.method == 'GET':
+                # Get or create the shoe fitting instance
+                instance, created = ShoeFitting.objects.get_or_create(
+                    prescription=prescription,
+                    defaults={'prescription': prescription}
+                )
+                etag = rows_etag(instance)
+                if not_modified(request, etag):
+                    return not_modified_response(etag)
                 serializer = ShoeFittingSerializer(instance)
-                return Response(serializer.data)
+                return with_etag(Response(serializer.data), etag)
             
             # For PUT/PATCH requests
-            data = request.data.copy()
-            data['prescription'] = prescription.id
-            
-            serializer = ShoeFittingSerializer(
-                instance,
-                data=data,
-                partial=request.method == 'PATCH'
+            return self._save_section(
+                request, prescription, ShoeFitting, ShoeFittingSerializer, status_code=status.HTTP_200_OK
             )
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
-            return Response(serializer.data)
             
         except Exception as e:
             logger.error(f"Error handling shoe fitting: {str(e)}")
@@ -710,28 +903,22 @@ class PrescriptionViewSet(viewsets.ModelViewSet):
         try:
             prescription = self.get_object()
             
-            # Get or create the device options instance
-            instance, created = DeviceOption.objects.get_or_create(
-                prescription=prescription,
-                defaults={'prescription': prescription}
-            )
-            
             if request.method == 'GET':
+                # Get or create the device options instance
+                instance, created = DeviceOption.objects.get_or_create(
+                    prescription=prescription,
+                    defaults={'prescription': prescription}
+                )
+                etag = rows_etag(instance)
+                if not_modified(request, etag):
+                    return not_modified_response(etag)
                 serializer = DeviceOptionSerializer(instance)
-                return Response(serializer.data)
+                return with_etag(Response(serializer.data), etag)
             
             # For PUT/PATCH requests
-            data = request.data.copy()
-            data['prescription'] = prescription.id
-            
-            serializer = DeviceOptionSerializer(
-                instance,
-                data=data,
-                partial=request.method == 'PATCH'
+            return self._save_section(
+                request, prescription, DeviceOption, DeviceOptionSerializer, status_code=status.HTTP_200_OK
             )
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
-            return Response(serializer.data)
             
         except Exception as e:
             logger.error(f"Error handling device options: {str(e)}")
@@ -740,6 +927,136 @@ class PrescriptionViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
+    @atomic_if_match
+    def _save_section(self, request, prescription, model, serializer_class, data=None,
+                      partial=None, defaults=None, status_code=None):
+        """
+        Validate a one-to-one section of the prescription from the request
+        and save it with a single upsert (see ``prescriptions.upserts``).
+        
+        The row is only read first to check an ``If-Match`` header, locked
+        until the upsert commits. Responds with ``status_code``, or with 201
+        for a new row and 200 otherwise.
+        """
+        if 'If-Match' in request.headers:
+            # The prescription's lock orders conditional saves of a section
+            # that does not exist yet; the section's lock holds off others
+            lock_rows(Prescription.objects.filter(pk=prescription.pk))
+            etag = rows_etag(model.objects.select_for_update().filter(prescription=prescription).first())
+            if precondition_failed(request, etag):
+                return precondition_failed_response(etag)
+        
+        serializer = section_serializer(serializer_class)(
+            data=request.data if data is None else data,
+            partial=request.method == 'PATCH' if partial is None else partial
+        )
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        instance, created = upsert_section(model, prescription, serializer.validated_data, defaults)
+        if status_code is None:
+            status_code = status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        return with_etag(Response(serializer_class(instance).data, status=status_code), rows_etag(instance))
+    
+    @swagger_auto_schema(
+        methods=['put', 'patch'],
+        operation_description="Save the prescription and all of its workflow sections in one transaction. "
+                              "Sections are keyed like in the detail response; only changed rows are written.",
+        request_body=PrescriptionFullSerializer,
+        responses={200: PrescriptionDetailSerializer()}
+    )
+    @action(detail=True, methods=['put', 'patch'])
+    def full(self, request, pk=None):
+        """
+        Save a whole prescription, e.g. when the workflow is submitted,
+        instead of one request per step.
+        """
+        prescription = self.get_object()
+        serializer = PrescriptionFullSerializer(
+            prescription, data=request.data, partial=request.method == 'PATCH'
+        )
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            with transaction.atomic():
+                prescription = serializer.save()
+        except Exception as e:
+            logger.error(f"Error saving prescription {pk}: {str(e)}")
+            return Response(
+                {"error": f"Error saving prescription: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        return Response(PrescriptionDetailSerializer(prescription, context=self.get_serializer_context()).data)
+    
+    @swagger_auto_schema(
+        method='patch',
+        operation_description="Apply a JSON Patch (RFC 6902) document to the prescription and its workflow "
+                              "sections, e.g. /general_notes or /postings/left_heel_post_angle. Supports add, "
+                              "replace and test; the document is applied in one transaction, writing only "
+                              "the changed columns.",
+        request_body=JSONPatchOperationSerializer(many=True),
+        responses={200: PrescriptionDetailSerializer(), 409: "A test operation failed"}
+    )
+    @action(detail=True, methods=['patch'], url_path='json-patch', parser_classes=[JSONPatchParser, ORJSONParser])
+    def json_patch(self, request, pk=None):
+        """
+        Autosave field-level changes, sending a burst of edits as one request.
+        """
+        prescription = self.get_object()
+        operations = JSONPatchOperationSerializer(data=request.data, many=True)
+        if not operations.is_valid():
+            return Response(operations.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            with transaction.atomic():
+                # Tests are checked against the rows as they are once locked,
+                # so two patches cannot both pass a test of the same value
+                lock_rows(Prescription.objects.filter(pk=prescription.pk))
+                prescription = self.get_queryset().get(pk=prescription.pk)
+                data = patch_data(prescription, operations.validated_data)
+                serializer = PrescriptionFullSerializer(prescription, data=data, partial=True)
+                if not serializer.is_valid():
+                    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+                prescription = serializer.save()
+        except JSONPatchError as e:
+            return Response({"error": str(e)}, status=e.status_code)
+        except Exception as e:
+            logger.error(f"Error patching prescription {pk}: {str(e)}")
+            return Response(
+                {"error": f"Error saving prescription: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        return Response(PrescriptionDetailSerializer(prescription, context=self.get_serializer_context()).data)
+    
+    @swagger_auto_schema(
+        method='post',
+        operation_description="Copy the prescription and all of its workflow sections into a new prescription "
+                              "for a repeat order. With include_scans, the copy shares the original's scan files.",
+        request_body=PrescriptionCloneSerializer,
+        responses={201: PrescriptionCreateSerializer()}
+    )
+    @action(detail=True, methods=['post'])
+    def clone(self, request, pk=None):
+        """
+        Start a repeat order from an existing prescription in one request.
+        """
+        prescription = self.get_object()
+        serializer = PrescriptionCloneSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            clone = clone_prescription(prescription, request.user, **serializer.validated_data)
+        except Exception as e:
+            logger.error(f"Error cloning prescription {pk}: {str(e)}")
+            return Response(
+                {"error": f"Error cloning prescription: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        logger.info(f"Cloned prescription {pk} into {clone.id}")
+        return Response(PrescriptionCreateSerializer(clone).data, status=status.HTTP_201_CREATED)
+    
     @swagger_auto_schema(
         method='get',
         operation_description="Get attachments for the prescription",
@@ -767,25 +1084,42 @@ class PrescriptionViewSet(viewsets.ModelViewSet):
     def attachments(self, request, pk=None):
         """
         Get, create, or delete attachments for the prescription.
+        
+        POST takes either a multipart ``file`` or the id of a finished
+        resumable upload in ``upload``.
         """
+        upload = None
         try:
             prescription = self.get_object()
             
-            if request.method == 'GET':
-                attachments = Attachment.objects.filter(prescription=prescription)
-                serializer = AttachmentSerializer(attachments, many=True)
-                return Response(serializer.data)
+            if request.method == 'GET' or 'If-Match' in request.headers:
+                if request.method != 'GET':
+                    # Held until the write commits, see atomic_if_match
+                    lock_rows(Prescription.objects.filter(pk=prescription.pk))
+                attachments = Attachment.objects.filter(prescription=prescription).order_by('uploaded_at', 'id')
+                etag = rows_etag(*attachments)
+                if request.method == 'GET':
+                    if not_modified(request, etag):
+                        return not_modified_response(etag)
+                    serializer = AttachmentSerializer(attachments, many=True)
+                    return with_etag(Response(serializer.data), etag)
+                if precondition_failed(request, etag):
+                    return precondition_failed_response(etag)
             
-            elif request.method == 'POST':
+            if request.method == 'POST':
                 # Handle file upload
-                if 'file' not in request.FILES:
+                if 'file' in request.FILES:
+                    file_obj = request.FILES['file']
+                elif request.data.get('upload'):
+                    upload = open_upload(prescription, request.user, request.data['upload'], 'attachment')
+                    file_obj = upload
+                else:
                     return Response(
                         {"error": "No file provided"},
                         status=status.HTTP_400_BAD_REQUEST
                     )
                 
-                file_obj = request.FILES['file']
-                filename = request.POST.get('filename', file_obj.name)
+                filename = request.data.get('filename', file_obj.name)
                 
                 # Create attachment
                 attachment = Attachment.objects.create(
@@ -809,12 +1143,126 @@ class PrescriptionViewSet(viewsets.ModelViewSet):
                 attachment.delete()
                 return Response(status=status.HTTP_204_NO_CONTENT)
                 
+        except UploadError as e:
+            return Response({"error": str(e)}, status=e.status_code)
         except Exception as e:
             logger.error(f"Error handling attachment: {str(e)}")
             return Response(
                 {"error": f"Error processing attachment: {str(e)}"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+        finally:
+            if upload is not None:
+                upload.close()
+                discard_upload(upload.session)
+    
+    @swagger_auto_schema(
+        method='get',
+        operation_description="List your unfinished resumable uploads for the prescription",
+        responses={200: UploadSessionSerializer(many=True)}
+    )
+    @swagger_auto_schema(
+        method='post',
+        operation_description="Start a resumable upload of a scan or attachment. "
+                              "Send the bytes with PATCH to the returned upload, then pass its id "
+                              "to the scans (left_foot_upload/right_foot_upload) or attachments (upload) endpoint.",
+        request_body=UploadSessionSerializer,
+        responses={201: UploadSessionSerializer()}
+    )
+    @action(detail=True, methods=['get', 'post'])
+    def uploads(self, request, pk=None):
+        """
+        List or start resumable uploads for the prescription.
+        """
+        try:
+            prescription = self.get_object()
+            
+            if request.method == 'GET':
+                sessions = UploadSession.objects.filter(
+                    prescription=prescription, created_by=request.user
+                ).order_by('created_at')
+                serializer = UploadSessionSerializer(sessions, many=True)
+                return Response(serializer.data)
+            
+            serializer = UploadSessionSerializer(data=request.data)
+            if serializer.is_valid():
+                session = serializer.save(prescription=prescription, created_by=request.user)
+                logger.info(f"Started upload {session.id} of {session.filename} ({session.length} bytes) for prescription {prescription.id}")
+                headers = upload_headers(session)
+                headers['Location'] = request.build_absolute_uri(f'{session.id}/')
+                return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        except Exception as e:
+            logger.error(f"Error starting upload for prescription {pk}: {str(e)}")
+            return Response(
+                {"error": f"Error starting upload: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+    
+    @swagger_auto_schema(
+        method='patch',
+        operation_description="Append a chunk to a resumable upload. The body is raw bytes "
+                              f"with Content-Type {CHUNK_CONTENT_TYPE}; Upload-Offset must equal the bytes received so far.",
+        manual_parameters=[
+            openapi.Parameter(
+                'Upload-Offset', openapi.IN_HEADER,
+                description="Offset of the first byte in this chunk",
+                type=openapi.TYPE_INTEGER, required=True
+            )
+        ],
+        responses={204: "Chunk stored; Upload-Offset holds the new offset", 409: "Offset mismatch"}
+    )
+    @action(detail=True, methods=['get', 'head', 'patch', 'delete'], url_path=r'uploads/(?P<upload_id>[^/.]+)')
+    def upload_session(self, request, pk=None, upload_id=None):
+        """
+        Inspect, continue or cancel a resumable upload.
+        
+        GET/HEAD: Current offset (HEAD returns only the Upload-Offset/Upload-Length headers)
+        PATCH: Append the request body at Upload-Offset
+        DELETE: Cancel the upload
+        """
+        try:
+            prescription = self.get_object()
+            session = find_upload(prescription, request.user, upload_id)
+            if session is None:
+                return Response({"error": "Upload not found"}, status=status.HTTP_404_NOT_FOUND)
+            
+            if request.method in ('GET', 'HEAD'):
+                serializer = UploadSessionSerializer(session)
+                return Response(serializer.data, headers=upload_headers(session))
+            
+            if request.method == 'DELETE':
+                discard_upload(session)
+                return Response(status=status.HTTP_204_NO_CONTENT)
+            
+            if request.content_type.split(';')[0].strip() != CHUNK_CONTENT_TYPE:
+                return Response(
+                    {"error": f"Content-Type must be {CHUNK_CONTENT_TYPE}"},
+                    status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+                )
+            try:
+                offset = int(request.headers['Upload-Offset'])
+                content_length = int(request.headers.get('Content-Length') or 0)
+            except (KeyError, ValueError):
+                return Response(
+                    {"error": "A numeric Upload-Offset header is required"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            append_chunk(session, request.stream, offset, content_length)
+            return Response(status=status.HTTP_204_NO_CONTENT, headers=upload_headers(session))
+        
+        except Http404:
+            raise
+        except UploadError as e:
+            return Response({"error": str(e)}, status=e.status_code, headers=upload_headers(session))
+        except Exception as e:
+            logger.error(f"Error handling upload {upload_id} for prescription {pk}: {str(e)}")
+            return Response(
+                {"error": f"Error processing upload: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
@@ -838,8 +1286,8 @@ def create_prescription(request):
             patient = Patient.objects.get(id=patient_id)
             
             # Check if patient belongs to user's clinic
-            clinic = Clinic.objects.filter(users=request.user).first()
-            if not request.user.is_staff and (not clinic or patient.clinic != clinic):
+            clinic = request.tenant
+            if not request.user.is_staff and (not clinic or patient.clinic_id != clinic.pk):
                 return Response(
                     {"error": "Patient does not belong to your clinic"}, 
                     status=status.HTTP_403_FORBIDDEN
@@ -898,7 +1346,7 @@ def prescription_off_loading(request, pk):
         prescription = get_object_or_404(Prescription, pk=pk)
         
         # Check if user has permission to access this prescription
-        if prescription.clinic != request.user.clinic:
+        if not request.tenant or prescription.patient.clinic_id != request.tenant.pk:
             return Response({'detail': 'Not authorized to access this prescription'}, 
                            status=status.HTTP_403_FORBIDDEN)
         
@@ -950,7 +1398,7 @@ class OffLoadingViewSet(viewsets.ModelViewSet):
                 return OffLoading.objects.all().order_by('-created_at')
             else:
                 # Get prescriptions associated with the user's clinic
-                clinic_prescriptions = Prescription.objects.filter(patient__clinic=user.clinic).values_list('id', flat=True)
+                clinic_prescriptions = Prescription.objects.for_clinic(self.request.tenant).values_list('id', flat=True)
                 return OffLoading.objects.filter(prescription__id__in=clinic_prescriptions).order_by('-created_at')
         except Exception as e:
             logger.error(f"Error retrieving off-loading data: {str(e)}")
@@ -967,7 +1415,7 @@ class OffLoadingViewSet(viewsets.ModelViewSet):
             raise ValidationError({"error": str(e)})
 
 @method_decorator(csrf_exempt, name='dispatch')
-class PrescriptionStatusViewSet(viewsets.ModelViewSet):
+class PrescriptionStatusViewSet(CachedLookupMixin, viewsets.ModelViewSet):
     """
     API endpoint for prescription statuses.
     
@@ -979,7 +1427,7 @@ class PrescriptionStatusViewSet(viewsets.ModelViewSet):
 
 
 @method_decorator(csrf_exempt, name='dispatch')
-class FootTypeViewSet(viewsets.ModelViewSet):
+class FootTypeViewSet(CachedLookupMixin, viewsets.ModelViewSet):
     """
     API endpoint for foot types.
     
@@ -991,7 +1439,7 @@ class FootTypeViewSet(viewsets.ModelViewSet):
 
 
 @method_decorator(csrf_exempt, name='dispatch')
-class WearTimeViewSet(viewsets.ModelViewSet):
+class WearTimeViewSet(CachedLookupMixin, viewsets.ModelViewSet):
     """
     API endpoint for wear times.
     
@@ -1003,7 +1451,7 @@ class WearTimeViewSet(viewsets.ModelViewSet):
 
 
 @method_decorator(csrf_exempt, name='dispatch')
-class ActivityViewSet(viewsets.ModelViewSet):
+class ActivityViewSet(CachedLookupMixin, viewsets.ModelViewSet):
     """
     API endpoint for activity levels.
     
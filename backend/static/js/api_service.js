@@ -311,6 +311,114 @@ const ApiService = {
       );
     },
 
+    /**
+     * Upload a file in resumable chunks
+     *
+     * Progress is remembered in localStorage, so an upload that was cut off
+     * (even by a page reload) continues from the last stored byte.
+     * @param {string} id - The prescription ID
+     * @param {string} target - "left_foot", "right_foot" or "attachment"
+     * @param {File} file - The file to upload
+     * @param {Function} onProgress - Optional callback receiving (sentBytes, totalBytes)
+     * @returns {Promise} - Promise resolving to the finished upload ID
+     */
+    async uploadResumable(id, target, file, onProgress = null) {
+      const chunkSize = 5 * 1024 * 1024;
+      const maxRetries = 5;
+      const baseUrl = `${window.location.origin}/api/prescriptions/${id}/uploads/`;
+      const storageKey = `upload:${id}:${target}:${file.name}:${file.size}:${file.lastModified}`;
+      const headers = {
+        "X-CSRFToken": getCsrfToken(),
+        "X-Requested-With": "XMLHttpRequest",
+      };
+
+      // Resume a previous session for the same file if the server still has it
+      let uploadId = localStorage.getItem(storageKey);
+      let offset = null;
+      if (uploadId) {
+        const response = await fetch(`${baseUrl}${uploadId}/`, {
+          method: "HEAD",
+          headers,
+          credentials: "same-origin",
+        });
+        if (response.ok) {
+          offset = parseInt(response.headers.get("Upload-Offset"), 10);
+        }
+      }
+      if (offset === null) {
+        const session = await ApiService.base.post(`prescriptions/${id}/uploads`, {
+          target,
+          filename: file.name,
+          length: file.size,
+        });
+        uploadId = session.id;
+        offset = 0;
+        localStorage.setItem(storageKey, uploadId);
+      }
+
+      let retries = 0;
+      while (offset < file.size) {
+        try {
+          const response = await fetch(`${baseUrl}${uploadId}/`, {
+            method: "PATCH",
+            headers: {
+              ...headers,
+              "Content-Type": "application/offset+octet-stream",
+              "Upload-Offset": String(offset),
+            },
+            body: file.slice(offset, offset + chunkSize),
+            credentials: "same-origin",
+          });
+          const serverOffset = response.headers.get("Upload-Offset");
+          if (!response.ok && !(response.status === 409 && serverOffset)) {
+            throw new Error(`HTTP error ${response.status}`);
+          }
+          // On success or an offset conflict, continue from the server's offset
+          offset = parseInt(serverOffset, 10);
+          retries = 0;
+          if (onProgress) onProgress(offset, file.size);
+        } catch (error) {
+          if (++retries > maxRetries) throw error;
+          await new Promise((resolve) => setTimeout(resolve, 1000 * retries));
+          const response = await fetch(`${baseUrl}${uploadId}/`, {
+            method: "HEAD",
+            headers,
+            credentials: "same-origin",
+          });
+          if (response.ok) {
+            offset = parseInt(response.headers.get("Upload-Offset"), 10);
+          }
+        }
+      }
+
+      localStorage.removeItem(storageKey);
+      return uploadId;
+    },
+
+    /**
+     * Upload scans for a prescription with resumable uploads
+     * @param {string} id - The prescription ID
+     * @param {Object} files - { left_foot: File, right_foot: File }, either may be omitted
+     * @param {Function} onProgress - Optional callback receiving (sentBytes, totalBytes)
+     * @returns {Promise} - Promise resolving to the created scan
+     */
+    async uploadScansResumable(id, files, onProgress = null) {
+      const fields = Object.keys(files).filter((field) => files[field]);
+      const total = fields.reduce((sum, field) => sum + files[field].size, 0);
+      const data = {};
+      let done = 0;
+      for (const field of fields) {
+        data[`${field}_upload`] = await ApiService.prescriptions.uploadResumable(
+          id,
+          field,
+          files[field],
+          onProgress && ((sent) => onProgress(done + sent, total))
+        );
+        done += files[field].size;
+      }
+      return await ApiService.base.post(`prescriptions/${id}/scans`, data);
+    },
+
     /**
      * Get scans for a prescription
      * @param {string} id - The prescription ID
@@ -320,6 +428,60 @@ const ApiService = {
       return await ApiService.base.get(`prescriptions/${id}/scans`);
     },
 
+    /**
+     * Get the post-processing status of a scan
+     * @param {string} id - The prescription ID
+     * @param {string} scanId - The scan ID
+     * @returns {Promise} - Promise resolving to the scan, including processing_status
+     */
+    async getScanStatus(id, scanId) {
+      return await ApiService.base.get(`prescriptions/${id}/scans/${scanId}/status`);
+    },
+
+    /**
+     * Poll a scan until post-processing has finished
+     * @param {string} id - The prescription ID
+     * @param {string} scanId - The scan ID
+     * @param {number} interval - Milliseconds between polls
+     * @returns {Promise} - Promise resolving to the scan once it is "ready" or "failed"
+     */
+    async waitForScanProcessing(id, scanId, interval = 2000) {
+      for (;;) {
+        const scan = await ApiService.prescriptions.getScanStatus(id, scanId);
+        if (scan.processing_status === "ready" || scan.processing_status === "failed") {
+          return scan;
+        }
+        await new Promise((resolve) => setTimeout(resolve, interval));
+      }
+    },
+
+    /**
+     * Download one level of detail of a scan
+     * @param {string} id - The prescription ID
+     * @param {string} scanId - The scan ID
+     * @param {string} foot - "left" or "right"
+     * @param {string} level - "low", "medium" or "full"
+     * @returns {Promise} - Promise resolving to an ArrayBuffer, or null if the level is not built yet
+     */
+    async getScanLOD(id, scanId, foot, level) {
+      const url = new URL(
+        `${window.location.origin}/api/prescriptions/${id}/scans/${scanId}/lod/${level}/`
+      );
+      url.searchParams.append("foot", foot);
+
+      const response = await fetch(url, {
+        method: "GET",
+        headers: { "X-Requested-With": "XMLHttpRequest" },
+        credentials: "same-origin",
+      });
+
+      if (response.status === 404) return null;
+      if (!response.ok) {
+        throw new Error(`HTTP error ${response.status}`);
+      }
+      return await response.arrayBuffer();
+    },
+
     /**
      * Save clinical measures for a prescription
      * @param {string} id - The prescription ID
@@ -578,6 +740,18 @@ const ApiService = {
       }
     },
 
+    async addAttachmentResumable(prescriptionId, file, filename = file.name) {
+      const uploadId = await ApiService.prescriptions.uploadResumable(
+        prescriptionId,
+        "attachment",
+        file
+      );
+      return await ApiService.base.post(`prescriptions/${prescriptionId}/attachments`, {
+        upload: uploadId,
+        filename,
+      });
+    },
+
     async deleteAttachment(prescriptionId, attachmentId) {
       try {
         const csrfToken = getCsrfToken();
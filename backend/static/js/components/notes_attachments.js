@@ -130,13 +130,9 @@ const NotesAttachmentsModule = {
 
     try {
       const file = files[0]; // Handle one file at a time
-      const formData = new FormData();
-      formData.append("file", file);
-      formData.append("filename", file.name);
-
-      const response = await ApiService.prescriptions.addAttachment(
+      const response = await ApiService.prescriptions.addAttachmentResumable(
         this.prescriptionId,
-        formData
+        file
       );
 
       if (response) {
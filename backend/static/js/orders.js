@@ -3,7 +3,8 @@ function initializeOrdersTable() {
     retrieve: true,
     responsive: true,
     processing: true,
-    serverSide: false,
+    serverSide: true,
+    searchDelay: 400,
     ajax: {
       url: "/api/orders/",
       dataSrc: "data",
@@ -38,6 +39,7 @@ function initializeOrdersTable() {
       },
       {
         data: null,
+        orderable: false,
         render: function (data, type, row) {
           let buttons = `<button class="btn btn-sm btn-primary view-order" data-id="${row.id}">View</button>`;
           if (row.status === "pending") {
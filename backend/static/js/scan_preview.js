@@ -84,6 +84,104 @@ class ScanPreview {
     }
   }
 
+  /**
+   * Decode a mesh in the server's compact LOD format.
+   * @param {ArrayBuffer} buffer - The downloaded LOD file
+   * @returns {Object} - { positions: Float32Array, indices: Uint16Array|Uint32Array }
+   */
+  static decodeLOD(buffer) {
+    const view = new DataView(buffer);
+    const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+    if (magic !== "OLOD" || view.getUint16(4, true) !== 1) {
+      throw new Error("Not a level-of-detail file");
+    }
+    const indexSize = view.getUint16(6, true);
+    const vertexCount = view.getUint32(8, true);
+    const triangleCount = view.getUint32(12, true);
+    const min = [0, 1, 2].map((i) => view.getFloat32(16 + i * 4, true));
+    const max = [0, 1, 2].map((i) => view.getFloat32(28 + i * 4, true));
+
+    // Vertices are quantized to 16 bits inside the bounding box
+    let offset = 40;
+    const quantized = new Uint16Array(buffer, offset, vertexCount * 3);
+    const positions = new Float32Array(vertexCount * 3);
+    for (let i = 0; i < positions.length; i++) {
+      const axis = i % 3;
+      positions[i] = min[axis] + (quantized[i] / 65535) * (max[axis] - min[axis]);
+    }
+
+    // Triangles start 4-byte aligned after the vertices
+    offset += vertexCount * 6;
+    offset += (4 - (offset % 4)) % 4;
+    const IndexArray = indexSize === 2 ? Uint16Array : Uint32Array;
+    const indices = new IndexArray(buffer, offset, triangleCount * 3);
+
+    return { positions, indices };
+  }
+
+  /**
+   * Build a THREE.BufferGeometry from a decoded LOD.
+   * @param {Object} THREE - The three.js module
+   * @param {Object} decoded - The result of decodeLOD
+   */
+  static createLODGeometry(THREE, decoded) {
+    const geometry = new THREE.BufferGeometry();
+    geometry.setAttribute(
+      "position",
+      new THREE.BufferAttribute(decoded.positions, 3)
+    );
+    geometry.setIndex(new THREE.BufferAttribute(decoded.indices, 1));
+    geometry.computeVertexNormals();
+    return geometry;
+  }
+
+  /**
+   * Show a stored scan as quickly as possible.
+   *
+   * The smallest available LOD is downloaded, decoded and handed to
+   * onLevel(decoded, level) first, where decoded is the result of decodeLOD.
+   * The original file is only fetched when the returned loadFull() is called,
+   * and is handed undecoded to onFull(buffer, format) because parsing it
+   * needs the three.js loader for its format (the file_format of the
+   * foot's metadata).
+   * @param {Object} options - { prescriptionId, scan, foot, onLevel, onFull }
+   * @returns {Promise} - Promise resolving to { level, loadFull }
+   */
+  async loadScanProgressively({ prescriptionId, scan, foot, onLevel, onFull }) {
+    const built = new Set(
+      (scan.lods || []).filter((lod) => lod.foot === foot).map((lod) => lod.level)
+    );
+    let shown = null;
+
+    for (const level of ["low", "medium"]) {
+      if (!built.has(level)) continue;
+      const buffer = await ApiService.prescriptions.getScanLOD(
+        prescriptionId, scan.id, foot, level
+      );
+      if (buffer) {
+        onLevel(ScanPreview.decodeLOD(buffer), level);
+        shown = level;
+        break;
+      }
+    }
+
+    const metadata = (scan.metadata || []).find((item) => item.foot === foot);
+    const loadFull = async () => {
+      const buffer = await ApiService.prescriptions.getScanLOD(
+        prescriptionId, scan.id, foot, "full"
+      );
+      if (buffer && onFull) onFull(buffer, metadata ? metadata.file_format : null);
+      return buffer;
+    };
+
+    // Small scans have no decimated levels; the original is the preview
+    if (!shown) {
+      await loadFull();
+      shown = "full";
+    }
+    return { level: shown, loadFull };
+  }
+
   clearFiles() {
     // Clear file inputs
     const leftFootScan = document.getElementById("leftFootScan");
@@ -0,0 +1,16 @@
+"""
+DRF authentication classes for the users app.
+"""
+from rest_framework_simplejwt import authentication
+
+from .models import ClinicUser
+
+
+class JWTAuthentication(authentication.JWTAuthentication):
+    """simplejwt's ``JWTAuthentication``, loading the user together with its clinic."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # simplejwt's get_user looks users up through user_model.objects;
+        # only that lookup changes, its checks stay simplejwt's
+        self.user_model = ClinicUser
@@ -0,0 +1,17 @@
+"""
+Authentication backends for the users app.
+"""
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+
+class ClinicModelBackend(ModelBackend):
+    """``ModelBackend`` that loads session users together with their clinic."""
+
+    def get_user(self, user_id):
+        UserModel = get_user_model()
+        try:
+            user = UserModel._default_manager.select_related('clinic').get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
@@ -119,6 +119,25 @@ class User(AbstractUser):
         super().save(*args, **kwargs)
 
 
+class ClinicUserManager(UserManager):
+    """``UserManager`` that loads users together with their clinic."""
+    use_in_migrations = False
+
+    def get_queryset(self):
+        return super().get_queryset().select_related('clinic')
+
+
+class ClinicUser(User):
+    """
+    A ``User`` whose default manager also loads the clinic, for token
+    authentication (see ``users.authentication``).
+    """
+    objects = ClinicUserManager()
+
+    class Meta:
+        proxy = True
+
+
 class Clinic(models.Model):
     """
     Model for clinic information.
@@ -0,0 +1,8 @@
+"""
+Signal handlers for the users app.
+"""
+from core.caching import track_clinic_changes
+from .models import User
+
+# Clinician names appear in the clinic's prescription lists
+track_clinic_changes(User)
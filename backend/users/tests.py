@@ -1,3 +1,54 @@
 from django.test import TestCase
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+from rest_framework.views import APIView
+from rest_framework_simplejwt.tokens import AccessToken
 
-# Create your tests here.
+from core.benchmarks import create_clinic_user
+from core.tenancy import TenantMiddleware
+from .authentication import JWTAuthentication
+from .models import User
+
+
+class TenantView(APIView):
+    authentication_classes = [JWTAuthentication]
+
+    def get(self, request):
+        return Response({'user': request.user.email, 'clinic': request.tenant.name if request.tenant else None})
+
+
+class JWTTenantTests(TestCase):
+    """
+    Token-authenticated requests load the user and its clinic in one query,
+    so ``request.tenant`` costs nothing more.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.clinic, cls.user = create_clinic_user()
+
+    def get(self, user, queries):
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        with self.assertNumQueries(queries):
+            response = TenantMiddleware(TenantView.as_view())(request)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_tenant_without_an_extra_query(self):
+        self.assertEqual(self.get(self.user, 1), {'user': self.user.email, 'clinic': self.clinic.name})
+
+    def test_user_without_a_clinic(self):
+        user = User.objects.create_user(email='orphan@example.com', password=None, first_name='No', last_name='Clinic')
+        self.assertEqual(self.get(user, 1), {'user': user.email, 'clinic': None})
+
+    def test_authenticated_user_is_a_user(self):
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        user, _ = JWTAuthentication().authenticate(request)
+        self.assertIsInstance(user, User)
+        self.assertEqual(user, self.user)
+
+    def test_inactive_users_are_rejected(self):
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        response = TenantMiddleware(TenantView.as_view())(request)
+        self.assertEqual(response.status_code, 401)
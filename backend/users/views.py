@@ -8,7 +8,6 @@ from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.views import TokenObtainPairView
 from django.contrib.auth import get_user_model, authenticate, login as django_login
 from .serializers import UserSerializer, UserRegistrationSerializer, LoginSerializer
-from .models import Clinic
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 import logging
@@ -69,11 +68,7 @@ class LoginView(views.APIView):
                 django_login(request, user)
                 logger.info(f"User authenticated: {user.email}")
                 
-                # Get clinic info
-                clinic = getattr(user, 'clinic', None)
-                if not clinic:
-                    clinic = Clinic.objects.filter(users=user).first()
-                logger.info(f"User clinic: {clinic}")
+                logger.info(f"User clinic: {user.clinic_id}")
                 
                 refresh = RefreshToken.for_user(user)
                 access_token = str(refresh.access_token)
@@ -87,7 +82,7 @@ class LoginView(views.APIView):
                         'first_name': user.first_name,
                         'last_name': user.last_name,
                         'role': user.role,
-                        'clinic': str(clinic.id) if clinic else None
+                        'clinic': str(user.clinic_id) if user.clinic_id else None
                     }
                 }
                 